@@ -11,7 +11,15 @@ if sys.platform == 'win32':
     sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='replace')
     sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8', errors='replace')
 
+import hashlib
+import json
+import os
+import re
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import requests
+from requests.adapters import HTTPAdapter
 from pathlib import Path
 
 # 設定路徑
@@ -29,46 +37,290 @@ GEOJSON_URLS = [
     'https://raw.githubusercontent.com/g0v/twgeojson/master/json/town/TOWN_MOI_1090415.json',
 ]
 
-def download_geojson():
-    """下載台灣鄉鎮市區界線 GeoJSON 檔案"""
+# 檢查檔頭時最多讀取的位元組數
+HEAD_CHECK_BYTES = 64 * 1024
+CHUNK_SIZE = 256 * 1024
+
+
+class GeoJsonStreamCheck:
+    """
+    串流式 GeoJSON 結構檢查
+    不把整份回應載入記憶體：檢查檔頭是否為 FeatureCollection、計算 Feature 數量，
+    並在結束時確認檔尾是完整的物件
+    """
+    
+    FEATURE_TOKEN = re.compile(rb'"type"\s*:\s*"Feature"')
+    
+    def __init__(self):
+        self.head = b''
+        self.head_ok = None
+        self.features = 0
+        self._tail = b''
+    
+    def feed(self, chunk):
+        """餵入一個區塊，檔頭確定不是 GeoJSON 時回傳 False"""
+        if self.head_ok is None:
+            self.head += chunk
+            if len(self.head) >= HEAD_CHECK_BYTES:
+                self.head_ok = self._check_head()
+        if self.head_ok is False:
+            return False
+        # 保留前一個區塊的尾端，避免 Feature 標記剛好被區塊切斷
+        data = self._tail + chunk
+        self.features += len(self.FEATURE_TOKEN.findall(data))
+        keep = min(len(data), 32)
+        self.features -= len(self.FEATURE_TOKEN.findall(data[-keep:]))
+        self._tail = data[-keep:]
+        return True
+    
+    def _check_head(self):
+        text = self.head[:HEAD_CHECK_BYTES].lstrip(b'\xef\xbb\xbf \t\r\n')
+        if not text.startswith(b'{'):
+            return False
+        return b'"FeatureCollection"' in text and b'"features"' in text
+    
+    def close(self):
+        """串流結束時的最終檢查"""
+        if self.head_ok is None:
+            self.head_ok = self._check_head()
+        # 補回最後保留的尾端
+        self.features += len(self.FEATURE_TOKEN.findall(self._tail))
+        tail = self._tail.rstrip(b' \t\r\n')
+        return bool(self.head_ok) and tail.endswith(b'}') and self.features > 0
+
+
+class _MirrorAdapter(HTTPAdapter):
+    """
+    記錄每條建立的連線，讓其他鏡像勝出時可以從外部中斷
+    關閉 Response 或 Session 不會喚醒正在 recv 的執行緒（等待回應標頭或下一個區塊），
+    abort() 直接對 socket 呼叫 shutdown，阻塞中的讀取會立即以連線錯誤結束
+    """
+    
+    def __init__(self, *args, **kwargs):
+        self._connections = []
+        self._aborted = False
+        self._lock = threading.Lock()
+        super().__init__(*args, **kwargs)
+    
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        adapter = self
+        
+        def tracked(pool_cls):
+            class TrackedPool(pool_cls):
+                def _new_conn(self):
+                    conn = super()._new_conn()
+                    adapter._track(conn)
+                    return conn
+            return TrackedPool
+        
+        self.poolmanager.pool_classes_by_scheme = {
+            scheme: tracked(pool_cls) for scheme, pool_cls in self.poolmanager.pool_classes_by_scheme.items()
+        }
+    
+    def _track(self, conn):
+        with self._lock:
+            if self._aborted:
+                raise requests.exceptions.ConnectionError("其他鏡像已勝出，取消連線")
+            self._connections.append(conn)
+    
+    def abort(self):
+        """中斷所有已建立的連線（尚在連線中的請求最多等到連線逾時）"""
+        with self._lock:
+            self._aborted = True
+            connections = list(self._connections)
+        for conn in connections:
+            sock = getattr(conn, 'sock', None)
+            if sock is None:
+                continue
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+def _mirror_session():
+    session = requests.Session()
+    adapter = _MirrorAdapter(pool_maxsize=1)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session, adapter
+
+
+def _meta_path(output_file):
+    return output_file.with_name(output_file.name + '.meta.json')
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _cached_download_valid(output_file):
+    """檢查本地檔案是否與上次驗證通過時的雜湊一致"""
+    meta_file = _meta_path(output_file)
+    if not output_file.exists() or not meta_file.exists():
+        return None
+    try:
+        meta = json.loads(meta_file.read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return None
+    if meta.get('size') != output_file.stat().st_size:
+        return None
+    if meta.get('sha256') != _file_sha256(output_file):
+        return None
+    return meta
+
+
+def _fetch_mirror(session, url, index, output_file, winner, winner_lock, timeout, headers=None):
+    """
+    從單一鏡像串流下載到自己的暫存檔
+    其他鏡像勝出後中止（由 _MirrorAdapter.abort() 中斷連線，或在下一個區塊檢查到 winner）；
+    自己勝出時原子替換為正式檔案
+    headers 帶有條件式請求標頭時，伺服器回應 304 會回傳 {'url': ..., 'not_modified': True}
+    """
+    part_file = output_file.with_name(f".{output_file.name}.mirror{index}.part")
+    check = GeoJsonStreamCheck()
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        if winner.is_set():
+            return None
+        with session.get(url, headers=headers, stream=True, timeout=timeout) as response:
+            if response.status_code == 304:
+                return {'url': url, 'not_modified': True}
+            if response.status_code != 200:
+                print(f"⚠️  HTTP 狀態碼 {response.status_code}: {url}")
+                return None
+            with open(part_file, 'wb') as f:
+                for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                    if winner.is_set():
+                        return None
+                    if not chunk:
+                        continue
+                    if not check.feed(chunk):
+                        print(f"⚠️  回應不是有效的 GeoJSON 格式: {url}")
+                        return None
+                    f.write(chunk)
+                    digest.update(chunk)
+                    size += len(chunk)
+            
+            if not check.close():
+                print(f"⚠️  GeoJSON 結構不完整: {url}")
+                return None
+            
+            with winner_lock:
+                if winner.is_set():
+                    return None
+                os.replace(part_file, output_file)
+                winner.set()
+            
+            meta = {
+                'url': url,
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+                'sha256': digest.hexdigest(),
+                'size': size,
+                'features': check.features,
+            }
+            _meta_path(output_file).write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding='utf-8')
+            return meta
+    except requests.exceptions.RequestException as e:
+        if not winner.is_set():
+            print(f"⚠️  下載失敗: {url} ({e})")
+        return None
+    finally:
+        if part_file.exists():
+            part_file.unlink()
+
+
+def _revalidate(session, meta, output_file, timeout):
+    """
+    以上次記錄的 ETag / Last-Modified 向原來源發出條件式請求
+    回傳 304 時的 {'not_modified': True}、來源有新版本時下載後的驗證資訊，
+    沒有驗證碼或無法連線時回傳 None
+    """
+    headers = {}
+    if meta.get('etag'):
+        headers['If-None-Match'] = meta['etag']
+    if meta.get('last_modified'):
+        headers['If-Modified-Since'] = meta['last_modified']
+    if not headers or not meta.get('url'):
+        return None
+    return _fetch_mirror(session, meta['url'], 0, output_file, threading.Event(), threading.Lock(),
+                         timeout, headers=headers)
+
+
+def download_geojson(force=False, timeout=30):
+    """
+    下載台灣鄉鎮市區界線 GeoJSON 檔案
+    
+    同時向所有鏡像發出請求，第一個通過串流結構檢查的回應直接寫入磁碟，
+    其餘鏡像隨即中止；驗證資訊（雜湊、ETag）記錄在旁邊的 .meta.json。
+    重新執行時若本地檔案未變動，只以 If-None-Match / If-Modified-Since 向原來源確認：
+    304 表示仍為最新版本，200 則直接下載新版本
+    """
     output_file = STATIC_DATA_DIR / "TOWN_MOI_1090415.json"
     
     print("正在下載台灣鄉鎮市區界線 GeoJSON 檔案...")
     print(f"目標檔案: {output_file}")
     
+    if not force:
+        meta = _cached_download_valid(output_file)
+        if meta:
+            with requests.Session() as session:
+                result = _revalidate(session, meta, output_file, timeout)
+            if result is None:
+                if meta.get('etag') or meta.get('last_modified'):
+                    print("⚠️  無法向來源確認是否有更新，沿用本地檔案")
+                print(f"✅ 本地檔案已通過驗證（{meta.get('features')} 個行政區），略過下載")
+                print("   如需重新下載請加上 --force")
+                return True
+            if result.get('not_modified'):
+                print(f"✅ 來源回應 304，本地檔案為最新版本（{meta.get('features')} 個行政區），略過下載")
+                return True
+            print(f"\n✅ 來源已更新，已下載新版本: {result['url']}")
+            print(f"檔案大小: {result['size'] / 1024 / 1024:.2f} MB")
+            print(f"包含 {result['features']} 個行政區")
+            return True
+    
+    winner = threading.Event()
+    winner_lock = threading.Lock()
+    
+    print(f"\n同時嘗試 {len(GEOJSON_URLS)} 個來源:")
     for url in GEOJSON_URLS:
-        try:
-            print(f"\n嘗試從以下網址下載: {url}")
-            response = requests.get(url, timeout=30)
-            
-            if response.status_code == 200:
-                # 檢查是否為有效的 JSON
-                try:
-                    data = response.json()
-                    if 'features' in data or 'type' in data:
-                        # 儲存檔案
-                        output_file.write_text(response.text, encoding='utf-8')
-                        print(f"✅ 下載成功！")
-                        print(f"檔案已儲存至: {output_file}")
-                        print(f"檔案大小: {len(response.content) / 1024 / 1024:.2f} MB")
-                        
-                        # 顯示一些統計資訊
-                        if 'features' in data:
-                            print(f"包含 {len(data['features'])} 個行政區")
-                            if len(data['features']) > 0:
-                                print(f"第一個行政區的屬性: {list(data['features'][0].get('properties', {}).keys())}")
-                        
-                        return True
-                    else:
-                        print("⚠️  回應不是有效的 GeoJSON 格式")
-                except ValueError as e:
-                    print(f"⚠️  JSON 解析失敗: {e}")
-            else:
-                print(f"⚠️  HTTP 狀態碼: {response.status_code}")
-                
-        except requests.exceptions.RequestException as e:
-            print(f"⚠️  下載失敗: {e}")
-            continue
+        print(f"  - {url}")
+    
+    result = None
+    # 每個鏡像使用自己的 Session，勝出後才能只中斷其他鏡像的連線
+    mirrors = [_mirror_session() for _ in GEOJSON_URLS]
+    with ThreadPoolExecutor(max_workers=len(GEOJSON_URLS)) as executor:
+        futures = [
+            executor.submit(_fetch_mirror, session, url, i, output_file, winner, winner_lock, timeout)
+            for i, ((session, _), url) in enumerate(zip(mirrors, GEOJSON_URLS))
+        ]
+        for future in as_completed(futures):
+            meta = future.result()
+            if meta:
+                result = meta
+                break
+        # 中斷落後鏡像的連線：正在等待回應標頭或區塊的讀取立即結束並刪除暫存檔，
+        # 離開 with 區塊時的等待只需片刻，不會拖到逾時
+        winner.set()
+        for _, adapter in mirrors:
+            adapter.abort()
+    for session, _ in mirrors:
+        session.close()
+    
+    if result:
+        print(f"\n✅ 下載成功！來源: {result['url']}")
+        print(f"檔案已儲存至: {output_file}")
+        print(f"檔案大小: {result['size'] / 1024 / 1024:.2f} MB")
+        print(f"包含 {result['features']} 個行政區")
+        return True
     
     print("\n❌ 所有下載來源都失敗了")
     print("\n請手動下載：")
@@ -78,6 +330,6 @@ def download_geojson():
     return False
 
 if __name__ == "__main__":
-    success = download_geojson()
+    success = download_geojson(force='--force' in sys.argv)
     sys.exit(0 if success else 1)
 
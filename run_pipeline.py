@@ -0,0 +1,329 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+登革熱資料處理流程管理器
+下載 → 清理 → 分析 → 靜態網站，以及獨立的幾何資料步驟
+
+每個步驟記錄輸入與輸出的內容雜湊（data/processed/pipeline_state.json），
+輸入沒有實際變化的步驟會被略過，因此疾管署沒有發布新資料時整個流程幾乎不做事。
+彼此獨立的步驟（例如幾何資料與清理/分析）會平行執行。
+
+使用方式:
+    python run_pipeline.py                 # 執行所有需要更新的步驟
+    python run_pipeline.py --skip-download # 不連網，只處理本地資料
+    python run_pipeline.py --force analyze # 強制重跑指定步驟（及其下游）
+"""
+
+import sys
+import io
+if sys.platform == 'win32':
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='replace')
+    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8', errors='replace')
+
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime
+from pathlib import Path
+
+# 設定路徑
+BASE_DIR = Path(__file__).parent
+sys.path.insert(0, str(BASE_DIR / "src"))
+
+RAW_DATA = BASE_DIR / "data" / "raw" / "Dengue_Daily.csv"
+PROCESSED_DIR = BASE_DIR / "data" / "processed"
+CLEAN_DIR = PROCESSED_DIR / "clean"
+ANALYSIS_FILE = PROCESSED_DIR / "dengue_analysis.json"
+POPULATION_FILE = BASE_DIR / "data" / "raw" / "population.csv"
+# 分析步驟使用的模組（任一模組變更時重新分析）
+ANALYSIS_MODULES = [BASE_DIR / "src" / name for name in (
+    "analyze_dengue.py", "case_codes.py", "timeseries.py", "aberration.py", "nowcast.py", "flows.py", "villages.py",
+    "serotype.py", "serotype_metrics.py", "population.py", "pyramid.py",
+    "prefix_sums.py", "models/forecast.py",
+    "publish.py",
+)]
+STATE_FILE = PROCESSED_DIR / "pipeline_state.json"
+WEBSITE_DIR = BASE_DIR / "website"
+DOCS_DIR = BASE_DIR / "docs"
+
+# 疾管署開放資料：登革熱每日確定病例統計
+DEFAULT_DATA_URL = os.environ.get('DENGUE_DATA_URL', 'https://od.cdc.gov.tw/eic/Dengue_Daily.csv')
+
+
+# ---------------------------------------------------------------------------
+# 各步驟的實際工作（頂層函數，才能交給子行程執行）
+# ---------------------------------------------------------------------------
+
+def stage_download(options):
+    from download_dengue_data import download_from_url
+    filepath = download_from_url(options['url'], filename=RAW_DATA.name, data_dir=RAW_DATA.parent)
+    if filepath is None:
+        if RAW_DATA.exists():
+            print("[警告] 下載失敗，沿用現有的原始資料")
+            return
+        raise RuntimeError("下載失敗且沒有現有的原始資料")
+
+
+def stage_clean(options):
+    from analyze_dengue import load_and_clean_data, save_clean_data
+    save_clean_data(load_and_clean_data())
+
+
+def stage_analyze(options):
+    from analyze_dengue import load_clean_data, main as analyze_main
+    analyze_main(load_clean_data())
+
+
+def stage_geometry(options):
+    from geometry import GEOJSON_FILE, SHP_FILE, build_township_geometry
+    if not SHP_FILE.exists() and not GEOJSON_FILE.exists():
+        # 全新的工作目錄可能還沒有界線檔，只有時空掃描等選用分析需要中心點，不中斷整個流程
+        print(f"[警告] 找不到鄉鎮界線 SHP 或 GeoJSON（{GEOJSON_FILE}），略過幾何資料步驟")
+        return
+    build_township_geometry()
+
+
+def stage_static(options):
+    subprocess.run([sys.executable, str(BASE_DIR / "build_static_site.py")], check=True, cwd=str(BASE_DIR))
+
+
+def _analysis_outputs():
+    """
+    分析步驟的輸出：dengue_analysis.json、manifest.json 與 manifest 指向的版本目錄
+    版本目錄或 manifest 被刪除、損毀時雜湊不同，步驟會重新執行
+    """
+    from publish import MANIFEST_FILE, read_manifest
+    outputs = [ANALYSIS_FILE, MANIFEST_FILE]
+    manifest = read_manifest()
+    if manifest and manifest.get('path'):
+        outputs.append(PROCESSED_DIR / manifest['path'])
+    return outputs
+
+
+def _geometry_inputs():
+    from geometry import SHP_FILE, SHP_SIDECARS, GEOJSON_FILE
+    # 只有 .shp 本身存在時才會轉換，此時以 SHP 及其附屬檔作為輸入；
+    # 否則（例如只有 .dbf、.shx 等附屬檔）以現有的 GeoJSON 作為輸入
+    if SHP_FILE.exists():
+        return [path for path in SHP_SIDECARS if path.exists()]
+    return [GEOJSON_FILE]
+
+
+def _geometry_outputs():
+    from geometry import GEOJSON_FILE, CENTROIDS_FILE
+    return [GEOJSON_FILE, CENTROIDS_FILE]
+
+
+# 步驟定義：deps 為上游步驟，inputs/outputs 為用來計算雜湊的檔案或目錄
+STAGES = {
+    'download': {
+        'deps': [],
+        'inputs': lambda: [],
+        'outputs': lambda: [RAW_DATA],
+        'run': stage_download,
+        # 遠端資料沒有本地輸入可比對，每次都執行（條件式下載，未變更時只需一次 304）
+        'always': True,
+    },
+    'clean': {
+        'deps': ['download'],
+        # 清理時套用 case_codes 的縣市合併與名稱統一規則，規則變更時必須重新清理
+        'inputs': lambda: [RAW_DATA, BASE_DIR / "src" / "analyze_dengue.py", BASE_DIR / "src" / "case_codes.py"],
+        'outputs': lambda: [CLEAN_DIR],
+        'run': stage_clean,
+    },
+    'analyze': {
+        'deps': ['clean'],
+        'inputs': lambda: [CLEAN_DIR] + ANALYSIS_MODULES + [path for path in [POPULATION_FILE] if path.exists()],
+        'outputs': _analysis_outputs,
+        'run': stage_analyze,
+    },
+    'geometry': {
+        'deps': [],
+        'inputs': _geometry_inputs,
+        'outputs': _geometry_outputs,
+        'run': stage_geometry,
+    },
+    'static': {
+        'deps': ['analyze'],
+        'inputs': lambda: [ANALYSIS_FILE, WEBSITE_DIR / "templates", WEBSITE_DIR / "static" / "js",
+                           WEBSITE_DIR / "static" / "css", BASE_DIR / "build_static_site.py"],
+        'outputs': lambda: [DOCS_DIR],
+        'run': stage_static,
+    },
+}
+
+
+# ---------------------------------------------------------------------------
+# 內容雜湊
+# ---------------------------------------------------------------------------
+
+def _file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def content_hash(path):
+    """檔案回傳其內容雜湊；目錄回傳所有檔案（相對路徑 + 內容雜湊）的組合雜湊；不存在回傳 None"""
+    path = Path(path)
+    if path.is_file():
+        return _file_hash(path)
+    if path.is_dir():
+        digest = hashlib.sha256()
+        for child in sorted(p for p in path.rglob('*') if p.is_file() and not p.name.endswith('.tmp')):
+            digest.update(child.relative_to(path).as_posix().encode('utf-8'))
+            digest.update(_file_hash(child).encode('ascii'))
+        return digest.hexdigest()
+    return None
+
+
+def hash_paths(paths):
+    return {str(Path(path).relative_to(BASE_DIR).as_posix()): content_hash(path) for path in paths}
+
+
+def load_state():
+    if STATE_FILE.exists():
+        try:
+            with open(STATE_FILE, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            pass
+    return {}
+
+
+def save_state(state):
+    STATE_FILE.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = STATE_FILE.with_name(STATE_FILE.name + '.tmp')
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_file, STATE_FILE)
+
+
+# ---------------------------------------------------------------------------
+# 排程
+# ---------------------------------------------------------------------------
+
+def _downstream(names):
+    """回傳指定步驟及其所有下游步驟"""
+    result = set(names)
+    changed = True
+    while changed:
+        changed = False
+        for name, stage in STAGES.items():
+            if name not in result and any(dep in result for dep in stage['deps']):
+                result.add(name)
+                changed = True
+    return result
+
+
+def needs_run(name, state, forced):
+    """判斷步驟是否需要執行，回傳 (是否執行, 原因, 目前的輸入雜湊)"""
+    stage = STAGES[name]
+    inputs = hash_paths(stage['inputs']())
+    record = state.get(name)
+    if name in forced:
+        return True, "強制執行", inputs
+    if stage.get('always'):
+        return True, "每次執行", inputs
+    if record is None:
+        return True, "尚無紀錄", inputs
+    if record.get('inputs') != inputs:
+        return True, "輸入已變更", inputs
+    if record.get('outputs') != hash_paths(stage['outputs']()):
+        return True, "輸出遺失或被修改", inputs
+    return False, "輸入未變更", inputs
+
+
+def run_pipeline(skip=(), force=(), url=DEFAULT_DATA_URL, max_workers=2):
+    """依相依關係執行各步驟，彼此獨立的步驟平行執行"""
+    state = load_state()
+    forced = _downstream(force)
+    options = {'url': url}
+
+    pending = {name for name in STAGES if name not in skip}
+    finished = set(skip)
+    failed = set()
+    running = {}
+    summary = {name: "略過（未啟用）" for name in skip}
+
+    print("=" * 60)
+    print("登革熱資料處理流程")
+    print("=" * 60)
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        while pending or running:
+            # 提交所有上游已完成的步驟
+            for name in sorted(pending):
+                deps = STAGES[name]['deps']
+                if any(dep in failed for dep in deps):
+                    pending.discard(name)
+                    failed.add(name)
+                    summary[name] = "上游失敗，略過"
+                    continue
+                if not all(dep in finished for dep in deps):
+                    continue
+                pending.discard(name)
+                run, reason, inputs = needs_run(name, state, forced)
+                if not run:
+                    finished.add(name)
+                    summary[name] = f"略過（{reason}）"
+                    print(f"[略過] {name}: {reason}")
+                    continue
+                print(f"[執行] {name}: {reason}")
+                future = executor.submit(STAGES[name]['run'], options)
+                running[future] = (name, inputs, time.perf_counter())
+
+            if not running:
+                continue
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name, inputs, started = running.pop(future)
+                elapsed = time.perf_counter() - started
+                try:
+                    future.result()
+                except Exception as e:
+                    failed.add(name)
+                    summary[name] = f"失敗: {e}"
+                    print(f"[失敗] {name}: {e}")
+                    continue
+                state[name] = {
+                    'inputs': inputs,
+                    'outputs': hash_paths(STAGES[name]['outputs']()),
+                    'finished_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                    'seconds': round(elapsed, 2),
+                }
+                save_state(state)
+                finished.add(name)
+                summary[name] = f"完成（{elapsed:.1f} 秒）"
+                print(f"[完成] {name}（{elapsed:.1f} 秒）")
+
+    print("\n" + "=" * 60)
+    for name in STAGES:
+        print(f"  {name:<10} {summary.get(name, '未執行')}")
+    print("=" * 60)
+    return not failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="登革熱資料處理流程")
+    parser.add_argument('--skip-download', action='store_true', help="不連網下載，只處理本地資料")
+    parser.add_argument('--force', nargs='*', default=[], choices=list(STAGES),
+                        help="強制重跑指定步驟及其下游")
+    parser.add_argument('--url', default=DEFAULT_DATA_URL, help="病例資料下載網址")
+    parser.add_argument('--workers', type=int, default=2, help="平行執行的步驟數")
+    args = parser.parse_args()
+
+    skip = {'download'} if args.skip_download else set()
+    success = run_pipeline(skip=skip, force=args.force, url=args.url, max_workers=args.workers)
+    sys.exit(0 if success else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -13,15 +13,31 @@ if sys.platform == 'win32':
 
 import pandas as pd
 import json
+import os
 from pathlib import Path
 from datetime import datetime
 import numpy as np
 
+from publish import publish_analysis
+from case_codes import COUNTY_MERGERS, encode_cases
+from timeseries import build_daily_cube, calendar_bins, summarize_cube, timeseries_writer
+from aberration import alerts_writer, detect_aberrations, summarize_alerts
+from nowcast import nowcast_writer, run_nowcast
+from flows import build_flows, flows_writer, summarize_flows
+from villages import build_village_counts, villages_writer
+from serotype import build_serotype_counts, serotype_writer, summarize_serotypes
+from population import apply_incidence_rates
+from pyramid import build_pyramid, pyramid_writer
+from prefix_sums import build_prefix_sums, prefix_writer
+from models.forecast import forecast_writer, run_forecast
+
 # 設定路徑
 DATA_DIR = Path(__file__).parent.parent / "data"
 RAW_DATA = DATA_DIR / "raw" / "Dengue_Daily.csv"
 PROCESSED_DIR = DATA_DIR / "processed"
 PROCESSED_DIR.mkdir(parents=True, exist_ok=True)
+# 清理後的病例資料，依發病年分割為 year=YYYY.csv
+CLEAN_DIR = PROCESSED_DIR / "clean"
 
 
 def normalize_county_names(df):
@@ -32,13 +48,7 @@ def normalize_county_names(df):
     df['居住縣市'] = df['居住縣市'].astype(str).str.replace('台', '臺', regex=False)
     
     # 應用縣市合併規則（2010年合併）
-    county_merger_map = {
-        '臺中縣': '臺中市',
-        '臺南縣': '臺南市',
-        '高雄縣': '高雄市',
-        '臺北縣': '新北市',
-    }
-    df['居住縣市'] = df['居住縣市'].replace(county_merger_map)
+    df['居住縣市'] = df['居住縣市'].replace(COUNTY_MERGERS)
     
     # 統計統一後的縣市
     county_counts = df['居住縣市'].value_counts()
@@ -87,6 +97,55 @@ def load_and_clean_data():
     return df
 
 
+def save_clean_data(df):
+    """
+    將清理後的病例資料依發病年分割儲存
+    每個分割先寫入暫存檔再原子替換，同樣的輸入會產生位元組相同的檔案
+    """
+    CLEAN_DIR.mkdir(parents=True, exist_ok=True)
+    columns = [col for col in df.columns if col not in ('發病日期', '發病年', '發病月', '發病年月')]
+    
+    out = df[columns].copy()
+    out.insert(0, '發病日期', df['發病日期'].dt.strftime('%Y-%m-%d'))
+    
+    written = set()
+    for year, part in out.groupby(df['發病年']):
+        path = CLEAN_DIR / f"year={int(year)}.csv"
+        tmp_path = path.with_name(path.name + '.tmp')
+        part.to_csv(tmp_path, index=False, encoding='utf-8')
+        os.replace(tmp_path, path)
+        written.add(path.name)
+    
+    # 移除已不存在年份的舊分割
+    for path in CLEAN_DIR.glob('year=*.csv'):
+        if path.name not in written:
+            path.unlink()
+    
+    print(f"清理後資料已儲存至: {CLEAN_DIR}（{len(written)} 個年度分割）")
+    return CLEAN_DIR
+
+
+def load_clean_data(years=None):
+    """讀取清理後的病例資料（可只讀取指定年份的分割）"""
+    paths = sorted(CLEAN_DIR.glob('year=*.csv'))
+    if years is not None:
+        wanted = {f"year={int(year)}.csv" for year in years}
+        paths = [path for path in paths if path.name in wanted]
+    if not paths:
+        raise FileNotFoundError(f"找不到清理後資料，請先執行清理步驟: {CLEAN_DIR}")
+    
+    df = pd.concat(
+        (pd.read_csv(path, encoding='utf-8', low_memory=False, dtype=str, keep_default_na=False, na_values=[''])
+         for path in paths),
+        ignore_index=True
+    )
+    df['發病日期'] = pd.to_datetime(df['發病日期'], format='%Y-%m-%d')
+    df['發病年'] = df['發病日期'].dt.year
+    df['發病月'] = df['發病日期'].dt.month
+    df['發病年月'] = df['發病日期'].dt.to_period('M')
+    return df
+
+
 def analyze_time_trend(df):
     """時間分析：年度、月度趨勢"""
     print("\n=== 時間分析 ===")
@@ -252,14 +311,15 @@ def generate_summary_stats(df):
     }
 
 
-def main():
-    """主函數"""
+def main(df=None):
+    """主函數（可傳入已清理的資料，例如由流程管理器從清理後的分割讀取）"""
     print("=" * 50)
     print("登革熱病例基礎流行病學分析")
     print("=" * 50)
     
     # 載入資料
-    df = load_and_clean_data()
+    if df is None:
+        df = load_and_clean_data()
     
     # 執行分析
     time_analysis = analyze_time_trend(df)
@@ -267,19 +327,75 @@ def main():
     person_analysis = analyze_person(df)
     summary = generate_summary_stats(df)
     
+    # 每十萬人發生率（有 data/raw/population.csv 時）
+    apply_incidence_rates(location_analysis, person_analysis,
+                          (int(df['發病年'].min()), int(df['發病年'].max())))
+    
+    # 鄉鎮 × 日 時間序列立方體（一次編碼，之後的計數表都在整數代碼上計算）
+    print("\n=== 時間序列立方體 ===")
+    codes = encode_cases(df)
+    cube = build_daily_cube(codes)
+    bins = calendar_bins(codes['tables']['start_date'], codes['tables']['n_days'])
+    
+    # 疫情異常偵測（EARS C1/C2/C3 與 Farrington）
+    print("\n=== 異常偵測 ===")
+    alerts = detect_aberrations(cube, bins['week_index'])
+    
+    # 通報延遲與近期病例數即時推估
+    print("\n=== 即時推估 ===")
+    nowcast_summary, nowcast_arrays = run_nowcast(df, codes, bins)
+    
+    # 各鄉鎮未來 4 週病例數預測（所有鄉鎮批次配適）
+    print("\n=== 病例數預測 ===")
+    forecast_summary, forecast_arrays = run_forecast(cube, codes, bins)
+    
+    # 感染地 → 居住地 流向
+    print("\n=== 感染地流向 ===")
+    flows, origins = build_flows(df, codes)
+    
+    # 血清型（在同一組整數代碼上計數）
+    print("\n=== 血清型 ===")
+    sero_yearly, sero_weekly, sero_years = build_serotype_counts(codes, bins)
+    
+    # 鄉鎮 × 年 × 性別 × 年齡層
+    pyramid = build_pyramid(codes, bins)
+    
+    # 逐日累積和（任意日期區間查詢）
+    prefix = build_prefix_sums(codes, cube)
+    
+    # 村里層級（稀疏儲存，由網站依需求查詢單一鄉鎮）
+    village_counts, village_names = build_village_counts(df, codes)
+    
+    artifacts = {
+        'timeseries.npz': timeseries_writer(codes, cube, bins),
+        'alerts.npz': alerts_writer(alerts),
+        'nowcast.npz': nowcast_writer(nowcast_arrays, codes['tables']),
+        'flows.npz': flows_writer(flows, origins, codes['tables']),
+        'villages.npz': villages_writer(village_counts, village_names, codes['tables']),
+        'serotype.npz': serotype_writer(sero_weekly, codes['tables'], bins),
+        'pyramid.npz': pyramid_writer(pyramid, codes['tables'], bins),
+        'prefix_sums.npz': prefix_writer(prefix, codes['tables']),
+        'forecast.npz': forecast_writer(forecast_arrays, codes['tables'], forecast_summary),
+    }
+    
     # 組合所有分析結果
     results = {
         'summary': summary,
         'time': time_analysis,
         'location': location_analysis,
         'person': person_analysis,
+        'timeseries': summarize_cube(codes, cube),
+        'alerts': summarize_alerts(alerts, codes['tables']),
+        'nowcast': nowcast_summary,
+        'forecast': forecast_summary,
+        'flows': summarize_flows(flows, origins, codes['tables']),
+        'serotype': summarize_serotypes(sero_yearly, sero_weekly, sero_years, bins['week_labels'], codes['tables']),
         'last_updated': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     }
     
-    # 儲存為 JSON
+    # 發布為新的資料版本（寫入版本目錄後原子切換，網站不會讀到寫到一半的檔案）
     output_file = PROCESSED_DIR / "dengue_analysis.json"
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(results, f, ensure_ascii=False, indent=2)
+    publish_analysis(results, artifacts)
     
     print(f"\n分析完成！結果已儲存至: {output_file}")
     
@@ -0,0 +1,133 @@
+"""
+病例資料的整數編碼
+把清理後的病例表一次轉換為整數代碼陣列（日序號、鄉鎮代碼、縣市代碼…），
+之後所有計數表都以 np.bincount 在這些陣列上計算，不必對 DataFrame 反覆 groupby
+"""
+
+import re
+
+import numpy as np
+import pandas as pd
+
+# 直轄市的行政區一律為「區」，縣市合併前的「市/鎮/鄉」名稱需統一
+MUNICIPALITIES = {'臺北市', '新北市', '桃園市', '臺中市', '臺南市', '高雄市'}
+
+# 2010 年縣市合併
+COUNTY_MERGERS = {
+    '臺中縣': '臺中市',
+    '臺南縣': '臺南市',
+    '高雄縣': '高雄市',
+    '臺北縣': '新北市',
+}
+
+
+# 血清型代碼：0-3 為第一至第四型，4 為未分型（含空值與無法辨識的值）
+SEROTYPES = ('第一型', '第二型', '第三型', '第四型', '未分型')
+
+
+# 性別與年齡層代碼（年齡層與網站顯示一致：0-4 合併單一歲數，70 歲以上合併為 70+）
+SEXES = ('男', '女', '未知')
+AGE_BANDS = ('0-4', '5-9', '10-14', '15-19', '20-24', '25-29', '30-34', '35-39',
+             '40-44', '45-49', '50-54', '55-59', '60-64', '65-69', '70+', '未知')
+
+
+def canonical_county(name):
+    """統一縣市名稱為「臺」字寫法"""
+    return str(name).replace('台', '臺')
+
+
+def canonical_township_names(counties, townships):
+    """直轄市中舊的「鳳山市」「新營市」等名稱統一為「鳳山區」「新營區」"""
+    counties = pd.Series(counties, dtype=object).astype(str).str.replace('台', '臺', regex=False)
+    townships = pd.Series(townships, dtype=object).fillna('未知').astype(str).str.replace('台', '臺', regex=False)
+    in_municipality = counties.isin(MUNICIPALITIES).to_numpy()
+    old_suffix = townships.str.len().gt(2).to_numpy() & townships.str[-1].isin(['市', '鎮', '鄉']).to_numpy()
+    mask = in_municipality & old_suffix
+    townships = townships.to_numpy(dtype=object)
+    townships[mask] = [name[:-1] + '區' for name in townships[mask]]
+    return counties.to_numpy(dtype=object), townships
+
+
+def township_key(county, township):
+    """鄉鎮的標準鍵值「縣市|鄉鎮」，與人口資料、幾何資料對應時使用"""
+    counties, townships = canonical_township_names([county], [township])
+    return f"{counties[0]}|{townships[0]}"
+
+
+def encode_serotypes(values):
+    """血清型字串轉為代碼（對應 SEROTYPES）"""
+    return _encode_labels(values, SEROTYPES)
+
+
+def age_band(label):
+    """年齡層標籤統一為五歲組（單一歲數歸入所屬組，70 歲以上為 70+），無法辨識時原樣回傳"""
+    label = str(label).strip()
+    match = re.match(r'^(\d+)', label)
+    if not match:
+        return label
+    start = int(match.group(1))
+    if label.isdigit():
+        start = start // 5 * 5
+    return '70+' if start >= 70 else f"{start}-{start + 4}"
+
+
+def _encode_labels(values, labels, normalize=None):
+    """字串轉為 labels 中的代碼，不在列表中的值歸為最後一個（未知）"""
+    values = pd.Series(values, dtype=object).fillna(labels[-1]).astype(str).str.strip()
+    unique = values.unique()
+    normalized = [normalize(value) if normalize else value for value in unique]
+    lookup = {name: i for i, name in enumerate(labels)}
+    mapping = {value: lookup.get(name, len(labels) - 1) for value, name in zip(unique, normalized)}
+    return values.map(mapping).to_numpy(dtype=np.int8)
+
+
+def compact_dtype(max_value):
+    """依最大值選擇最小的無號整數型別"""
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if max_value <= np.iinfo(dtype).max:
+            return dtype
+    return np.uint64
+
+
+def encode_cases(df):
+    """
+    將清理後的病例表編碼為整數陣列
+
+    回傳 dict：
+      day        - 發病日距 start_date 的天數
+      township   - 鄉鎮代碼（對應 tables['townships']）
+      county     - 縣市代碼（對應 tables['counties']）
+      serotype   - 血清型代碼（對應 SEROTYPES）
+      sex, age   - 性別、年齡層代碼（對應 SEXES、AGE_BANDS）
+      tables     - 代碼表與日期範圍
+    """
+    dates = df['發病日期'].to_numpy(dtype='datetime64[D]')
+    start = np.datetime64(f"{int(df['發病年'].min())}-01-01", 'D')
+    end = np.datetime64(f"{int(df['發病年'].max())}-12-31", 'D')
+    day = (dates - start).astype(np.int32)
+
+    counties, townships = canonical_township_names(df['居住縣市'], df['居住鄉鎮'])
+    keys = pd.Series(counties) + '|' + pd.Series(townships)
+    township_codes, township_keys = pd.factorize(keys, sort=True)
+    county_codes, county_names = pd.factorize(pd.Series(counties), sort=True)
+
+    county_index = {name: i for i, name in enumerate(county_names)}
+    township_list = [key.split('|', 1) for key in township_keys]
+    township_county = np.array([county_index[county] for county, _ in township_list], dtype=np.int32)
+
+    return {
+        'day': day,
+        'township': township_codes.astype(np.int32),
+        'county': county_codes.astype(np.int32),
+        'sex': _encode_labels(df['性別'], SEXES),
+        'age': _encode_labels(df['年齡層'], AGE_BANDS, age_band),
+        'serotype': encode_serotypes(df['血清型']) if '血清型' in df.columns else
+                    np.full(len(day), len(SEROTYPES) - 1, dtype=np.int8),
+        'tables': {
+            'start_date': str(start),
+            'n_days': int((end - start).astype(int)) + 1,
+            'counties': list(county_names),
+            'townships': township_list,
+            'township_county': township_county,
+        },
+    }
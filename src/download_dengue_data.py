@@ -12,18 +12,50 @@ if sys.platform == 'win32':
     sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8', errors='replace')
 
 import requests
-import pandas as pd
+from requests.adapters import HTTPAdapter
+import csv
+import hashlib
 import json
+import os
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
 from pathlib import Path
 from datetime import datetime
+from urllib.parse import urlparse
 import time
 
 # 設定資料儲存路徑
 DATA_DIR = Path(__file__).parent.parent / "data" / "raw"
 DATA_DIR.mkdir(parents=True, exist_ok=True)
 
+# 記錄 ETag / Last-Modified 等驗證資訊的快取檔
+DOWNLOAD_CACHE_NAME = ".download_cache.json"
 
-def download_from_data_gov_tw():
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+}
+
+# 平行下載時多個執行緒會同時更新下載快取
+_CACHE_LOCK = threading.Lock()
+
+
+def create_session(pool_size=16):
+    """建立共用連線池的 Session，讓多個下載重複使用 TCP/TLS 連線"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers.update(DEFAULT_HEADERS)
+    return session
+
+
+def _backoff_delay(attempt, base=0.5, cap=10.0):
+    """指數退避加上隨機抖動（full jitter），避免多個重試同時打向伺服器"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def download_from_data_gov_tw(session=None, timeout=15):
     """
     從政府資料開放平台 (data.gov.tw) 下載登革熱資料
     """
@@ -36,34 +68,35 @@ def download_from_data_gov_tw():
     ]
     
     datasets = []
+    params = {
+        "q": "登革熱",
+        "page": 1,
+        "pageSize": 20
+    }
     
-    for search_url in api_endpoints:
+    def probe(search_url):
         try:
-            params = {
-                "q": "登革熱",
-                "page": 1,
-                "pageSize": 20
-            }
-            
-            response = requests.get(search_url, params=params, timeout=30, headers={
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-            })
-            
-            if response.status_code == 200:
-                try:
-                    data = response.json()
-                    if isinstance(data, dict) and 'data' in data:
-                        datasets = data.get('data', [])
-                    elif isinstance(data, list):
-                        datasets = data
-                    
-                    if datasets:
-                        print(f"[成功] 找到 {len(datasets)} 個相關資料集")
-                        break
-                except json.JSONDecodeError:
-                    continue
-        except Exception as e:
-            continue
+            response = http.get(search_url, params=params, timeout=timeout)
+            if response.status_code != 200:
+                return []
+            data = response.json()
+        except (requests.exceptions.RequestException, ValueError):
+            return []
+        if isinstance(data, dict) and 'data' in data:
+            return data.get('data', []) or []
+        elif isinstance(data, list):
+            return data
+        return []
+    
+    # 同時查詢所有端點，依清單順序採用第一個有結果的端點
+    http = session or create_session(pool_size=len(api_endpoints))
+    with ThreadPoolExecutor(max_workers=len(api_endpoints)) as executor:
+        futures = [executor.submit(probe, url) for url in api_endpoints]
+        for future in futures:
+            datasets = future.result()
+            if datasets:
+                print(f"[成功] 找到 {len(datasets)} 個相關資料集")
+                break
     
     if not datasets:
         print("[警告] API 搜尋失敗，請使用網頁介面手動下載")
@@ -110,78 +143,385 @@ def download_from_cdc_api():
     return None
 
 
-def download_from_url(url, filename=None):
+def _load_download_cache(data_dir):
+    """讀取下載快取（記錄每個 URL 的 ETag / Last-Modified 與檔名）"""
+    cache_file = data_dir / DOWNLOAD_CACHE_NAME
+    if not cache_file.exists():
+        return {}
+    try:
+        with open(cache_file, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+        return cache if isinstance(cache, dict) else {}
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+
+def _save_download_cache(data_dir, cache):
+    """以暫存檔加原子替換的方式寫入下載快取"""
+    cache_file = data_dir / DOWNLOAD_CACHE_NAME
+    tmp_file = cache_file.with_name(cache_file.name + '.tmp')
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(cache, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_file, cache_file)
+
+
+def _update_download_cache(data_dir, url, entry):
+    """在鎖內重新讀取並更新單一 URL 的快取項目，避免平行下載互相覆蓋"""
+    with _CACHE_LOCK:
+        cache = _load_download_cache(data_dir)
+        cache[url] = entry
+        _save_download_cache(data_dir, cache)
+
+
+def _guess_filename(url, content_type):
+    """從 URL 或 Content-Type 判斷檔名"""
+    # URL 本身帶有檔名時直接沿用，讓條件式下載可以對應到同一個檔案
+    basename = urlparse(url).path.rsplit('/', 1)[-1]
+    if Path(basename).suffix.lower() in ('.csv', '.json', '.xls', '.xlsx'):
+        return basename
+    
+    # 加上 URL 雜湊，平行下載多個資源時檔名不會互相衝突
+    stem = f"dengue_data_{datetime.now().strftime('%Y%m%d')}_{hashlib.sha1(url.encode('utf-8')).hexdigest()[:8]}"
+    content_type = (content_type or '').lower()
+    if 'csv' in url.lower() or content_type.startswith('text/csv'):
+        return f"{stem}.csv"
+    elif 'xls' in url.lower() or 'excel' in content_type:
+        return f"{stem}.xlsx"
+    elif 'json' in url.lower() or content_type.startswith('application/json'):
+        return f"{stem}.json"
+    return f"{stem}.csv"
+
+
+class CsvStreamStats:
+    """
+    在串流寫入的同時計算 CSV 的欄位與資料筆數，避免下載後再用 pandas 重讀整個檔案
+    以引號狀態判斷換行，欄位值中含換行的資料列不會被重複計算
+    """
+    
+    def __init__(self):
+        self.columns = None
+        self.newlines = 0
+        self._header = b''
+        self._in_quotes = False
+        self._last_byte = b''
+        self._seen_data = False
+    
+    def feed(self, chunk):
+        if not chunk:
+            return
+        if self.columns is None:
+            self._header += chunk
+            end = self._header.find(b'\n')
+            if end == -1:
+                return
+            self._parse_header(self._header[:end])
+            chunk = self._header
+            self._header = b''
+        
+        if b'"' not in chunk:
+            if not self._in_quotes:
+                self.newlines += chunk.count(b'\n')
+        else:
+            # 以引號切割後，位於引號外的片段才計算換行
+            for i, part in enumerate(chunk.split(b'"')):
+                if i > 0:
+                    self._in_quotes = not self._in_quotes
+                if not self._in_quotes:
+                    self.newlines += part.count(b'\n')
+        self._last_byte = chunk[-1:]
+        self._seen_data = True
+    
+    def _parse_header(self, line):
+        text = line.decode('utf-8-sig', errors='replace').rstrip('\r')
+        self.columns = next(csv.reader([text]), [])
+    
+    def close(self):
+        """結束串流，回傳 (資料筆數, 欄位列表)"""
+        if self.columns is None and self._header:
+            # 整個檔案只有一行（沒有換行結尾）
+            self._parse_header(self._header)
+            self._header = b''
+            return 0, self.columns
+        lines = self.newlines
+        if self._seen_data and self._last_byte != b'\n':
+            lines += 1
+        return max(lines - 1, 0), self.columns or []
+
+
+def download_from_url(url, filename=None, data_dir=None, session=None,
+                      chunk_size=256 * 1024, max_retries=3, timeout=60, deadline=None, stop=None):
     """
     從指定 URL 下載檔案
+    
+    - 以串流方式分塊寫入 `<檔名>.part` 暫存檔，完成後原子替換為正式檔名
+    - 中斷的下載會以 HTTP Range 從暫存檔尾端續傳（搭配 If-Range 確保內容未變）
+    - 以 If-None-Match / If-Modified-Since 進行條件式下載，檔案未變更時只需一次 304 回應
+    - CSV 的資料筆數與欄位在串流過程中計算，不需下載後再重新讀檔
+    
+    data_dir 與 session 可替換，方便對本機的 HTTP 測試伺服器下載
+    deadline 為 time.monotonic() 的截止時間，逾時會保留暫存檔供下次續傳並拋出 TimeoutError；
+    stop 為 threading.Event，由呼叫端設定時同樣在下一個區塊停止並拋出 TimeoutError
     """
+    data_dir = Path(data_dir) if data_dir is not None else DATA_DIR
+    data_dir.mkdir(parents=True, exist_ok=True)
+    http = session or requests
+    
+    entry = _load_download_cache(data_dir).get(url, {})
+    target_name = filename or entry.get('filename')
+    
     try:
         print(f"正在下載: {url}")
-        response = requests.get(url, timeout=60, headers={
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        })
-        response.raise_for_status()
         
-        # 判斷檔案格式
-        if filename is None:
-            # 從 URL 或 Content-Type 判斷
-            if 'csv' in url.lower() or response.headers.get('Content-Type', '').startswith('text/csv'):
-                filename = f"dengue_data_{datetime.now().strftime('%Y%m%d')}.csv"
-            elif 'xls' in url.lower() or 'excel' in response.headers.get('Content-Type', '').lower():
-                filename = f"dengue_data_{datetime.now().strftime('%Y%m%d')}.xlsx"
-            elif 'json' in url.lower() or response.headers.get('Content-Type', '').startswith('application/json'):
-                filename = f"dengue_data_{datetime.now().strftime('%Y%m%d')}.json"
+        for attempt in range(max_retries + 1):
+            headers = dict(DEFAULT_HEADERS)
+            part_path = data_dir / f"{target_name}.part" if target_name else None
+            resume_from = part_path.stat().st_size if part_path and part_path.exists() else 0
+            
+            if resume_from and entry.get('partial_validator'):
+                headers['Range'] = f"bytes={resume_from}-"
+                headers['If-Range'] = entry['partial_validator']
+            elif target_name and (data_dir / target_name).exists():
+                if entry.get('etag'):
+                    headers['If-None-Match'] = entry['etag']
+                if entry.get('last_modified'):
+                    headers['If-Modified-Since'] = entry['last_modified']
+            
+            if stop is not None and stop.is_set():
+                raise TimeoutError("下載已被呼叫端停止")
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError("超過總下載時限")
+                request_timeout = min(timeout, remaining)
             else:
-                filename = f"dengue_data_{datetime.now().strftime('%Y%m%d')}.csv"
-        
-        filepath = DATA_DIR / filename
-        
-        # 儲存檔案
-        with open(filepath, 'wb') as f:
-            f.write(response.content)
-        print(f"[成功] 已儲存至: {filepath}")
-        
-        # 如果是 CSV，嘗試讀取並顯示資訊
-        if filepath.suffix.lower() == '.csv':
+                request_timeout = timeout
+            
+            response = http.get(url, headers=headers, stream=True, timeout=request_timeout)
             try:
-                df = pd.read_csv(filepath, encoding='utf-8-sig')
-                print(f"[成功] 資料筆數: {len(df)}")
-                print(f"[成功] 欄位數: {len(df.columns)}")
-                print(f"[成功] 前5個欄位: {', '.join(df.columns.tolist()[:5])}")
-            except Exception as e:
-                print(f"[警告] 無法讀取 CSV 檔案: {e}")
+                if response.status_code == 304:
+                    filepath = data_dir / target_name if target_name else None
+                    if filepath is None or not filepath.exists():
+                        # 沒有送出條件式標頭（本地沒有檔案）卻收到 304，沒有可沿用的內容
+                        print(f"[錯誤] 伺服器回應 304，但本地沒有可沿用的檔案: {url}")
+                        return None
+                    print(f"[略過] 伺服器回應 304，檔案未變更: {filepath}")
+                    if entry.get('rows') is not None:
+                        print(f"[成功] 資料筆數: {entry['rows']}")
+                    return filepath
+                
+                if response.status_code == 416:
+                    # 暫存檔已無法續傳，刪除後重新下載
+                    if part_path and part_path.exists():
+                        part_path.unlink()
+                    entry.pop('partial_validator', None)
+                    continue
+                
+                response.raise_for_status()
+                
+                if target_name is None:
+                    target_name = _guess_filename(url, response.headers.get('Content-Type', ''))
+                    part_path = data_dir / f"{target_name}.part"
+                
+                filepath = data_dir / target_name
+                resumed = response.status_code == 206 and resume_from > 0
+                
+                stats = CsvStreamStats() if filepath.suffix.lower() == '.csv' else None
+                if resumed:
+                    print(f"從第 {resume_from:,} 位元組續傳")
+                    if stats is not None:
+                        # 先把已下載的部分餵給統計器，筆數才會完整
+                        with open(part_path, 'rb') as f:
+                            for chunk in iter(lambda: f.read(chunk_size), b''):
+                                stats.feed(chunk)
+                
+                # 記錄本次內容的驗證碼，中斷後續傳時用於 If-Range
+                validator = response.headers.get('ETag') or response.headers.get('Last-Modified')
+                entry['filename'] = target_name
+                if validator:
+                    entry['partial_validator'] = validator
+                else:
+                    entry.pop('partial_validator', None)
+                _update_download_cache(data_dir, url, entry)
+                
+                try:
+                    with open(part_path, 'ab' if resumed else 'wb') as f:
+                        for chunk in response.iter_content(chunk_size=chunk_size):
+                            if not chunk:
+                                continue
+                            f.write(chunk)
+                            if stats is not None:
+                                stats.feed(chunk)
+                            if deadline is not None and time.monotonic() > deadline:
+                                raise TimeoutError("超過總下載時限，暫存檔保留供下次續傳")
+                            if stop is not None and stop.is_set():
+                                raise TimeoutError("下載已被呼叫端停止，暫存檔保留供下次續傳")
+                        f.flush()
+                        os.fsync(f.fileno())
+                except (requests.exceptions.ChunkedEncodingError,
+                        requests.exceptions.ConnectionError) as e:
+                    if attempt < max_retries:
+                        print(f"[警告] 傳輸中斷，準備續傳: {e}")
+                        time.sleep(_backoff_delay(attempt))
+                        continue
+                    raise
+            finally:
+                response.close()
+            
+            # 原子替換：讀取者不會看到下載到一半的檔案
+            os.replace(part_path, filepath)
+            print(f"[成功] 已儲存至: {filepath}")
+            
+            entry.pop('partial_validator', None)
+            entry['etag'] = response.headers.get('ETag')
+            entry['last_modified'] = response.headers.get('Last-Modified')
+            entry['size'] = filepath.stat().st_size
+            entry['downloaded_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            
+            # 如果是 CSV，顯示串流過程中計算出的資訊
+            if stats is not None:
+                rows, columns = stats.close()
+                entry['rows'] = rows
+                entry['columns'] = columns
+                print(f"[成功] 資料筆數: {rows}")
+                print(f"[成功] 欄位數: {len(columns)}")
+                print(f"[成功] 前5個欄位: {', '.join(columns[:5])}")
+            
+            _update_download_cache(data_dir, url, entry)
+            return filepath
         
-        return filepath
+        print(f"[錯誤] 下載失敗: 已重試 {max_retries} 次")
+        return None
     
+    except TimeoutError:
+        # 超過總時限時交由呼叫端停止重試
+        raise
     except Exception as e:
         print(f"[錯誤] 下載失敗: {e}")
         return None
 
 
-def download_dengue_daily_data():
+def collect_resource_urls(datasets, formats=('CSV', 'JSON')):
+    """列出資料集中指定格式的所有資源下載連結（去除重複）"""
+    urls = []
+    for dataset in datasets:
+        for resource in dataset.get('resources', []) or []:
+            if str(resource.get('format', '')).upper() not in formats:
+                continue
+            download_url = resource.get('downloadUrl') or resource.get('url')
+            if download_url and download_url not in urls:
+                urls.append(download_url)
+    return urls
+
+
+def fetch_resources(urls, data_dir=None, max_workers=8, per_host=4,
+                    max_retries=3, total_timeout=600, session=None, timeout=30):
+    """
+    平行下載多個資源
+    
+    - 所有下載共用同一個連線池 Session
+    - max_workers 限制整體並行數，per_host 限制對同一主機的並行數
+    - 失敗時以指數退避加隨機抖動重試
+    - total_timeout 為整批下載的總時限（秒），逾時的下載會保留暫存檔供下次續傳
+    - timeout 為單次連線 / 讀取的逾時；超過總時限後通知所有下載停止，並最多再等待
+      timeout 秒讓進行中的下載寫完目前的區塊，回傳時不會再有背景執行緒修改資料目錄
+    
+    總耗時約等於最慢的單一檔案，而非所有檔案下載時間的總和
+    回傳 {url: 檔案路徑或 None}
+    """
+    if not urls:
+        return {}
+    
+    deadline = time.monotonic() + total_timeout
+    stop = threading.Event()
+    http = session or create_session(pool_size=max_workers)
+    host_limits = {}
+    host_lock = threading.Lock()
+    
+    def host_semaphore(url):
+        host = urlparse(url).netloc
+        with host_lock:
+            if host not in host_limits:
+                host_limits[host] = threading.BoundedSemaphore(per_host)
+            return host_limits[host]
+    
+    def fetch(url):
+        semaphore = host_semaphore(url)
+        for attempt in range(max_retries + 1):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or stop.is_set():
+                break
+            if not semaphore.acquire(timeout=remaining):
+                break
+            try:
+                # 重試只在這一層進行（單次下載不再重試），中斷的傳輸在下一次嘗試時從暫存檔續傳
+                filepath = download_from_url(url, data_dir=data_dir, session=http, max_retries=0,
+                                             timeout=timeout, deadline=deadline, stop=stop)
+            except TimeoutError as e:
+                print(f"[錯誤] {e}: {url}")
+                return None
+            finally:
+                semaphore.release()
+            if filepath is not None:
+                return filepath
+            if attempt < max_retries:
+                delay = _backoff_delay(attempt)
+                if time.monotonic() + delay >= deadline:
+                    break
+                print(f"[警告] 第 {attempt + 1} 次下載失敗，{delay:.1f} 秒後重試: {url}")
+                if stop.wait(delay):
+                    break
+        return None
+    
+    results = {url: None for url in urls}
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    futures = {executor.submit(fetch, url): url for url in urls}
+    try:
+        _, not_done = wait(futures, timeout=max(deadline - time.monotonic(), 0))
+        if not_done:
+            print(f"[警告] 超過總時限，{len(not_done)} 個資源未完成下載")
+    finally:
+        # 通知進行中的下載停止：在下一個區塊或單次讀取逾時（timeout 秒）後結束，
+        # 尚未開始的下載直接取消；等待它們結束，回傳後不會再有寫入暫存檔或快取的執行緒
+        stop.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+        _, still_running = wait(futures, timeout=timeout + 1)
+        if still_running:
+            print(f"[警告] {len(still_running)} 個下載未能在停止後 {timeout + 1} 秒內結束")
+    for future, url in futures.items():
+        if future.done() and not future.cancelled():
+            results[url] = future.result()
+    
+    succeeded = sum(1 for path in results.values() if path is not None)
+    print(f"\n[完成] 成功下載 {succeeded}/{len(urls)} 個資源")
+    return results
+
+
+def download_dengue_daily_data(fetch_all=False):
     """
     下載登革熱每日病例資料
     從政府資料開放平台下載最新的登革熱病例資料
+    fetch_all 為 True 時不詢問，直接平行下載所有資料集的 CSV/JSON 資源
     """
     print("\n=== 台灣登革熱病例資料下載工具 ===\n")
     
     # 方法1: 從政府資料開放平台搜尋
     datasets = download_from_data_gov_tw()
     
-    if datasets:
-        print("\n請選擇要下載的資料集編號（或按 Enter 跳過）:")
+    if datasets and fetch_all:
+        fetch_resources(collect_resource_urls(datasets))
+    elif datasets:
+        print("\n請選擇要下載的資料集編號（輸入 a 下載全部 CSV/JSON 資源，或按 Enter 跳過）:")
         try:
-            choice = input().strip()
+            choice = input().strip().lower()
             
-            if choice.isdigit() and 1 <= int(choice) <= len(datasets):
+            if choice == 'a':
+                fetch_resources(collect_resource_urls(datasets))
+            elif choice.isdigit() and 1 <= int(choice) <= len(datasets):
                 dataset = datasets[int(choice) - 1]
                 print(f"\n正在下載: {dataset.get('title')}")
                 
-                # 嘗試下載資源
-                if 'resources' in dataset:
-                    for resource in dataset['resources']:
-                        download_url = resource.get('downloadUrl') or resource.get('url')
-                        if download_url:
-                            download_from_url(download_url)
+                # 平行下載該資料集的所有資源
+                fetch_resources(collect_resource_urls([dataset], formats=('CSV', 'JSON', 'XLS', 'XLSX')))
         except EOFError:
             print("\n非互動模式，跳過選擇步驟")
     
@@ -233,7 +573,7 @@ if __name__ == "__main__":
     if len(sys.argv) > 1 and sys.argv[1] == '--auto':
         # 自動模式：直接嘗試下載
         print("\n自動模式：正在搜尋和下載資料...")
-        download_dengue_daily_data()
+        download_dengue_daily_data(fetch_all=True)
     else:
         # 互動模式
         try:
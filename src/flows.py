@@ -0,0 +1,120 @@
+"""
+感染地 → 居住地 流向矩陣
+以整數代碼一次計算 年 × 感染地 × 居住鄉鎮 的稀疏計數（COO 格式），
+感染地為鄉鎮（本土病例）或國家（境外移入），病媒防治可據此找出「在哪裡被感染」
+"""
+
+import json
+
+import numpy as np
+import pandas as pd
+
+from case_codes import COUNTY_MERGERS, canonical_county, canonical_township_names
+
+# 境外移入病例的感染地以「境外|國家」表示
+IMPORTED = '境外'
+UNKNOWN = '未知'
+
+
+def encode_origins(df, tables):
+    """
+    編碼每筆病例的感染地
+    回傳 (感染地代碼陣列, 感染地列表 [[縣市, 鄉鎮或國家]], 感染地對應的居住鄉鎮代碼（無對應為 -1）)
+    """
+    infection_counties = df['感染縣市'].fillna(UNKNOWN).map(canonical_county).replace(COUNTY_MERGERS)
+    counties, townships = canonical_township_names(infection_counties, df['感染鄉鎮'].fillna(UNKNOWN))
+    imported = (df['是否境外移入'].astype(str) == '是').to_numpy()
+    countries = df['感染國家'].fillna(UNKNOWN).astype(str).to_numpy(dtype=object)
+
+    counties[imported] = IMPORTED
+    townships[imported] = countries[imported]
+    keys = pd.Series(counties) + '|' + pd.Series(townships)
+    origin_codes, origin_keys = pd.factorize(keys, sort=True)
+
+    township_index = {f"{county}|{township}": i for i, (county, township) in enumerate(tables['townships'])}
+    origins = [key.split('|', 1) for key in origin_keys]
+    # 感染鄉鎮未知時不視為本地感染
+    origin_township = np.array([
+        -1 if township == UNKNOWN else township_index.get(f"{county}|{township}", -1)
+        for county, township in origins
+    ], dtype=np.int32)
+    return origin_codes.astype(np.int32), origins, origin_township
+
+
+def build_flows(df, codes):
+    """
+    一次計算 年 × 感染地 × 居住鄉鎮 的病例數
+    回傳 COO 陣列 {'year', 'origin', 'destination', 'count'} 與代碼表
+    """
+    tables = codes['tables']
+    origin, origins, origin_township = encode_origins(df, tables)
+
+    start = np.datetime64(tables['start_date'], 'D')
+    years = (start + codes['day']).astype('datetime64[Y]').astype(np.int64) + 1970
+    first_year = int(years.min())
+    n_origins = len(origins)
+    n_destinations = len(tables['townships'])
+
+    flat = ((years - first_year) * n_origins + origin) * n_destinations + codes['township']
+    keys, counts = np.unique(flat, return_counts=True)
+    destination = keys % n_destinations
+    origin_code = (keys // n_destinations) % n_origins
+    year = keys // (n_destinations * n_origins) + first_year
+
+    cross = origin_township[origin_code] != destination
+    print(f"感染地流向: {n_origins} 個感染地 × {n_destinations} 個居住鄉鎮，"
+          f"{len(keys)} 組非零組合，跨鄉鎮感染 {int(counts[cross].sum())} 例")
+
+    return {
+        'year': year.astype(np.int16),
+        'origin': origin_code.astype(np.int32),
+        'destination': destination.astype(np.int32),
+        'count': counts.astype(np.int32),
+        'origin_township': origin_township,
+    }, origins
+
+
+def flows_writer(flows, origins, tables):
+    """回傳寫入 flows.npz 的函數"""
+    header = json.dumps({
+        'origins': origins,
+        'destinations': tables['townships'],
+    }, ensure_ascii=False)
+
+    def write(path):
+        with open(path, 'wb') as f:
+            np.savez_compressed(f, header=np.array(header), **flows)
+
+    return write
+
+
+def top_flows(flows, origins, destinations, limit=20):
+    """病例數最多的跨鄉鎮 / 境外流向（合併所有年份）"""
+    cross = flows['origin_township'][flows['origin']] != flows['destination']
+    n_destinations = len(destinations)
+    pair = flows['origin'][cross].astype(np.int64) * n_destinations + flows['destination'][cross]
+    keys, inverse = np.unique(pair, return_inverse=True)
+    totals = np.bincount(inverse, weights=flows['count'][cross])
+    items = []
+    for i in np.argsort(-totals, kind='stable')[:limit]:
+        origin, destination = divmod(int(keys[i]), n_destinations)
+        items.append({
+            '感染地': '|'.join(origins[origin]),
+            '居住地': '|'.join(destinations[destination]),
+            '病例數': int(totals[i]),
+        })
+    return items
+
+
+def summarize_flows(flows, origins, tables):
+    """JSON 輸出用：全期前 20 大流向與境外移入感染國家排行"""
+    imported = np.array([county == IMPORTED for county, _ in origins])[flows['origin']]
+    by_country = np.bincount(flows['origin'][imported], weights=flows['count'][imported], minlength=len(origins))
+    countries = [
+        {'感染國家': origins[i][1], '病例數': int(by_country[i])}
+        for i in np.argsort(-by_country, kind='stable') if by_country[i] > 0
+    ]
+    return {
+        'top_flows': top_flows(flows, origins, tables['townships']),
+        'imported_countries': countries[:20],
+    }
@@ -0,0 +1,164 @@
+"""
+鄉鎮市區界線幾何資料處理
+將內政部 SHP 轉為網站使用的 GeoJSON，並計算各鄉鎮的中心點
+"""
+
+import sys
+import io
+
+# 設定 Windows 終端機 UTF-8 編碼
+if sys.platform == 'win32':
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='replace')
+    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8', errors='replace')
+
+import json
+import math
+import os
+from pathlib import Path
+
+# 設定路徑
+BASE_DIR = Path(__file__).parent.parent
+SHP_FILE = BASE_DIR / "map" / "data_raw" / "TOWN_MOI_1140318.shp"
+SHP_SIDECARS = [SHP_FILE.with_suffix(suffix) for suffix in ('.shp', '.dbf', '.shx', '.prj', '.CPG')]
+GEOJSON_FILE = BASE_DIR / "website" / "static" / "data" / "taiwan_township.geojson"
+CENTROIDS_FILE = BASE_DIR / "data" / "processed" / "township_centroids.json"
+
+
+def convert_shp_to_geojson(shp_path=SHP_FILE, output_path=GEOJSON_FILE):
+    """將鄉鎮界線 SHP 轉為 GeoJSON（需要 geopandas）"""
+    try:
+        import geopandas as gpd
+    except ImportError:
+        print("警告: 未安裝 geopandas，無法轉換 SHP，沿用現有的 GeoJSON")
+        return False
+
+    print(f"正在讀取 SHP 檔案: {shp_path}")
+    gdf = gpd.read_file(shp_path, encoding='utf-8')
+    print(f"找到 {len(gdf)} 個行政區")
+
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = output_path.with_name(output_path.name + '.tmp')
+    gdf.to_file(tmp_path, driver='GeoJSON', encoding='utf-8')
+    os.replace(tmp_path, output_path)
+    print(f"GeoJSON 已儲存至: {output_path}")
+    return True
+
+
+def _ring_centroid(ring):
+    """以鞋帶公式計算單一外環的面積與形心"""
+    area = cx = cy = 0.0
+    for (x0, y0), (x1, y1) in zip(ring, ring[1:] + ring[:1]):
+        cross = x0 * y1 - x1 * y0
+        area += cross
+        cx += (x0 + x1) * cross
+        cy += (y0 + y1) * cross
+    area /= 2.0
+    if area == 0:
+        xs = [point[0] for point in ring]
+        ys = [point[1] for point in ring]
+        return 0.0, sum(xs) / len(xs), sum(ys) / len(ys)
+    return abs(area), cx / (6.0 * area), cy / (6.0 * area)
+
+
+def feature_centroid(geometry):
+    """計算 Polygon / MultiPolygon 的面積加權形心（只使用外環）"""
+    if geometry['type'] == 'Polygon':
+        polygons = [geometry['coordinates']]
+    elif geometry['type'] == 'MultiPolygon':
+        polygons = geometry['coordinates']
+    else:
+        return None
+
+    total = sx = sy = 0.0
+    fallback = None
+    for polygon in polygons:
+        ring = [tuple(point[:2]) for point in polygon[0]]
+        if len(ring) < 3:
+            continue
+        area, x, y = _ring_centroid(ring)
+        fallback = fallback or (x, y)
+        total += area
+        sx += x * area
+        sy += y * area
+    if total == 0:
+        return fallback
+    return sx / total, sy / total
+
+
+def lonlat_to_twd97(lon, lat):
+    """
+    經緯度轉為 TWD97 二度分帶（TM2，中央經線 121°）平面座標（公尺）
+    與疫情資料「最小統計區中心點X/Y」相同的座標系統，橫麥卡托正算（GRS80 橢球）
+    """
+    a = 6378137.0
+    f = 1 / 298.257222101
+    k0 = 0.9999
+    e2 = f * (2 - f)
+    ep2 = e2 / (1 - e2)
+    phi = math.radians(lat)
+    sin_phi, cos_phi, tan_phi = math.sin(phi), math.cos(phi), math.tan(phi)
+
+    n = a / math.sqrt(1 - e2 * sin_phi ** 2)
+    t = tan_phi ** 2
+    c = ep2 * cos_phi ** 2
+    big_a = math.radians(lon - 121.0) * cos_phi
+    m = a * ((1 - e2 / 4 - 3 * e2 ** 2 / 64 - 5 * e2 ** 3 / 256) * phi
+             - (3 * e2 / 8 + 3 * e2 ** 2 / 32 + 45 * e2 ** 3 / 1024) * math.sin(2 * phi)
+             + (15 * e2 ** 2 / 256 + 45 * e2 ** 3 / 1024) * math.sin(4 * phi)
+             - (35 * e2 ** 3 / 3072) * math.sin(6 * phi))
+
+    x = k0 * n * (big_a + (1 - t + c) * big_a ** 3 / 6
+                  + (5 - 18 * t + t ** 2 + 72 * c - 58 * ep2) * big_a ** 5 / 120)
+    y = k0 * (m + n * tan_phi * (big_a ** 2 / 2 + (5 - t + 9 * c + 4 * c ** 2) * big_a ** 4 / 24
+                                 + (61 - 58 * t + t ** 2 + 600 * c - 330 * ep2) * big_a ** 6 / 720))
+    return x + 250000.0, y
+
+
+def compute_township_centroids(geojson_path=GEOJSON_FILE, output_path=CENTROIDS_FILE):
+    """計算每個鄉鎮的中心點並儲存為 JSON"""
+    with open(geojson_path, 'r', encoding='utf-8') as f:
+        geo = json.load(f)
+
+    centroids = []
+    for feature in geo['features']:
+        props = feature.get('properties', {})
+        center = feature_centroid(feature.get('geometry') or {'type': None})
+        if center is None:
+            continue
+        centroids.append({
+            'COUNTYNAME': props.get('COUNTYNAME', ''),
+            'TOWNNAME': props.get('TOWNNAME', ''),
+            'TOWNCODE': props.get('TOWNCODE', ''),
+            'lon': round(center[0], 6),
+            'lat': round(center[1], 6),
+        })
+    centroids.sort(key=lambda item: (item['COUNTYNAME'], item['TOWNNAME']))
+
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = output_path.with_name(output_path.name + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(centroids, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, output_path)
+    print(f"已計算 {len(centroids)} 個鄉鎮中心點: {output_path}")
+    return centroids
+
+
+def load_township_centroids(path=CENTROIDS_FILE):
+    """讀取鄉鎮中心點（不存在時從 GeoJSON 重新計算）"""
+    if path.exists():
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return compute_township_centroids(output_path=path)
+
+
+def build_township_geometry():
+    """幾何資料步驟：SHP 存在時重新轉換 GeoJSON，再計算中心點"""
+    if SHP_FILE.exists():
+        convert_shp_to_geojson()
+    if not GEOJSON_FILE.exists():
+        raise FileNotFoundError(f"找不到鄉鎮界線 GeoJSON: {GEOJSON_FILE}")
+    return compute_township_centroids()
+
+
+if __name__ == "__main__":
+    build_township_geometry()
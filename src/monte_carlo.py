@@ -0,0 +1,65 @@
+"""
+蒙地卡羅模擬的平行執行（時空掃描、近重複檢定共用）
+子行程以 initializer 建立一次共用資料，避免每個批次重複傳送大型陣列；
+模擬次數切成多個批次，每批有由 SeedSequence 衍生的獨立亂數種子，結果可重現
+"""
+
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# 子行程共用的資料（由 initializer 設定一次）
+_WORKER = {}
+
+
+def _init_worker(init, init_args, simulate):
+    _WORKER.clear()
+    _WORKER['state'] = init(*init_args)
+    _WORKER['simulate'] = simulate
+
+
+def _run_batch(args):
+    key, seed, n = args
+    return key, _WORKER['simulate'](_WORKER['state'], key, np.random.default_rng(seed), n)
+
+
+def positive_int(value):
+    """命令列參數用：模擬次數、行程數等必須為正整數"""
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"必須為正整數: {value}")
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"必須為正整數: {value}")
+    return number
+
+
+def run_replicates(init, init_args, simulate, n, workers=None, seed=2015, keys=None):
+    """
+    以行程池平行執行 n 次模擬
+    - init(*init_args) 在每個子行程執行一次，回傳值作為共用資料 state
+    - simulate(state, key, rng, batch) 執行 batch 次模擬，回傳第一軸為模擬次數的陣列
+    - keys 為需要各自執行 n 次模擬的項目（例如各流行季），回傳 {key: 串接後的結果}；
+      未指定時只有一組模擬，直接回傳串接後的陣列
+    init 與 simulate 必須是模組頂層函數（才能傳給子行程）
+    """
+    if n < 1:
+        raise ValueError(f"模擬次數必須至少為 1: {n}")
+    single = keys is None
+    keys = [None] if single else list(keys)
+    workers = workers or os.cpu_count() or 1
+    n_batches = min(n, max(workers * 4 // len(keys), 1))
+    sizes = [n // n_batches + (1 if i < n % n_batches else 0) for i in range(n_batches)]
+    seeds = np.random.SeedSequence(seed).spawn(n_batches * len(keys))
+    batches = [(key, seeds[k * n_batches + i], size)
+               for k, key in enumerate(keys) for i, size in enumerate(sizes)]
+
+    results = {key: [] for key in keys}
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(init, init_args, simulate)) as executor:
+        for key, result in executor.map(_run_batch, batches):
+            results[key].append(result)
+    results = {key: np.concatenate(parts) for key, parts in results.items()}
+    return results[None] if single else results
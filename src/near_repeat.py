@@ -0,0 +1,374 @@
+"""
+近重複（near-repeat）時空交互作用檢定（Knox 檢定）
+病例位置使用最小統計區中心點（TWD97 公尺座標），缺漏時改用居住鄉鎮中心點；
+以網格索引（網格邊長 = 最大距離）只比較相鄰網格內的病例，找出所有空間上相近的病例對，
+不需計算所有病例兩兩之間的距離。空間相近的病例對固定後，蒙地卡羅排列只打亂發病日期，
+分散到多個行程平行執行，逐流行季輸出 距離帶 × 時間帶 的 Knox 列聯表
+
+使用方式:
+    python src/near_repeat.py --start 2014-01-01 --end 2015-12-31 --counties 高雄市,臺南市
+    python src/near_repeat.py --start 2015-01-01 --end 2015-12-31 --distance-band 100 --time-band 7 --replicates 99
+"""
+
+import sys
+import io
+
+# 設定 Windows 終端機 UTF-8 編碼
+if sys.platform == 'win32':
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='replace')
+    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8', errors='replace')
+
+import argparse
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from case_codes import canonical_county, canonical_township_names
+from geometry import load_township_centroids, lonlat_to_twd97
+from monte_carlo import positive_int, run_replicates
+from publish import PROCESSED_DIR, atomic_write_json, read_manifest
+
+CLEAN_DIR = PROCESSED_DIR / "clean"
+NEAR_REPEAT_FILE = PROCESSED_DIR / "near_repeat.json"
+COLUMNS = ['發病日期', '居住縣市', '居住鄉鎮', '最小統計區中心點X', '最小統計區中心點Y', '是否境外移入']
+
+# 每批展開的候選病例對上限（控制網格搜尋的暫存記憶體）
+PAIR_BLOCK = 2_000_000
+
+# 網格搜尋只需看自己與一半的相鄰網格（另一半由對方網格看回來），每一對只出現一次
+HALF_NEIGHBOURHOOD = ((0, 0), (1, -1), (1, 0), (1, 1), (0, 1))
+
+
+def load_cases(start, end, counties=None, include_imported=False, clean_dir=CLEAN_DIR):
+    """
+    讀取期間內的病例（只讀取需要的欄位與年度分割）
+    回傳 DataFrame：日序號、縣市、鄉鎮、x、y（公尺）、座標來源
+    """
+    first_year, last_year = int(start[:4]), int(end[:4])
+    paths = [path for path in sorted(clean_dir.glob('year=*.csv'))
+             if first_year <= int(path.stem.split('=', 1)[1]) <= last_year]
+    if not paths:
+        raise FileNotFoundError(f"找不到清理後資料，請先執行分析腳本: {clean_dir}")
+
+    frames = []
+    for path in paths:
+        df = pd.read_csv(path, usecols=COLUMNS, dtype=str, encoding='utf-8')
+        df = df[(df['發病日期'] >= start) & (df['發病日期'] <= end)]
+        if not include_imported:
+            df = df[df['是否境外移入'].fillna('否') != '是']
+        frames.append(df)
+    df = pd.concat(frames, ignore_index=True)
+
+    county_names, township_names = canonical_township_names(df['居住縣市'], df['居住鄉鎮'])
+    df['縣市'] = county_names
+    df['鄉鎮'] = township_names
+    if counties:
+        df = df[df['縣市'].isin({canonical_county(name) for name in counties})].reset_index(drop=True)
+
+    x = pd.to_numeric(df['最小統計區中心點X'], errors='coerce').to_numpy()
+    y = pd.to_numeric(df['最小統計區中心點Y'], errors='coerce').to_numpy()
+    exact = np.isfinite(x) & np.isfinite(y) & (x > 0) & (y > 0)
+
+    # 缺少最小統計區座標的病例改用居住鄉鎮中心點
+    projected = {
+        f"{item['COUNTYNAME']}|{item['TOWNNAME']}": lonlat_to_twd97(item['lon'], item['lat'])
+        for item in load_township_centroids()
+    }
+    keys = (df['縣市'] + '|' + df['鄉鎮']).to_numpy()
+    for i in np.flatnonzero(~exact):
+        x[i], y[i] = projected.get(keys[i], (np.nan, np.nan))
+
+    days = (pd.to_datetime(df['發病日期']).to_numpy().astype('datetime64[D]').astype(np.int64))
+    cases = pd.DataFrame({
+        'day': days, '縣市': df['縣市'], '鄉鎮': df['鄉鎮'], 'x': x, 'y': y,
+        'source': np.where(exact, 'case', 'township'),
+    })
+    located = np.isfinite(x) & np.isfinite(y)
+    if not located.all():
+        print(f"警告: {int((~located).sum())} 筆病例沒有座標也對應不到鄉鎮中心點，已略過")
+    return cases[located].reset_index(drop=True)
+
+
+def season_labels(days, start_month=1):
+    """
+    日序號對應的流行季標籤
+    start_month 為 1 時以年度為流行季，否則跨年度標示為「2014/15」
+    """
+    dates = np.asarray(days).astype('datetime64[D]')
+    years = dates.astype('datetime64[Y]').astype(np.int64) + 1970
+    months = dates.astype('datetime64[M]').astype(np.int64) % 12 + 1
+    season_years = years - (months < start_month)
+    if start_month == 1:
+        return season_years.astype(str)
+    return np.array([f"{year}/{(year + 1) % 100:02d}" for year in season_years])
+
+
+def _expand(lo, counts):
+    """候選範圍 [lo, lo + counts) 展開為 (來源位置, 目標位置)"""
+    src = np.repeat(np.arange(len(lo)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return src, np.repeat(lo, counts) + offsets
+
+
+def grid_pairs(x, y, max_distance):
+    """
+    以網格索引找出距離不超過 max_distance 的所有病例對（每對只出現一次）
+    回傳 (i, j, 距離公尺)
+    """
+    ix = np.floor(x / max_distance).astype(np.int64)
+    iy = np.floor(y / max_distance).astype(np.int64)
+    ix -= ix.min()
+    iy -= iy.min()
+    # 欄寬多留兩格，iy ± 1 不會與相鄰欄的網格編號重疊
+    width = int(iy.max()) + 3
+    order = np.argsort(ix * width + iy, kind='stable')
+    keys = (ix * width + iy)[order]
+    sx, sy = x[order], y[order]
+    position = np.arange(len(order))
+
+    pair_i, pair_j, pair_d = [], [], []
+    for dx, dy in HALF_NEIGHBOURHOOD:
+        target = keys + dx * width + dy
+        lo = np.searchsorted(keys, target, side='left')
+        hi = np.searchsorted(keys, target, side='right')
+        if (dx, dy) == (0, 0):
+            lo = np.maximum(lo, position + 1)
+        counts = np.maximum(hi - lo, 0)
+
+        # 依候選對數分批展開，避免高密度網格一次產生過大的暫存陣列
+        bounds = np.searchsorted(np.cumsum(counts), np.arange(PAIR_BLOCK, counts.sum() + PAIR_BLOCK, PAIR_BLOCK))
+        for first, last in zip(np.r_[0, bounds[:-1] + 1], np.r_[bounds[:-1] + 1, len(counts)]):
+            src, dst = _expand(lo[first:last], counts[first:last])
+            src += first
+            distance = np.hypot(sx[src] - sx[dst], sy[src] - sy[dst])
+            close = distance <= max_distance
+            pair_i.append(order[src[close]])
+            pair_j.append(order[dst[close]])
+            pair_d.append(distance[close])
+
+    return (np.concatenate(pair_i).astype(np.int32), np.concatenate(pair_j).astype(np.int32),
+            np.concatenate(pair_d))
+
+
+def band_index(values, width, n_bands):
+    """
+    值分入等寬的帶：第一帶為 [0, width]，之後為 (k·width, (k+1)·width]
+    超過最後一帶的值標記為 n_bands（「以上」）
+    """
+    band = np.maximum(np.ceil(np.asarray(values) / width), 1).astype(np.int64) - 1
+    return np.minimum(band, n_bands)
+
+
+def time_band_totals(days, width, n_bands):
+    """
+    所有病例對（不論距離）在各時間帶的對數，以排序後的二分搜尋計算，不需列舉病例對
+    發病日期的排列不改變這些總數，因此也是排列檢定下固定的邊際總數
+    """
+    days = np.sort(np.asarray(days))
+    n = len(days)
+    cumulative = []
+    for k in range(n_bands):
+        within = np.searchsorted(days, days + (k + 1) * width, side='right') - np.arange(1, n + 1)
+        cumulative.append(int(within.sum()))
+    totals = np.diff(np.r_[0, cumulative])
+    return np.r_[totals, n * (n - 1) // 2 - cumulative[-1]] if n_bands else np.array([n * (n - 1) // 2])
+
+
+def knox_counts(days, pair_i, pair_j, space_band, time_width, n_time_bands, n_space_bands):
+    """空間相近病例對的 距離帶 × 時間帶（含「以上」）對數"""
+    time_band = band_index(np.abs(days[pair_i] - days[pair_j]), time_width, n_time_bands)
+    columns = n_time_bands + 1
+    return np.bincount(space_band * columns + time_band,
+                       minlength=n_space_bands * columns).reshape(n_space_bands, columns)
+
+
+def _worker_state(seasons, time_width, n_time_bands, n_space_bands):
+    return {'seasons': seasons, 'time_width': time_width, 'n_time_bands': n_time_bands,
+            'n_space_bands': n_space_bands}
+
+
+def _simulate(state, label, rng, n):
+    """在子行程中對一個流行季執行一批排列，回傳 模擬 × 距離帶 × 時間帶 的對數"""
+    days, pair_i, pair_j, space_band = state['seasons'][label]
+    results = np.empty((n, state['n_space_bands'], state['n_time_bands'] + 1), dtype=np.int64)
+    for r in range(n):
+        # 打亂發病日期：保留病例位置與日期分布（時空無交互作用的虛無假設）
+        results[r] = knox_counts(rng.permutation(days), pair_i, pair_j, space_band, state['time_width'],
+                                 state['n_time_bands'], state['n_space_bands'])
+    return results
+
+
+def monte_carlo(seasons, time_width, n_time_bands, n_space_bands, replicates=999, workers=None, seed=2015):
+    """
+    以行程池平行執行各流行季的排列檢定
+    seasons 為 {流行季: (日序號, 病例對 i, 病例對 j, 距離帶)}，回傳 {流行季: 模擬對數}
+    """
+    return run_replicates(_worker_state, (seasons, time_width, n_time_bands, n_space_bands), _simulate,
+                          replicates, workers, seed, keys=seasons)
+
+
+def band_labels(width, n_bands, unit, integer=False):
+    """帶的標籤：0-7天、8-14天 …（integer 為 True 時下界加 1），最後為「>上限」"""
+    labels = [f"{k * width + (1 if integer and k else 0):g}-{(k + 1) * width:g}{unit}" for k in range(n_bands)]
+    return labels + [f">{n_bands * width:g}{unit}"]
+
+
+def knox_table(observed, simulated, time_totals, space_labels, time_labels):
+    """
+    組成完整的 Knox 列聯表
+    observed 為空間相近病例對的 距離帶 × 時間帶 對數，simulated 為對應的排列模擬（模擬 × 距離帶 × 時間帶）；
+    最後一列（超過最大距離）由全部病例對的時間帶總數相減而得
+    期望值為排列模擬的平均，Knox 比值 = 觀察值 / 期望值，p 值為單尾（觀察值偏高）
+    """
+    observed = np.vstack([observed, time_totals - observed.sum(axis=0)])
+    simulated = np.concatenate([simulated, (time_totals - simulated.sum(axis=1))[:, None, :]], axis=1)
+    expected = simulated.mean(axis=0)
+    p_values = (1 + (simulated >= observed[None]).sum(axis=0)) / (len(simulated) + 1)
+    cells = []
+    for s, space in enumerate(space_labels):
+        for t, span in enumerate(time_labels):
+            cells.append({
+                '距離帶': space,
+                '時間帶': span,
+                '觀察值': int(observed[s, t]),
+                '期望值': round(float(expected[s, t]), 2),
+                'Knox比值': round(float(observed[s, t] / expected[s, t]), 2) if expected[s, t] else None,
+                'p值': round(float(p_values[s, t]), 4),
+            })
+    return cells
+
+
+def knox_summary(observed, simulated, time_totals):
+    """
+    傳統 2 × 2 Knox 檢定：空間相近（不超過最大距離）且時間相近（不超過最大天數）的病例對
+    另列出以邊際總數計算的解析期望值（空間相近對數 × 時間相近對數 / 病例對總數）
+    """
+    close = int(observed[:, :-1].sum())
+    simulated_close = simulated[:, :, :-1].sum(axis=(1, 2))
+    expected = float(simulated_close.mean())
+    n_pairs = int(time_totals.sum())
+    space_close = int(observed.sum())
+    time_close = int(time_totals[:-1].sum())
+    return {
+        '病例對總數': n_pairs,
+        '空間相近對數': space_close,
+        '時間相近對數': time_close,
+        '時空相近對數': close,
+        '期望值': round(expected, 2),
+        '解析期望值': round(space_close * time_close / n_pairs, 2) if n_pairs else None,
+        'Knox比值': round(close / expected, 2) if expected else None,
+        'p值': round(float((1 + np.sum(simulated_close >= close)) / (len(simulated) + 1)), 4),
+    }
+
+
+def run_near_repeat(start, end, counties=None, distance_band=100.0, distance_bands=5, time_band=7,
+                    time_bands=4, replicates=999, season_start_month=1, include_imported=False,
+                    exact_only=False, workers=None):
+    """逐流行季執行 Knox 近重複檢定，回傳可寫成 JSON 的結果"""
+    started = time.perf_counter()
+    cases = load_cases(start, end, counties, include_imported)
+    if exact_only:
+        cases = cases[cases['source'] == 'case'].reset_index(drop=True)
+    if len(cases) < 2:
+        raise ValueError("指定期間與縣市的病例不足")
+
+    max_distance = distance_band * distance_bands
+    pair_i, pair_j, distance = grid_pairs(cases['x'].to_numpy(), cases['y'].to_numpy(), max_distance)
+    space_band = band_index(distance, distance_band, distance_bands)
+    days = cases['day'].to_numpy()
+    labels = season_labels(days, season_start_month)
+
+    # 只保留同一流行季內的病例對，並改用各季內的病例編號
+    same_season = labels[pair_i] == labels[pair_j]
+    seasons = {}
+    season_cases = {}
+    for label in np.unique(labels):
+        members = np.flatnonzero(labels == label)
+        if len(members) < 2:
+            continue
+        local = np.full(len(cases), -1, dtype=np.int32)
+        local[members] = np.arange(len(members), dtype=np.int32)
+        keep = same_season & (labels[pair_i] == label)
+        seasons[str(label)] = (days[members], local[pair_i[keep]], local[pair_j[keep]],
+                               space_band[keep].astype(np.int64))
+        season_cases[str(label)] = members
+    if not seasons:
+        raise ValueError("沒有病例數足夠的流行季")
+
+    simulated = monte_carlo(seasons, time_band, time_bands, distance_bands, replicates, workers)
+    space_labels = band_labels(distance_band, distance_bands, '公尺')
+    time_labels = band_labels(time_band, time_bands, '天', integer=True)
+
+    results = []
+    for label, (season_days, season_i, season_j, season_space) in seasons.items():
+        observed = knox_counts(season_days, season_i, season_j, season_space, time_band, time_bands, distance_bands)
+        totals = time_band_totals(season_days, time_band, time_bands)
+        members = season_cases[label]
+        summary = knox_summary(observed, simulated[label], totals)
+        results.append({
+            '流行季': label,
+            '病例數': int(len(members)),
+            '鄉鎮中心點病例數': int((cases['source'].to_numpy()[members] == 'township').sum()),
+            'knox': summary,
+            'table': knox_table(observed, simulated[label], totals, space_labels, time_labels),
+        })
+
+    elapsed = time.perf_counter() - started
+    return {
+        'params': {
+            'start': start, 'end': end,
+            'counties': sorted(canonical_county(name) for name in counties) if counties else [],
+            'distance_band': distance_band, 'distance_bands': distance_bands,
+            'time_band': time_band, 'time_bands': time_bands, 'replicates': replicates,
+            'season_start_month': season_start_month, 'include_imported': include_imported,
+            'exact_only': exact_only,
+        },
+        'distance_bands': space_labels,
+        'time_bands': time_labels,
+        'cases': int(len(cases)),
+        'close_pairs': int(len(pair_i)),
+        'seasons': results,
+        'seconds': round(elapsed, 1),
+        'data_version': (read_manifest() or {}).get('version'),
+        'last_updated': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="近重複時空交互作用檢定（Knox 檢定）")
+    parser.add_argument('--start', required=True, help="開始日期 YYYY-MM-DD")
+    parser.add_argument('--end', required=True, help="結束日期 YYYY-MM-DD")
+    parser.add_argument('--counties', default='', help="縣市（逗號分隔，預設全部）")
+    parser.add_argument('--distance-band', type=float, default=100.0, help="距離帶寬度（公尺）")
+    parser.add_argument('--distance-bands', type=int, default=5, help="距離帶數")
+    parser.add_argument('--time-band', type=int, default=7, help="時間帶寬度（天）")
+    parser.add_argument('--time-bands', type=int, default=4, help="時間帶數")
+    parser.add_argument('--replicates', type=positive_int, default=999, help="蒙地卡羅排列次數")
+    parser.add_argument('--season-start-month', type=int, default=1, choices=range(1, 13),
+                        help="流行季開始月份（預設 1，即以年度為流行季）")
+    parser.add_argument('--include-imported', action='store_true', help="納入境外移入病例")
+    parser.add_argument('--exact-only', action='store_true', help="只使用有最小統計區座標的病例")
+    parser.add_argument('--workers', type=positive_int, default=None, help="平行行程數")
+    args = parser.parse_args()
+
+    counties = [name.strip() for name in args.counties.split(',') if name.strip()]
+    result = run_near_repeat(args.start, args.end, counties, args.distance_band, args.distance_bands,
+                             args.time_band, args.time_bands, args.replicates, args.season_start_month,
+                             args.include_imported, args.exact_only, args.workers)
+    params = result['params']
+    print(f"網格搜尋: {result['cases']} 例中 {result['close_pairs']} 對距離 "
+          f"{params['distance_band'] * params['distance_bands']:g} 公尺以內")
+    for season in result['seasons']:
+        summary = season['knox']
+        print(f"  {season['流行季']}: {season['病例數']} 例，時空相近 {summary['時空相近對數']} 對 / "
+              f"期望 {summary['期望值']}，Knox 比值 {summary['Knox比值']}，p = {summary['p值']}")
+    print(f"完成 {len(result['seasons'])} 個流行季（{args.replicates} 次排列，{result['seconds']} 秒）")
+
+    atomic_write_json(NEAR_REPEAT_FILE, result)
+    print(f"結果已儲存至: {NEAR_REPEAT_FILE}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+"""
+通報延遲分析與近期病例數即時推估（nowcasting）
+病例要到「個案研判日」才會出現在資料中，最近幾週的流行曲線一定被低估。
+以各縣市 發病日 × 延遲天數 的通報三角形估計延遲分布，
+再把最近尚未完整觀察的發病日病例數按比例放大，並以模擬計算區間
+"""
+
+import json
+import time
+
+import numpy as np
+import pandas as pd
+
+# 最長延遲天數（超過者歸入最後一格）
+MAX_DELAY = 56
+# 估計延遲分布使用的發病日區間（已完整觀察的最近天數）
+ESTIMATION_DAYS = 730
+# 縣市延遲分布向全國分布收縮的強度（相當於多少筆全國病例）
+SHRINKAGE = 20
+# 延遲累積機率下限，避免最近一兩天的推估值無限放大
+MIN_REPORTED = 0.05
+QUANTILES = (0.025, 0.5, 0.975)
+
+
+def parse_date_column(values):
+    """
+    向量化解析日期欄位（資料為 YYYY/MM/DD，清理後的分割為 YYYY-MM-DD）
+    先以固定格式解析，少數格式不符的值再逐一推斷，回傳 datetime64[D]
+    """
+    values = pd.Series(values, dtype=object)
+    parsed = pd.to_datetime(values, format='%Y/%m/%d', errors='coerce')
+    retry = parsed.isna() & values.notna()
+    if retry.any():
+        parsed[retry] = pd.to_datetime(values[retry].astype(str).str.replace('/', '-', regex=False),
+                                       errors='coerce')
+    return parsed.to_numpy(dtype='datetime64[D]')
+
+
+def parse_case_dates(df):
+    """解析 發病日、通報日、個案研判日，回傳 {'onset', 'report', 'confirm'}（無法解析為 NaT）"""
+    onset = df['發病日期'] if '發病日期' in df.columns else df['發病日']
+    return {
+        'onset': parse_date_column(onset),
+        'report': parse_date_column(df['通報日']) if '通報日' in df.columns else None,
+        'confirm': parse_date_column(df['個案研判日']) if '個案研判日' in df.columns else None,
+    }
+
+
+def _delay_days(onset, later):
+    """延遲天數（缺值為 -1，研判日早於發病日的資料錯誤視為 0）"""
+    delay = (later - onset).astype('timedelta64[D]')
+    missing = np.isnat(delay)
+    days = np.where(missing, -1, np.clip(delay.astype(np.int64), 0, None))
+    return days
+
+
+def delay_statistics(onset, report, confirm):
+    """各年的 發病→通報、發病→研判 延遲中位數與第 90 百分位數"""
+    years = onset.astype('datetime64[Y]').astype(np.int64) + 1970
+    stats = []
+    for label, later in (('通報', report), ('研判', confirm)):
+        if later is None:
+            continue
+        delay = _delay_days(onset, later)
+        ok = delay >= 0
+        order = np.argsort(years[ok], kind='stable')
+        sorted_years = years[ok][order]
+        sorted_delay = delay[ok][order]
+        values, starts = np.unique(sorted_years, return_index=True)
+        for year, part in zip(values, np.split(sorted_delay, starts[1:])):
+            stats.append({
+                '年份': int(year),
+                '延遲': label,
+                '病例數': int(len(part)),
+                '中位數': float(np.median(part)),
+                'P90': float(np.percentile(part, 90)),
+            })
+    return stats
+
+
+def reporting_triangle(county, onset_day, delay, n_counties, first_day, n_days, max_delay=MAX_DELAY):
+    """
+    以一次 bincount 建立各縣市 發病日 × 延遲天數 的通報三角形
+    只包含發病日在 [first_day, first_day + n_days) 且延遲已知的病例，回傳 縣市 × 日 × (max_delay+1)
+    """
+    keep = (delay >= 0) & (onset_day >= first_day) & (onset_day < first_day + n_days)
+    width = max_delay + 1
+    flat = ((county[keep].astype(np.int64) * n_days + (onset_day[keep] - first_day)) * width
+            + np.minimum(delay[keep], max_delay))
+    counts = np.bincount(flat, minlength=n_counties * n_days * width)
+    return counts.reshape(n_counties, n_days, width)
+
+
+def delay_distribution(triangle, complete_days, shrinkage=SHRINKAGE):
+    """
+    由已完整觀察的發病日估計延遲分布
+    縣市分布向全國分布收縮（病例少的縣市接近全國分布），
+    回傳 (各縣市延遲機率 縣市 × (D+1), 各縣市估計用病例數, 全國延遲機率)
+    """
+    by_delay = triangle[:, :complete_days].sum(axis=1).astype(np.float64)
+    national = by_delay.sum(axis=0)
+    national_pmf = national / max(national.sum(), 1)
+    n_cases = by_delay.sum(axis=1)
+    pmf = (by_delay + shrinkage * national_pmf) / (n_cases + shrinkage)[:, None]
+    return pmf, n_cases, national_pmf
+
+
+def nowcast(observed, pmf, n_cases, simulations=1000, seed=2015, min_reported=MIN_REPORTED):
+    """
+    即時推估最近 D 天（最後一欄為資料截止日）的實際病例數
+
+    observed 為 縣市 × D 的已通報病例數；發病後經過 k 天的病例，已通報比例為 F(k)。
+    點估計為 observed / F(k)，區間以模擬計算：F(k) 依估計用病例數抽 Beta 分布，
+    尚未通報的病例數服從 NegBin(observed, F(k))（期望值與點估計一致；尚無病例的日子推估為 0）
+    回傳 (點估計 縣市 × D, 模擬 simulations × 縣市 × D)
+    """
+    n_counties, window = observed.shape
+    cdf = np.cumsum(pmf, axis=1)
+    elapsed = np.arange(window)[::-1]
+    reported = np.clip(cdf[:, elapsed], min_reported, 1.0)
+    estimate = observed / reported
+
+    rng = np.random.default_rng(seed)
+    a = reported * n_cases[:, None] + 1
+    b = (1 - reported) * n_cases[:, None] + 1
+    p = np.clip(rng.beta(a, b, size=(simulations, n_counties, window)), min_reported, 1.0)
+    pending = rng.negative_binomial(np.maximum(observed, 1), p)
+    pending = np.where((observed == 0) | (reported >= 1.0), 0, pending)
+    return estimate, observed + pending
+
+
+def _summarize_weeks(day_labels, week_labels, observed, estimate, draws):
+    """把逐日推估加總為流行病學週（以模擬值計算週區間）"""
+    change = np.r_[True, week_labels[1:] != week_labels[:-1]]
+    boundaries = np.flatnonzero(change)
+    obs = np.add.reduceat(observed, boundaries, axis=-1)
+    est = np.add.reduceat(estimate, boundaries, axis=-1)
+    sims = np.add.reduceat(draws, boundaries, axis=-1)
+    lower, median, upper = np.quantile(sims, QUANTILES, axis=0)
+    weeks = []
+    for i, start in enumerate(boundaries):
+        weeks.append({
+            '週別': str(week_labels[start]),
+            '起始日': str(day_labels[start]),
+            '觀察值': int(obs[i]),
+            '推估值': round(float(est[i]), 1),
+            '中位數': round(float(median[i]), 1),
+            '下限': round(float(lower[i]), 1),
+            '上限': round(float(upper[i]), 1),
+        })
+    return weeks
+
+
+def run_nowcast(df, codes, bins, max_delay=MAX_DELAY, estimation_days=ESTIMATION_DAYS, simulations=1000):
+    """
+    解析三個日期、建立通報三角形並推估各縣市與全國最近 max_delay 天的病例數
+    回傳 (JSON 摘要, 寫入 nowcast.npz 用的陣列)
+    """
+    started = time.perf_counter()
+    tables = codes['tables']
+    start = np.datetime64(tables['start_date'], 'D')
+    n_counties = len(tables['counties'])
+
+    dates = parse_case_dates(df)
+    confirm = dates['confirm'] if dates['confirm'] is not None else dates['report']
+    if dates['report'] is not None and dates['confirm'] is not None:
+        # 缺研判日時以通報日代替
+        confirm = np.where(np.isnat(confirm), dates['report'], confirm)
+    delay = _delay_days(dates['onset'], confirm)
+    onset_day = codes['day'].astype(np.int64)
+
+    # 資料截止日：最晚的研判日（沒有研判日時為最晚發病日）
+    known = confirm[~np.isnat(confirm)]
+    as_of = min(known.max() if len(known) else start + int(onset_day.max()), start + tables['n_days'] - 1)
+    as_of_day = int((as_of - start).astype(int))
+
+    # 通報三角形：估計區間（已完整觀察）+ 最近 max_delay 天（尚未完整觀察）
+    complete_days = min(estimation_days, max(as_of_day - max_delay + 1, 0))
+    first_day = as_of_day - max_delay + 1 - complete_days
+    triangle = reporting_triangle(codes['county'], onset_day, delay, n_counties,
+                                  first_day, complete_days + max_delay, max_delay)
+    pmf, n_cases, national_pmf = delay_distribution(triangle, complete_days)
+
+    # 最近 max_delay 天各縣市依發病日的已通報病例數（含延遲未知的病例）
+    recent = (onset_day > as_of_day - max_delay) & (onset_day <= as_of_day)
+    flat = codes['county'][recent].astype(np.int64) * max_delay + (onset_day[recent] - (as_of_day - max_delay + 1))
+    observed = np.bincount(flat, minlength=n_counties * max_delay).reshape(n_counties, max_delay)
+
+    estimate, draws = nowcast(observed, pmf, n_cases, simulations=simulations)
+    national_estimate, national_draws = nowcast(observed.sum(axis=0, keepdims=True), national_pmf[None, :],
+                                                n_cases.sum(keepdims=True), simulations=simulations)
+
+    days = np.arange(as_of_day - max_delay + 1, as_of_day + 1)
+    day_labels = (start + days).astype(str)
+    week_labels = bins['week_labels'][bins['week_index'][days]]
+
+    counties = []
+    for c, name in enumerate(tables['counties']):
+        if observed[c].sum() == 0 and n_cases[c] == 0:
+            continue
+        counties.append({
+            '縣市': name,
+            '延遲中位數': int(np.searchsorted(np.cumsum(pmf[c]), 0.5)),
+            '延遲P90': int(np.searchsorted(np.cumsum(pmf[c]), 0.9)),
+            '估計用病例數': int(n_cases[c]),
+            'weeks': _summarize_weeks(day_labels, week_labels, observed[c], estimate[c], draws[:, c]),
+        })
+
+    national = {
+        '縣市': '全國',
+        '延遲中位數': int(np.searchsorted(np.cumsum(national_pmf), 0.5)),
+        '延遲P90': int(np.searchsorted(np.cumsum(national_pmf), 0.9)),
+        '估計用病例數': int(n_cases.sum()),
+        'weeks': _summarize_weeks(day_labels, week_labels, observed.sum(axis=0),
+                                  national_estimate[0], national_draws[:, 0]),
+    }
+
+    elapsed = time.perf_counter() - started
+    print(f"即時推估: 資料截止 {as_of}，{len(counties)} 個縣市，"
+          f"最近 {max_delay} 天已通報 {int(observed.sum())} 例，推估 {float(estimate.sum()):.0f} 例（{elapsed:.2f} 秒）")
+
+    summary = {
+        'as_of': str(as_of),
+        'max_delay': max_delay,
+        'estimation_start': str(start + first_day),
+        'national': national,
+        'counties': counties,
+        'delays': delay_statistics(dates['onset'], dates['report'], confirm),
+    }
+    arrays = {
+        'triangle': triangle,
+        'first_day': np.array(first_day),
+        'delay_pmf': pmf.astype(np.float32),
+        'national_pmf': national_pmf.astype(np.float32),
+        'observed': observed.astype(np.int32),
+        'estimate': estimate.astype(np.float32),
+    }
+    return summary, arrays
+
+
+def nowcast_writer(arrays, tables):
+    """回傳寫入 nowcast.npz 的函數"""
+    header = json.dumps({
+        'start_date': tables['start_date'],
+        'counties': tables['counties'],
+        'max_delay': MAX_DELAY,
+    }, ensure_ascii=False)
+
+    def write(path):
+        with open(path, 'wb') as f:
+            np.savez_compressed(f, header=np.array(header), **arrays)
+
+    return write
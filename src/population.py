@@ -0,0 +1,190 @@
+"""
+人口資料與每十萬人發生率
+人口資料放在 data/raw/population.csv（長表格式，每列一個 年份 × 縣市 × 鄉鎮 [× 性別 × 年齡層]）：
+    年份,縣市,鄉鎮,性別,年齡層,人口數
+性別、年齡層欄位可省略；資料中不可同時包含小計列（「合計」列會被略過）。
+第一次使用時把 CSV 預先整理為以標準鍵值索引的陣列快取（population_cache.npz），
+來源檔案未變更時直接載入快取，計算發生率只需幾次陣列索引
+"""
+
+import io
+import json
+
+import numpy as np
+import pandas as pd
+
+from case_codes import COUNTY_MERGERS, age_band, canonical_county, canonical_township_names
+from publish import PROCESSED_DIR, atomic_write_bytes
+
+POPULATION_FILE = PROCESSED_DIR.parent / "raw" / "population.csv"
+CACHE_FILE = PROCESSED_DIR / "population_cache.npz"
+RATE_COLUMN = '每十萬人發生率'
+SUBTOTAL = '合計'
+
+
+def normalize_age_band(values):
+    """人口資料的年齡層統一為病例資料的分組（0-4、5-9 … 65-69、70+）"""
+    values = pd.Series(values, dtype=object).fillna(SUBTOTAL).astype(str)
+    return values.map({label: age_band(label) for label in values.unique()})
+
+
+def _source_signature(path):
+    stat = path.stat()
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def _build_cache(path):
+    """讀取人口 CSV，整理為 鄉鎮 × 年、性別 × 年、年齡層 × 年 的人口矩陣"""
+    df = pd.read_csv(path, encoding='utf-8-sig', dtype={'縣市': str, '鄉鎮': str})
+    for column in ('性別', '年齡層'):
+        if column not in df.columns:
+            df[column] = SUBTOTAL
+        df[column] = df[column].fillna(SUBTOTAL).astype(str).str.strip()
+    df['年齡層'] = normalize_age_band(df['年齡層'])
+
+    has_sex = (df['性別'] != SUBTOTAL).any()
+    has_age = (df['年齡層'] != SUBTOTAL).any()
+    # 有細分時略過小計列，避免重複計算
+    if has_sex:
+        df = df[df['性別'] != SUBTOTAL]
+    if has_age:
+        df = df[df['年齡層'] != SUBTOTAL]
+
+    counties = df['縣市'].map(canonical_county).replace(COUNTY_MERGERS)
+    counties, townships = canonical_township_names(counties, df['鄉鎮'])
+    keys = pd.Series(counties) + '|' + pd.Series(townships)
+    township_codes, township_keys = pd.factorize(keys, sort=True)
+    year_codes, years = pd.factorize(df['年份'].astype(int), sort=True)
+    sex_codes, sexes = pd.factorize(df['性別'], sort=True)
+    age_codes, ages = pd.factorize(df['年齡層'], sort=True)
+    population = df['人口數'].to_numpy(dtype=np.float64)
+
+    n_years = len(years)
+
+    def table(codes, n):
+        return np.bincount(codes * n_years + year_codes, weights=population, minlength=n * n_years).reshape(n, n_years)
+
+    return {
+        'header': {
+            'source': _source_signature(path),
+            'townships': list(township_keys),
+            'years': [int(y) for y in years],
+            'sexes': list(sexes) if has_sex else [],
+            'ages': list(ages) if has_age else [],
+        },
+        'township': table(township_codes, len(township_keys)),
+        'sex': table(sex_codes, len(sexes)) if has_sex else np.zeros((0, n_years)),
+        'age': table(age_codes, len(ages)) if has_age else np.zeros((0, n_years)),
+    }
+
+
+def load_population(path=POPULATION_FILE, cache_file=CACHE_FILE):
+    """
+    載入人口資料（優先使用快取），沒有人口資料時回傳 None
+    回傳 dict：header（代碼表）、township / county / sex / age 人口矩陣（列 × 年）
+    """
+    if not path.exists():
+        return None
+
+    population = None
+    if cache_file.exists():
+        with np.load(cache_file, allow_pickle=False) as npz:
+            header = json.loads(str(npz['header']))
+            if header.get('source') == _source_signature(path):
+                population = {key: npz[key] for key in npz.files if key != 'header'}
+                population['header'] = header
+
+    if population is None:
+        print(f"正在整理人口資料: {path}")
+        population = _build_cache(path)
+        buffer = io.BytesIO()
+        np.savez(buffer, header=np.array(json.dumps(population['header'], ensure_ascii=False)),
+                 **{key: value for key, value in population.items() if key != 'header'})
+        atomic_write_bytes(cache_file, buffer.getvalue())
+
+    # 縣市人口為所屬鄉鎮加總
+    header = population['header']
+    county_names, county_codes = np.unique([key.split('|', 1)[0] for key in header['townships']],
+                                           return_inverse=True)
+    county = np.zeros((len(county_names), len(header['years'])))
+    np.add.at(county, county_codes, population['township'])
+    population['county'] = county
+    header['counties'] = list(county_names)
+    return population
+
+
+def _fill_years(matrix, population_years, years):
+    """取得指定年份的人口（缺少的年份以最接近的年份代替）"""
+    population_years = np.asarray(population_years)
+    years = np.asarray(years)
+    nearest = np.abs(years[:, None] - population_years[None, :]).argmin(axis=1)
+    return matrix[:, nearest]
+
+
+def _rates(cases, denominators):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rates = np.where(denominators > 0, cases / denominators * 100000, np.nan)
+    return [None if np.isnan(rate) else round(float(rate), 2) for rate in rates]
+
+
+def add_rates(records, population, level, key_fields, year_range, year_field=None):
+    """
+    為一張輸出表（list of dict）加上每十萬人發生率
+    level 為 'township'、'county'、'sex' 或 'age'；有 year_field 時使用該年人口，
+    否則以 year_range 內的人年數（逐年人口加總）為分母，即年平均發生率
+    找不到對應人口的列發生率為 None
+    """
+    if not records:
+        return records
+    header = population['header']
+    names = {'township': header['townships'], 'county': header['counties'],
+             'sex': header['sexes'], 'age': header['ages']}[level]
+    if not names:
+        return records
+
+    frame = pd.DataFrame(records)
+    if level == 'township':
+        counties, townships = canonical_township_names(
+            frame[key_fields[0]].map(canonical_county).replace(COUNTY_MERGERS), frame[key_fields[1]])
+        keys = pd.Series(counties) + '|' + pd.Series(townships)
+    elif level == 'county':
+        keys = frame[key_fields[0]].map(canonical_county).replace(COUNTY_MERGERS)
+    else:
+        keys = frame[key_fields[0]].astype(str)
+    rows = pd.Index(names).get_indexer(keys)
+
+    first_year, last_year = year_range
+    if year_field:
+        matrix = _fill_years(population[level], header['years'], frame[year_field].astype(int))
+        denominators = matrix[np.maximum(rows, 0), np.arange(len(frame))]
+    else:
+        person_years = _fill_years(population[level], header['years'],
+                                   np.arange(first_year, last_year + 1)).sum(axis=1)
+        denominators = person_years[np.maximum(rows, 0)]
+    denominators = np.where(rows >= 0, denominators, 0)
+
+    for record, rate in zip(records, _rates(frame['病例數'].to_numpy(dtype=np.float64), denominators)):
+        record[RATE_COLUMN] = rate
+    return records
+
+
+def apply_incidence_rates(location, person, year_range):
+    """
+    為地理與人群分析的所有輸出表加上每十萬人發生率（沒有人口資料時不做任何事）
+    回傳是否已加上發生率
+    """
+    population = load_population()
+    if population is None:
+        print(f"未找到人口資料（{POPULATION_FILE}），略過發生率計算")
+        return False
+
+    for name in ('county', 'county_top20'):
+        add_rates(location.get(name, []), population, 'county', ['居住縣市'], year_range)
+    add_rates(location.get('township_top30', []), population, 'township', ['居住縣市', '居住鄉鎮'], year_range)
+    add_rates(location.get('county_yearly', []), population, 'county', ['居住縣市'], year_range, '發病年')
+    add_rates(person.get('gender', []), population, 'sex', ['性別'], year_range)
+    add_rates(person.get('gender_yearly', []), population, 'sex', ['性別'], year_range, '發病年')
+    add_rates(person.get('age', []), population, 'age', ['年齡層'], year_range)
+    add_rates(person.get('age_yearly', []), population, 'age', ['年齡層'], year_range, '發病年')
+    print(f"已計算每十萬人發生率（人口資料 {population['header']['years'][0]}-{population['header']['years'][-1]} 年）")
+    return True
@@ -0,0 +1,203 @@
+"""
+分析結果的版本化發布
+每次分析寫入新的版本目錄，完成後以原子替換更新 manifest.json，
+讀取端（網站）永遠只會看到完整的版本，不會讀到寫到一半的檔案；
+manifest 記錄每張表的內容雜湊與最後變更的版本，讓網站只傳送某版本之後變更的表格
+"""
+
+import hashlib
+import json
+import os
+import shutil
+from datetime import datetime
+from pathlib import Path
+
+# 設定路徑
+PROCESSED_DIR = Path(__file__).parent.parent / "data" / "processed"
+VERSIONS_DIR = PROCESSED_DIR / "versions"
+MANIFEST_FILE = PROCESSED_DIR / "manifest.json"
+ANALYSIS_FILE = PROCESSED_DIR / "dengue_analysis.json"
+ANALYSIS_NAME = "dengue_analysis.json"
+
+# 保留的舊版本數量（讓仍在讀取舊版本的伺服器行程不受影響）
+KEEP_VERSIONS = 5
+
+# 每次執行都會改變、不列入表格比對的欄位
+METADATA_KEYS = ('data_version', 'last_updated')
+
+
+def atomic_write_bytes(path, data):
+    """寫入暫存檔、fsync 後原子替換目標檔案"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def atomic_write_json(path, obj, indent=2):
+    atomic_write_bytes(path, json.dumps(obj, ensure_ascii=False, indent=indent).encode('utf-8'))
+
+
+def read_manifest():
+    """讀取目前發布的版本資訊，尚未發布過時回傳 None"""
+    if not MANIFEST_FILE.exists():
+        return None
+    try:
+        with open(MANIFEST_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+def published_artifact_path(name):
+    """目前發布版本中某個輸出檔的路徑（尚未發布或檔案不存在時回傳 None）"""
+    manifest = read_manifest()
+    if not manifest:
+        return None
+    path = PROCESSED_DIR / manifest['path'] / name
+    return path if path.exists() else None
+
+
+def load_published_arrays(name):
+    """讀取目前發布版本的 .npz 輸出，header 解析為 dict"""
+    import numpy as np
+    path = published_artifact_path(name)
+    if path is None:
+        raise FileNotFoundError(f"找不到已發布的 {name}，請先執行 python src/analyze_dengue.py")
+    with np.load(path, allow_pickle=False) as npz:
+        arrays = {key: npz[key] for key in npz.files}
+    if 'header' in arrays:
+        arrays['header'] = json.loads(str(arrays['header']))
+    return arrays
+
+
+def split_tables(results):
+    """
+    把分析結果拆成可獨立更新的表格
+    第一層的值若是「名稱 → 列表」的 dict（time、location、person），每個列表各為一張表（例如 time.yearly），
+    其餘第一層項目整個為一張表
+    """
+    tables = {}
+    for key, value in results.items():
+        if key in METADATA_KEYS:
+            continue
+        if isinstance(value, dict) and value and all(isinstance(item, list) for item in value.values()):
+            for name, item in value.items():
+                tables[f"{key}.{name}"] = item
+        else:
+            tables[key] = value
+    return tables
+
+
+def _json_hash(value):
+    text = json.dumps(value, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
+
+
+def _artifact_hash(path):
+    """.npz 以陣列內容計算雜湊（壓縮檔內含寫入時間，不能直接比對檔案位元組）"""
+    import numpy as np
+    digest = hashlib.sha256()
+    with np.load(path, allow_pickle=False) as npz:
+        for key in sorted(npz.files):
+            array = npz[key]
+            digest.update(f"{key}|{array.dtype.str}|{array.shape}".encode('utf-8'))
+            digest.update(np.ascontiguousarray(array).tobytes())
+    return digest.hexdigest()[:16]
+
+
+def table_versions(hashes, version, previous=None):
+    """
+    每張表的內容雜湊與最後變更的版本（changed_in）
+    內容與前一版相同的表沿用前一版的 changed_in，因此 changed_in > N 即代表版本 N 之後有變更
+    """
+    previous = previous or {}
+    tables = {}
+    for name, digest in hashes.items():
+        old = previous.get(name)
+        changed_in = old['changed_in'] if old and old.get('hash') == digest else version
+        tables[name] = {'hash': digest, 'changed_in': changed_in}
+    return tables
+
+
+def _version_dir(version):
+    return VERSIONS_DIR / f"v{version:06d}"
+
+
+def _existing_versions():
+    versions = []
+    for path in VERSIONS_DIR.glob('v*'):
+        if path.is_dir() and path.name[1:].isdigit():
+            versions.append(int(path.name[1:]))
+    return sorted(versions)
+
+
+def next_version():
+    """下一個資料版本號（單調遞增）"""
+    manifest = read_manifest()
+    current = manifest.get('version', 0) if manifest else 0
+    existing = _existing_versions()
+    return max([current] + existing) + 1
+
+
+def publish_analysis(results, artifacts=None):
+    """
+    發布一個新版本的分析結果
+
+    results 會加上 data_version 後寫成 dengue_analysis.json；
+    artifacts 為 {檔名: writer(path)}，用於同一版本的其他輸出（例如 .npz 陣列）。
+    全部寫入暫存目錄後一次改名為版本目錄，最後才原子替換 manifest.json。
+    """
+    version = next_version()
+    results['data_version'] = version
+    payload = json.dumps(results, ensure_ascii=False, indent=2).encode('utf-8')
+
+    VERSIONS_DIR.mkdir(parents=True, exist_ok=True)
+    target_dir = _version_dir(version)
+    tmp_dir = VERSIONS_DIR / f".v{version:06d}.{os.getpid()}.tmp"
+    if tmp_dir.exists():
+        shutil.rmtree(tmp_dir)
+    tmp_dir.mkdir(parents=True)
+
+    with open(tmp_dir / ANALYSIS_NAME, 'wb') as f:
+        f.write(payload)
+    files = [ANALYSIS_NAME]
+    for name, writer in (artifacts or {}).items():
+        writer(tmp_dir / name)
+        files.append(name)
+
+    hashes = {name: _json_hash(value) for name, value in split_tables(results).items()}
+    hashes.update({name: _artifact_hash(tmp_dir / name) for name in files[1:] if name.endswith('.npz')})
+
+    os.replace(tmp_dir, target_dir)
+
+    # 相容舊路徑：靜態網站建置與舊版伺服器仍讀取 dengue_analysis.json
+    atomic_write_bytes(ANALYSIS_FILE, payload)
+
+    previous = read_manifest()
+    manifest = {
+        'version': version,
+        'path': target_dir.relative_to(PROCESSED_DIR).as_posix(),
+        'files': files,
+        'published_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'tables': table_versions(hashes, version, (previous or {}).get('tables')),
+    }
+    atomic_write_json(MANIFEST_FILE, manifest)
+
+    prune_versions()
+    changed = [name for name, table in manifest['tables'].items() if table['changed_in'] == version]
+    print(f"已發布資料版本 v{version}: {target_dir}（{len(changed)}/{len(manifest['tables'])} 張表有變更）")
+    return version
+
+
+def prune_versions(keep=KEEP_VERSIONS):
+    """刪除過舊的版本目錄（仍被其他行程開啟而無法刪除時略過）"""
+    for version in _existing_versions()[:-keep]:
+        try:
+            shutil.rmtree(_version_dir(version))
+        except OSError:
+            pass
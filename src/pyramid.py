@@ -0,0 +1,43 @@
+"""
+鄉鎮 × 年 × 性別 × 年齡層 病例數立方體（人口金字塔）
+分析階段以一次 bincount 建立，存為 pyramid.npz；網站查詢任意區域與期間只需切片加總，
+不必在每次請求時以 pandas 重新計算
+"""
+
+import json
+
+import numpy as np
+
+from case_codes import AGE_BANDS, SEXES, compact_dtype
+
+
+def build_pyramid(codes, bins):
+    """回傳 鄉鎮 × 年 × 性別 × 年齡層 的計數立方體"""
+    n_towns = len(codes['tables']['townships'])
+    n_years = len(bins['year_labels'])
+    n_sexes = len(SEXES)
+    n_ages = len(AGE_BANDS)
+
+    year = bins['year_index'][codes['day']].astype(np.int64)
+    flat = ((codes['township'].astype(np.int64) * n_years + year) * n_sexes + codes['sex']) * n_ages + codes['age']
+    cube = np.bincount(flat, minlength=n_towns * n_years * n_sexes * n_ages)
+    cube = cube.reshape(n_towns, n_years, n_sexes, n_ages)
+    print(f"人口金字塔立方體: {n_towns} 個鄉鎮 × {n_years} 年 × {n_sexes} 性別 × {n_ages} 年齡層")
+    return cube.astype(compact_dtype(cube.max() if cube.size else 0))
+
+
+def pyramid_writer(cube, tables, bins):
+    """回傳寫入 pyramid.npz 的函數"""
+    header = json.dumps({
+        'counties': tables['counties'],
+        'townships': tables['townships'],
+        'years': [int(year) for year in bins['year_labels']],
+        'sexes': list(SEXES),
+        'ages': list(AGE_BANDS),
+    }, ensure_ascii=False)
+
+    def write(path):
+        with open(path, 'wb') as f:
+            np.savez(f, header=np.array(header), cube=cube, township_county=tables['township_county'])
+
+    return write
@@ -0,0 +1,254 @@
+"""
+鄉鎮病例數分級著色地圖（逐年 / 逐週）批次輸出
+幾何只讀取與投影一次，各行程建立一次圖面後每張圖只更新填色與標題；
+所有圖框以行程池平行輸出為 PNG / SVG，最後組成動畫（有 ffmpeg 時為 MP4，否則以 Pillow 輸出 GIF）
+需要 matplotlib（選用套件）
+
+使用方式:
+    python src/render_maps.py --freq year
+    python src/render_maps.py --freq week --start 2014-01-01 --end 2015-12-31 --counties 高雄市,臺南市
+"""
+
+import sys
+import io
+
+# 設定 Windows 終端機 UTF-8 編碼
+if sys.platform == 'win32':
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='replace')
+    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8', errors='replace')
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from case_codes import canonical_county, township_key
+from geometry import GEOJSON_FILE
+from publish import PROCESSED_DIR, load_published_arrays
+
+MAPS_DIR = PROCESSED_DIR / "maps"
+FREQUENCIES = ('year', 'week')
+DEFAULT_FPS = {'year': 1, 'week': 8}
+# GIF 需要把所有圖框留在記憶體中，縮小寬度以控制記憶體用量
+GIF_WIDTH = 480
+CJK_FONTS = ['Microsoft JhengHei', 'Noto Sans CJK TC', 'PingFang TC', 'Heiti TC', 'Arial Unicode MS', 'DejaVu Sans']
+
+
+def project_geometry(geo, counties=None):
+    """
+    把 GeoJSON 外環投影為平面座標（公里，等距圓柱投影並以台灣中央緯度校正經度比例）
+    回傳 (外環座標列表, 各外環所屬的圖徵序號, 圖徵鍵值列表)；counties 指定時只保留這些縣市
+    """
+    rings = []
+    ring_feature = []
+    keys = []
+    for feature in geo['features']:
+        props = feature.get('properties', {})
+        county = canonical_county(props.get('COUNTYNAME', ''))
+        if counties and county not in counties:
+            continue
+        geometry = feature.get('geometry') or {}
+        if geometry.get('type') == 'Polygon':
+            polygons = [geometry['coordinates']]
+        elif geometry.get('type') == 'MultiPolygon':
+            polygons = geometry['coordinates']
+        else:
+            continue
+        for polygon in polygons:
+            ring = np.asarray(polygon[0], dtype=np.float64)[:, :2]
+            if len(ring) >= 3:
+                rings.append(ring)
+                ring_feature.append(len(keys))
+        keys.append(township_key(county, props.get('TOWNNAME', '')))
+
+    if not rings:
+        return [], np.zeros(0, dtype=np.int64), keys
+    lat0 = np.radians(np.mean([ring[:, 1].mean() for ring in rings]))
+    scale = np.array([111.32 * np.cos(lat0), 110.574])
+    rings = [ring * scale for ring in rings]
+    return rings, np.array(ring_feature, dtype=np.int64), keys
+
+
+def period_counts(arrays, freq, start=None, end=None):
+    """由時間序列立方體取得 鄉鎮 × 期間 的病例數與期間標籤"""
+    header = arrays['header']
+    origin = np.datetime64(header['start_date'], 'D')
+    first = int((np.datetime64(start, 'D') - origin).astype(int)) if start else 0
+    last = int((np.datetime64(end, 'D') - origin).astype(int)) if end else header['n_days'] - 1
+    first = max(first, 0)
+    last = min(last, header['n_days'] - 1)
+    if first > last:
+        raise ValueError('start 不可晚於 end')
+    index = arrays[f'{freq}_index'][first:last + 1]
+    boundaries = np.flatnonzero(np.r_[True, index[1:] != index[:-1]])
+    counts = np.add.reduceat(arrays['daily'][:, first:last + 1].astype(np.int64), boundaries, axis=1)
+    return counts, [str(label) for label in arrays[f'{freq}_labels'][index[boundaries]]]
+
+
+def join_counts(keys, arrays, counts, counties=None):
+    """把 鄉鎮 × 期間 病例數對應到圖徵順序（界線資料中沒有的鄉鎮病例不會出現在地圖上）"""
+    townships = arrays['header']['townships']
+    row_index = {f"{county}|{township}": row for row, (county, township) in enumerate(townships)}
+    rows = np.array([row_index.get(key, -1) for key in keys], dtype=np.int64)
+    values = np.where(rows[:, None] >= 0, counts[np.maximum(rows, 0)], 0)
+    in_scope = [row for row, (county, _) in enumerate(townships) if not counties or county in counties]
+    unmatched = int(counts[in_scope].sum() - values.sum())
+    if unmatched:
+        print(f"警告: {unmatched} 例的居住鄉鎮不在界線資料中，未畫在地圖上")
+    return values
+
+
+_WORKER = {}
+
+
+def _init_worker(rings, ring_feature, vmax, options):
+    """每個子行程只建立一次圖面與多邊形集合，之後的圖框只更新填色"""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    from matplotlib.collections import PolyCollection
+    from matplotlib.colors import LogNorm
+
+    plt.rcParams['font.sans-serif'] = CJK_FONTS
+    plt.rcParams['axes.unicode_minus'] = False
+    # 沒有中文字型時標題只會顯示方框，不必每個字都警告一次
+    warnings.filterwarnings('ignore', message='Glyph .* missing from font')
+
+    cmap = plt.get_cmap('YlOrRd').copy()
+    cmap.set_bad('#eeeeee')
+    norm = LogNorm(vmin=1, vmax=max(vmax, 2))
+
+    fig, ax = plt.subplots(figsize=options['figsize'], dpi=options['dpi'])
+    collection = PolyCollection(rings, cmap=cmap, norm=norm, edgecolors='#999999', linewidths=0.15)
+    collection.set_array(np.ma.masked_all(len(rings)))
+    ax.add_collection(collection)
+    points = np.concatenate(rings)
+    pad = (points.max(axis=0) - points.min(axis=0)) * 0.02
+    ax.set_xlim(points[:, 0].min() - pad[0], points[:, 0].max() + pad[0])
+    ax.set_ylim(points[:, 1].min() - pad[1], points[:, 1].max() + pad[1])
+    ax.set_aspect('equal')
+    ax.axis('off')
+    fig.colorbar(collection, ax=ax, shrink=0.6, label='病例數')
+    title = ax.set_title('', fontsize=14)
+
+    _WORKER.update(fig=fig, collection=collection, title=title, ring_feature=ring_feature, options=options)
+
+
+def _render(task):
+    """輸出一張圖框，回傳檔案路徑"""
+    label, values, path = task
+    ring_values = values[_WORKER['ring_feature']]
+    _WORKER['collection'].set_array(np.ma.masked_less_equal(ring_values, 0))
+    _WORKER['title'].set_text(f"{_WORKER['options']['title']} {label}（{int(values.sum()):,} 例）")
+    _WORKER['fig'].savefig(path, format=_WORKER['options']['format'])
+    return path
+
+
+def render_frames(values, labels, rings, ring_feature, output_dir, freq, fmt='png', dpi=120,
+                  figsize=(7, 9), title='登革熱病例數', workers=None):
+    """
+    以行程池平行輸出所有圖框（values 為 圖徵 × 期間）
+    色階固定為全部期間的最大值（對數尺度），動畫中各圖框可以直接比較
+    """
+    output_dir.mkdir(parents=True, exist_ok=True)
+    options = {'dpi': dpi, 'figsize': figsize, 'format': fmt, 'title': title}
+    tasks = [(label, values[:, i], output_dir / f"{freq}_{label}.{fmt}") for i, label in enumerate(labels)]
+    workers = min(workers or os.cpu_count() or 1, max(len(tasks), 1))
+    chunksize = max(len(tasks) // (workers * 4), 1)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(rings, ring_feature, int(values.max(initial=0)), options)) as executor:
+        return list(executor.map(_render, tasks, chunksize=chunksize))
+
+
+def assemble_animation(paths, output_path, fps):
+    """把 PNG 圖框組成動畫：有 ffmpeg 時輸出 MP4，否則以 Pillow 輸出 GIF；都沒有時回傳 None"""
+    if shutil.which('ffmpeg'):
+        output_path = output_path.with_suffix('.mp4')
+        listing = output_path.with_suffix('.txt')
+        with open(listing, 'w', encoding='utf-8') as f:
+            for path in paths:
+                f.write(f"file '{path.resolve().as_posix()}'\nduration {1 / fps}\n")
+        subprocess.run(['ffmpeg', '-y', '-loglevel', 'error', '-f', 'concat', '-safe', '0', '-i', str(listing),
+                        '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2', '-pix_fmt', 'yuv420p', '-r', str(fps),
+                        str(output_path)], check=True)
+        listing.unlink()
+        return output_path
+
+    try:
+        from PIL import Image
+    except ImportError:
+        print("警告: 沒有 ffmpeg 也未安裝 Pillow，略過動畫")
+        return None
+    output_path = output_path.with_suffix('.gif')
+    frames = []
+    for path in paths:
+        with Image.open(path) as image:
+            height = round(image.height * GIF_WIDTH / image.width)
+            frames.append(image.convert('RGB').resize((GIF_WIDTH, height)).quantize(colors=128))
+    frames[0].save(output_path, save_all=True, append_images=frames[1:], duration=int(1000 / fps), loop=0)
+    return output_path
+
+
+def render_maps(freq='year', start=None, end=None, counties=None, fmt='png', dpi=120,
+                workers=None, fps=None, animation=True):
+    """讀取已發布的時間序列與鄉鎮界線，輸出所有圖框與動畫，回傳輸出目錄"""
+    try:
+        import matplotlib  # noqa: F401
+    except ImportError:
+        raise RuntimeError("輸出地圖需要 matplotlib，請先執行 pip install matplotlib")
+
+    started = time.perf_counter()
+    counties = [canonical_county(name) for name in counties or []]
+    with open(GEOJSON_FILE, 'r', encoding='utf-8') as f:
+        geo = json.load(f)
+    rings, ring_feature, keys = project_geometry(geo, counties)
+    if not rings:
+        raise ValueError(f"界線資料中找不到縣市: {', '.join(counties)}")
+
+    arrays = load_published_arrays('timeseries.npz')
+    counts, labels = period_counts(arrays, freq, start, end)
+    values = join_counts(keys, arrays, counts, counties)
+
+    name = freq + (f"_{'_'.join(counties)}" if counties else '')
+    output_dir = MAPS_DIR / name
+    print(f"正在輸出 {len(labels)} 張地圖（{len(keys)} 個鄉鎮，{len(rings)} 個多邊形）: {output_dir}")
+    paths = render_frames(values, labels, rings, ring_feature, output_dir, freq, fmt, dpi, workers=workers)
+    print(f"圖框輸出完成（{time.perf_counter() - started:.1f} 秒）")
+
+    if animation and fmt == 'png' and len(paths) > 1:
+        movie = assemble_animation(paths, MAPS_DIR / name, fps or DEFAULT_FPS[freq])
+        if movie is not None:
+            print(f"動畫已儲存至: {movie}")
+    return output_dir
+
+
+def main():
+    parser = argparse.ArgumentParser(description="鄉鎮病例數分級著色地圖批次輸出")
+    parser.add_argument('--freq', choices=FREQUENCIES, default='year', help="每張圖的期間")
+    parser.add_argument('--start', default=None, help="開始日期 YYYY-MM-DD")
+    parser.add_argument('--end', default=None, help="結束日期 YYYY-MM-DD")
+    parser.add_argument('--counties', default='', help="縣市（逗號分隔，預設全台）")
+    parser.add_argument('--format', choices=['png', 'svg'], default='png', help="圖檔格式（動畫只支援 png）")
+    parser.add_argument('--dpi', type=int, default=120, help="解析度")
+    parser.add_argument('--fps', type=float, default=None, help="動畫每秒圖框數（預設逐年 1、逐週 8）")
+    parser.add_argument('--no-animation', action='store_true', help="只輸出圖框，不組成動畫")
+    parser.add_argument('--workers', type=int, default=None, help="平行行程數")
+    args = parser.parse_args()
+
+    counties = [name.strip() for name in args.counties.split(',') if name.strip()]
+    try:
+        render_maps(args.freq, args.start, args.end, counties, args.format, args.dpi,
+                    args.workers, args.fps, not args.no_animation)
+    except (RuntimeError, ValueError, FileNotFoundError) as e:
+        print(f"錯誤: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+"""
+時空排列掃描統計（Kulldorff space-time permutation scan）
+以鄉鎮中心點建立鄰近清單預先列舉所有圓柱（空間：中心鄉鎮 + 最近的 k 個鄉鎮；
+時間：長度不超過上限的連續區間），蒙地卡羅顯著性檢定分散到多個行程平行執行
+
+使用方式:
+    python src/scan_statistic.py --start 2015-06-01 --end 2015-12-31 --counties 高雄市,臺南市
+    python src/scan_statistic.py --start 2015-06-01 --end 2015-12-31 --unit week --replicates 999
+"""
+
+import sys
+import io
+
+# 設定 Windows 終端機 UTF-8 編碼
+if sys.platform == 'win32':
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='replace')
+    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8', errors='replace')
+
+import argparse
+import time
+from datetime import datetime
+
+import numpy as np
+
+from case_codes import canonical_county
+from geometry import load_township_centroids
+from monte_carlo import positive_int, run_replicates
+from publish import PROCESSED_DIR, atomic_write_json, load_published_arrays, read_manifest
+
+CLUSTERS_FILE = PROCESSED_DIR / "scan_clusters.json"
+
+
+def haversine_matrix(lon, lat):
+    """兩兩之間的大圓距離（公里）"""
+    lon = np.radians(lon)
+    lat = np.radians(lat)
+    dlon = lon[:, None] - lon[None, :]
+    dlat = lat[:, None] - lat[None, :]
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat[:, None]) * np.cos(lat[None, :]) * np.sin(dlon / 2) ** 2
+    return 6371.0 * 2 * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def neighbour_lists(lon, lat, max_neighbours=10, max_radius_km=10.0):
+    """
+    每個中心鄉鎮依距離排序的鄰近清單（含自己）
+    回傳 (鄰近索引 n×K, 距離 n×K, 有效遮罩 n×K)；超過半徑的位置標記為無效
+    """
+    dist = haversine_matrix(lon, lat)
+    k = min(max_neighbours, len(lon))
+    order = np.argsort(dist, axis=1, kind='stable')[:, :k]
+    radius = np.take_along_axis(dist, order, axis=1)
+    valid = radius <= max_radius_km
+    valid[:, 0] = True
+    return order, radius, valid
+
+
+def _llr(observed, expected, total):
+    """卜瓦松近似的對數概似比（只計算觀察值高於期望值的圓柱）"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        inside = observed * np.log(observed / expected)
+        outside = (total - observed) * np.log((total - observed) / (total - expected))
+        llr = np.where(observed > expected, inside + np.nan_to_num(outside), 0.0)
+    return np.nan_to_num(llr)
+
+
+def scan(counts, order, valid, max_length, prospective=False, keep_best=False):
+    """
+    對所有圓柱計算對數概似比
+    counts 為 區域 × 時間 的病例數矩陣
+    keep_best 為 True 時另外回傳每個 (中心, k) 的最佳時間區間，用於列出次要群聚
+    """
+    total = counts.sum()
+    n_units = counts.shape[1]
+    zone_totals = counts.sum(axis=1)
+    time_totals = np.concatenate([[0], np.cumsum(counts.sum(axis=0))])
+
+    # 圓柱的空間部分：沿鄰近清單累加（中心 × k × 時間）
+    cylinder = np.cumsum(counts[order], axis=1)
+    cylinder_cum = np.concatenate([np.zeros(cylinder.shape[:2] + (1,)), np.cumsum(cylinder, axis=2)], axis=2)
+    space_totals = np.cumsum(zone_totals[order], axis=1)
+
+    best = 0.0
+    best_llr = np.zeros(order.shape) if keep_best else None
+    best_window = np.zeros(order.shape + (2,), dtype=np.int64) if keep_best else None
+
+    for length in range(1, min(max_length, n_units) + 1):
+        if prospective:
+            starts = np.array([n_units - length])
+        else:
+            starts = np.arange(0, n_units - length + 1)
+        ends = starts + length
+        observed = cylinder_cum[:, :, ends] - cylinder_cum[:, :, starts]
+        window_totals = time_totals[ends] - time_totals[starts]
+        expected = space_totals[:, :, None] * window_totals[None, None, :] / total
+        llr = _llr(observed, expected, total)
+        llr[~valid] = 0
+        best = max(best, float(llr.max()))
+        if keep_best:
+            idx = llr.argmax(axis=2)
+            value = np.take_along_axis(llr, idx[:, :, None], axis=2)[:, :, 0]
+            better = value > best_llr
+            best_llr[better] = value[better]
+            best_window[better, 0] = starts[idx[better]]
+            best_window[better, 1] = ends[idx[better]] - 1
+
+    if keep_best:
+        return best, best_llr, best_window
+    return best
+
+
+def _worker_state(counts, order, valid, max_length, prospective):
+    """子行程共用的資料：把計數矩陣展開為逐例的區域與時間標籤"""
+    zones, units = np.nonzero(counts)
+    repeats = counts[zones, units].astype(np.int64)
+    return {
+        'shape': counts.shape,
+        'case_zone': np.repeat(zones, repeats),
+        'case_time': np.repeat(units, repeats),
+        'order': order, 'valid': valid, 'max_length': max_length, 'prospective': prospective,
+    }
+
+
+def _simulate(state, key, rng, n):
+    """在子行程中執行一批排列模擬，回傳每次模擬的最大對數概似比"""
+    n_zones, n_units = state['shape']
+    case_zone = state['case_zone']
+    results = np.empty(n)
+    for i in range(n):
+        # 打亂病例的時間標籤：保留各區域與各時間的總數（排列模型的虛無假設）
+        case_time = rng.permutation(state['case_time'])
+        counts = np.bincount(case_zone * n_units + case_time, minlength=n_zones * n_units).reshape(n_zones, n_units)
+        results[i] = scan(counts, state['order'], state['valid'], state['max_length'], state['prospective'])
+    return results
+
+
+def monte_carlo(counts, order, valid, max_length, prospective=False, replicates=999, workers=None, seed=2015):
+    """以行程池平行執行蒙地卡羅排列檢定"""
+    return run_replicates(_worker_state, (counts, order, valid, max_length, prospective), _simulate,
+                          replicates, workers, seed)
+
+
+def _select_units(arrays, start, end, unit):
+    """依時間單位切出期間，回傳 (鄉鎮 × 時間單位 矩陣, 時間標籤)"""
+    header = arrays['header']
+    origin = np.datetime64(header['start_date'], 'D')
+    first = int((np.datetime64(start, 'D') - origin).astype(int))
+    last = int((np.datetime64(end, 'D') - origin).astype(int))
+    first = max(first, 0)
+    last = min(last, header['n_days'] - 1)
+    daily = arrays['daily'][:, first:last + 1].astype(np.int64)
+    if unit == 'day':
+        return daily, (origin + np.arange(first, last + 1)).astype(str)
+    index = arrays['week_index'][first:last + 1]
+    boundaries = np.flatnonzero(np.r_[True, index[1:] != index[:-1]])
+    return np.add.reduceat(daily, boundaries, axis=1), arrays['week_labels'][index[boundaries]]
+
+
+def run_scan(start, end, counties=None, unit='day', max_length=None, max_neighbours=10,
+             max_radius_km=10.0, replicates=999, prospective=False, workers=None, max_clusters=10):
+    """執行一次季節性時空掃描，回傳群聚列表（依對數概似比排序，空間不重疊）"""
+    started = time.perf_counter()
+    arrays = load_published_arrays('timeseries.npz')
+    header = arrays['header']
+    if max_length is None:
+        max_length = 28 if unit == 'day' else 4
+
+    # 鄉鎮中心點（只保留有中心點、且屬於指定縣市的鄉鎮）
+    centroids = {f"{item['COUNTYNAME']}|{item['TOWNNAME']}": item for item in load_township_centroids()}
+    counties = {canonical_county(name) for name in counties} if counties else None
+    rows, lon, lat = [], [], []
+    for row, (county, township) in enumerate(header['townships']):
+        item = centroids.get(f"{county}|{township}")
+        if item is None or (counties and county not in counties):
+            continue
+        rows.append(row)
+        lon.append(item['lon'])
+        lat.append(item['lat'])
+    if not rows:
+        raise ValueError("沒有可用的鄉鎮（請確認已執行幾何資料步驟且縣市名稱正確）")
+    rows = np.array(rows)
+
+    daily, labels = _select_units(arrays, start, end, unit)
+    counts = daily[rows]
+    total = int(counts.sum())
+    if total == 0:
+        raise ValueError("指定期間沒有病例")
+
+    order, radius, valid = neighbour_lists(np.array(lon), np.array(lat), max_neighbours, max_radius_km)
+    observed_max, best_llr, best_window = scan(counts, order, valid, max_length, prospective, keep_best=True)
+    print(f"掃描 {len(rows)} 個鄉鎮 × {counts.shape[1]} 個時間單位，共 {total} 例，最大對數概似比 {observed_max:.2f}")
+
+    simulated = monte_carlo(counts, order, valid, max_length, prospective, replicates, workers)
+
+    # 依對數概似比挑出空間不重疊的群聚
+    clusters = []
+    used = set()
+    for flat in np.argsort(-best_llr, axis=None, kind='stable'):
+        center, k = np.unravel_index(flat, best_llr.shape)
+        llr = float(best_llr[center, k])
+        if llr <= 0 or len(clusters) >= max_clusters:
+            break
+        if not valid[center, k]:
+            continue
+        members = order[center, :k + 1]
+        if used.intersection(members.tolist()):
+            continue
+        used.update(members.tolist())
+        first, last = best_window[center, k]
+        observed = int(counts[members, first:last + 1].sum())
+        expected = float(counts[members].sum() * counts[:, first:last + 1].sum() / total)
+        clusters.append({
+            '中心': '|'.join(header['townships'][rows[center]]),
+            '鄉鎮': ['|'.join(header['townships'][rows[m]]) for m in members],
+            '半徑公里': round(float(radius[center, k]), 2),
+            '開始': str(labels[first]),
+            '結束': str(labels[last]),
+            '觀察值': observed,
+            '期望值': round(expected, 2),
+            '相對風險': round(observed / expected, 2) if expected else None,
+            '對數概似比': round(llr, 3),
+            'p值': round(float((1 + np.sum(simulated >= llr)) / (replicates + 1)), 4),
+        })
+
+    elapsed = time.perf_counter() - started
+    print(f"找到 {len(clusters)} 個群聚（{replicates} 次模擬，{elapsed:.1f} 秒）")
+    return {
+        'params': {
+            'start': start, 'end': end, 'counties': sorted(counties) if counties else [],
+            'unit': unit, 'max_length': max_length, 'max_neighbours': max_neighbours,
+            'max_radius_km': max_radius_km, 'replicates': replicates, 'prospective': prospective,
+        },
+        'total_cases': total,
+        'clusters': clusters,
+        'seconds': round(elapsed, 1),
+        'data_version': (read_manifest() or {}).get('version'),
+        'last_updated': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="時空排列掃描統計")
+    parser.add_argument('--start', required=True, help="開始日期 YYYY-MM-DD")
+    parser.add_argument('--end', required=True, help="結束日期 YYYY-MM-DD")
+    parser.add_argument('--counties', default='', help="縣市（逗號分隔，預設全部）")
+    parser.add_argument('--unit', choices=['day', 'week'], default='day', help="時間單位")
+    parser.add_argument('--max-length', type=int, default=None, help="時間區間最大長度（時間單位數）")
+    parser.add_argument('--max-neighbours', type=int, default=10, help="每個圓柱最多包含的鄉鎮數")
+    parser.add_argument('--max-radius', type=float, default=10.0, help="圓柱最大半徑（公里）")
+    parser.add_argument('--replicates', type=positive_int, default=999, help="蒙地卡羅模擬次數")
+    parser.add_argument('--prospective', action='store_true', help="只掃描結束於最後一個時間單位的群聚")
+    parser.add_argument('--workers', type=positive_int, default=None, help="平行行程數")
+    args = parser.parse_args()
+
+    counties = [name.strip() for name in args.counties.split(',') if name.strip()]
+    result = run_scan(args.start, args.end, counties, args.unit, args.max_length, args.max_neighbours,
+                      args.max_radius, args.replicates, args.prospective, args.workers)
+    atomic_write_json(CLUSTERS_FILE, result)
+    print(f"結果已儲存至: {CLUSTERS_FILE}")
+    for cluster in result['clusters'][:5]:
+        print(f"  {cluster['中心']} {cluster['開始']}~{cluster['結束']} "
+              f"觀察 {cluster['觀察值']} / 期望 {cluster['期望值']}，p = {cluster['p值']}")
+
+
+if __name__ == "__main__":
+    main()
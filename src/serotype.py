@@ -0,0 +1,110 @@
+"""
+血清型時間序列與共同流行分析
+在已編碼的整數陣列上以 bincount 計算 血清型 × 縣市 × 年 與 血清型 × 縣市 × 流行病學週，
+不需對 DataFrame 另做 groupby；並計算主要血清型、共同流行型數、多樣性指數與型別轉換等指標
+"""
+
+import json
+
+import numpy as np
+
+from case_codes import SEROTYPES, compact_dtype
+from serotype_metrics import MIN_CASES, MIN_SHARE, co_circulation
+
+
+def build_serotype_counts(codes, bins):
+    """
+    以兩次 bincount 建立 血清型 × 縣市 × 年 與 血清型 × 縣市 × 週 的計數
+    回傳 (年度立方體, 週立方體, 年份列表)
+    """
+    tables = codes['tables']
+    n_types = len(SEROTYPES)
+    n_counties = len(tables['counties'])
+    year_labels = bins['year_labels']
+    n_years = len(year_labels)
+    n_weeks = len(bins['week_labels'])
+
+    sero = codes['serotype'].astype(np.int64)
+    county = codes['county'].astype(np.int64)
+    year = bins['year_index'][codes['day']].astype(np.int64)
+    week = bins['week_index'][codes['day']].astype(np.int64)
+
+    yearly = np.bincount((sero * n_counties + county) * n_years + year,
+                         minlength=n_types * n_counties * n_years).reshape(n_types, n_counties, n_years)
+    weekly = np.bincount((sero * n_counties + county) * n_weeks + week,
+                         minlength=n_types * n_counties * n_weeks).reshape(n_types, n_counties, n_weeks)
+    return yearly, weekly.astype(compact_dtype(weekly.max() if weekly.size else 0)), [int(y) for y in year_labels]
+
+
+def _period_rows(counts, labels, label_key):
+    """把 血清型 × 期間 的計數轉為 JSON 列（含共同流行指標與主要型轉換）"""
+    indicators = co_circulation(counts)
+    dominant = indicators['dominant']
+    # 主要型轉換：與前一個有已分型病例的期間相比，主要血清型改變
+    previous = np.full(len(dominant), -1)
+    last = -1
+    for i, value in enumerate(dominant):
+        previous[i] = last
+        if value >= 0:
+            last = value
+
+    rows = []
+    for i, label in enumerate(labels):
+        total = int(counts[:, i].sum())
+        if total == 0:
+            continue
+        row = {label_key: label}
+        row.update({name: int(counts[s, i]) for s, name in enumerate(SEROTYPES)})
+        row.update({
+            '主要血清型': SEROTYPES[dominant[i]] if dominant[i] >= 0 else None,
+            '主要型比例': round(float(indicators['dominant_share'][i]) * 100, 1),
+            '共同流行型數': int(indicators['circulating'][i]),
+            '多樣性指數': round(float(indicators['diversity'][i]), 3),
+            '型別轉換': bool(dominant[i] >= 0 and previous[i] >= 0 and dominant[i] != previous[i]),
+        })
+        rows.append(row)
+    return rows
+
+
+def summarize_serotypes(yearly, weekly, years, week_labels, tables, recent_weeks=12):
+    """JSON 輸出用：全國與各縣市的逐年血清型、最近幾週的全國血清型"""
+    national = yearly.sum(axis=1)
+    by_county = {}
+    for c, name in enumerate(tables['counties']):
+        rows = _period_rows(yearly[:, c], years, '年份')
+        if rows:
+            by_county[name] = rows
+
+    national_weekly = weekly.sum(axis=1, dtype=np.int64)
+    last_week = int(np.flatnonzero(national_weekly.sum(axis=0))[-1]) if national_weekly.any() else 0
+    first_week = max(last_week - recent_weeks + 1, 0)
+    recent = _period_rows(national_weekly[:, first_week:last_week + 1],
+                          [str(label) for label in week_labels[first_week:last_week + 1]], '週別')
+
+    yearly_rows = _period_rows(national, years, '年份')
+    latest = yearly_rows[-1] if yearly_rows else {}
+    print(f"血清型: 最近一年 ({latest.get('年份')}) 主要為 {latest.get('主要血清型')}，"
+          f"共同流行 {latest.get('共同流行型數')} 型")
+
+    return {
+        'serotypes': list(SEROTYPES),
+        'thresholds': {'min_share': MIN_SHARE, 'min_cases': MIN_CASES},
+        'yearly': yearly_rows,
+        'by_county': by_county,
+        'recent_weeks': recent,
+    }
+
+
+def serotype_writer(weekly, tables, bins):
+    """回傳寫入 serotype.npz 的函數（血清型 × 縣市 × 週，供 /api/serotype 查詢）"""
+    header = json.dumps({
+        'serotypes': list(SEROTYPES),
+        'counties': tables['counties'],
+        'thresholds': {'min_share': MIN_SHARE, 'min_cases': MIN_CASES},
+    }, ensure_ascii=False)
+
+    def write(path):
+        with open(path, 'wb') as f:
+            np.savez_compressed(f, header=np.array(header), weekly=weekly, week_labels=bins['week_labels'])
+
+    return write
@@ -0,0 +1,28 @@
+"""
+血清型共同流行指標
+分析階段（src/serotype.py）與網站的即時查詢（/api/serotype）共用同一份定義；
+只依賴 numpy，網站在精簡模式下載入時不會連帶載入 pandas
+"""
+
+import numpy as np
+
+# 共同流行的門檻：佔已分型病例的比例與最少病例數
+MIN_SHARE = 0.1
+MIN_CASES = 3
+
+
+def co_circulation(counts, min_share=MIN_SHARE, min_cases=MIN_CASES):
+    """
+    共同流行指標（counts 第一軸為血清型，最後一列為未分型，不納入計算）
+    回傳 dict：主要血清型代碼（無已分型病例為 -1）、主要型比例、共同流行型數、Simpson 多樣性指數
+    """
+    typed = np.asarray(counts[:-1], dtype=np.float64)
+    total = typed.sum(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        share = np.where(total > 0, typed / total, 0.0)
+    return {
+        'dominant': np.where(total > 0, np.argmax(typed, axis=0), -1),
+        'dominant_share': share.max(axis=0),
+        'circulating': ((share >= min_share) & (typed >= min_cases)).sum(axis=0),
+        'diversity': np.where(total > 0, 1 - (share ** 2).sum(axis=0), 0.0),
+    }
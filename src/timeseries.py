@@ -0,0 +1,102 @@
+"""
+鄉鎮 × 日 病例數時間序列立方體
+以一次 bincount 建立所有鄉鎮的逐日病例數，並預先計算疾管署流行病學週與月份的分組，
+網站端只需切片與 np.add.reduceat 即可重新分組，不必再處理日期
+"""
+
+import json
+
+import numpy as np
+
+from case_codes import compact_dtype
+
+
+def epiweek(days):
+    """
+    計算流行病學週（疾管署採用與 MMWR 相同的定義：週日至週六，
+    第 1 週為當年第一個至少有 4 天落在新年度的週）
+    days 為 datetime64[D] 陣列，回傳 (週起始日, 流行病學年, 週次)
+    """
+    days = np.asarray(days, dtype='datetime64[D]')
+    # 1970-01-01 為星期四，(n + 4) % 7 讓星期日為 0
+    weekday = (days.astype(np.int64) + 4) % 7
+    week_start = days - weekday.astype('timedelta64[D]')
+    wednesday = week_start + np.timedelta64(3, 'D')
+    epi_year = wednesday.astype('datetime64[Y]')
+    week = (wednesday - epi_year.astype('datetime64[D]')).astype(np.int64) // 7 + 1
+    return week_start, epi_year.astype(np.int64) + 1970, week
+
+
+def _group_index(labels):
+    """把逐日的分組標籤轉為 (每日的分組序號, 分組標籤列表)，標籤需已依時間排序"""
+    change = np.empty(len(labels), dtype=bool)
+    change[0] = True
+    change[1:] = labels[1:] != labels[:-1]
+    index = np.cumsum(change) - 1
+    return index.astype(np.int32), labels[change]
+
+
+def calendar_bins(start_date, n_days):
+    """預先計算每一天所屬的流行病學週與月份分組"""
+    days = np.datetime64(start_date, 'D') + np.arange(n_days)
+    _, epi_year, week = epiweek(days)
+    week_labels = np.char.add(np.char.add(epi_year.astype(str), '-W'), np.char.zfill(week.astype(str), 2))
+    month_labels = days.astype('datetime64[M]').astype(str)
+    week_index, week_names = _group_index(week_labels)
+    month_index, month_names = _group_index(month_labels)
+    year_index, year_names = _group_index(days.astype('datetime64[Y]').astype(str))
+    return {
+        'week_index': week_index, 'week_labels': week_names,
+        'month_index': month_index, 'month_labels': month_names,
+        'year_index': year_index, 'year_labels': year_names,
+    }
+
+
+def build_daily_cube(codes):
+    """以一次 bincount 建立 鄉鎮 × 日 的病例數矩陣"""
+    tables = codes['tables']
+    n_towns = len(tables['townships'])
+    n_days = tables['n_days']
+    flat = codes['township'].astype(np.int64) * n_days + codes['day']
+    counts = np.bincount(flat, minlength=n_towns * n_days).reshape(n_towns, n_days)
+    return counts.astype(compact_dtype(counts.max() if counts.size else 0))
+
+
+def timeseries_header(tables):
+    """代碼表（以 JSON 字串存放於 npz 中，不需 pickle 即可讀取）"""
+    return json.dumps({
+        'start_date': tables['start_date'],
+        'n_days': tables['n_days'],
+        'counties': tables['counties'],
+        'townships': tables['townships'],
+    }, ensure_ascii=False)
+
+
+def timeseries_writer(codes, cube, bins):
+    """回傳寫入 timeseries.npz 的函數（交給 publish_analysis 寫入版本目錄）"""
+    tables = codes['tables']
+
+    def write(path):
+        with open(path, 'wb') as f:
+            np.savez_compressed(
+                f,
+                header=np.array(timeseries_header(tables)),
+                daily=cube,
+                township_county=tables['township_county'],
+                **bins
+            )
+
+    return write
+
+
+def summarize_cube(codes, cube):
+    """JSON 輸出用的摘要（完整資料透過 /api/timeseries 取得）"""
+    tables = codes['tables']
+    nonzero_days = int(np.count_nonzero(cube.sum(axis=0)))
+    print(f"時間序列立方體: {len(tables['townships'])} 個鄉鎮 × {tables['n_days']} 天，"
+          f"{nonzero_days} 天有病例")
+    return {
+        'start_date': tables['start_date'],
+        'n_days': tables['n_days'],
+        'n_townships': len(tables['townships']),
+    }
@@ -0,0 +1,71 @@
+"""
+村里層級病例數（稀疏儲存）
+全國數千個村里 × 數十年絕大多數為 0，只儲存非零的 (村里, 年) 組合。
+村里依 (鄉鎮, 村里) 排序，以兩層 CSR 索引：
+  village_ptr[t] : village_ptr[t+1]  鄉鎮 t 的村里範圍
+  entry_ptr[v] : entry_ptr[v+1]      村里 v 的非零年份範圍
+查詢單一鄉鎮只需兩次切片，不必展開整張表
+"""
+
+import json
+
+import numpy as np
+import pandas as pd
+
+UNKNOWN = '未知'
+
+
+def build_village_counts(df, codes):
+    """
+    一次編碼 (鄉鎮, 村里, 年) 並計數
+    回傳 (CSR 陣列 dict, 村里名稱列表)
+    """
+    tables = codes['tables']
+    n_townships = len(tables['townships'])
+    villages = df['居住村里'].fillna(UNKNOWN).astype(str).str.replace('台', '臺', regex=False).str.strip()
+    villages = villages.mask(villages == '', UNKNOWN)
+
+    # 村里鍵值 = 鄉鎮代碼 + 村里名稱，排序後同一鄉鎮的村里相鄰
+    village_codes, village_keys = pd.factorize(
+        pd.Series(codes['township']).astype(str).str.zfill(6) + '|' + villages.reset_index(drop=True),
+        sort=True
+    )
+    village_township = np.array([int(key.split('|', 1)[0]) for key in village_keys], dtype=np.int32)
+    village_names = [key.split('|', 1)[1] for key in village_keys]
+    n_villages = len(village_names)
+
+    start = np.datetime64(tables['start_date'], 'D')
+    years = (start + codes['day']).astype('datetime64[Y]').astype(np.int64) + 1970
+    first_year = int(years.min())
+    n_years = int(years.max()) - first_year + 1
+
+    flat = village_codes.astype(np.int64) * n_years + (years - first_year)
+    keys, counts = np.unique(flat, return_counts=True)
+    entry_village = keys // n_years
+
+    village_ptr = np.searchsorted(village_township, np.arange(n_townships + 1)).astype(np.int32)
+    entry_ptr = np.searchsorted(entry_village, np.arange(n_villages + 1)).astype(np.int32)
+
+    print(f"村里層級: {n_villages} 個村里，{len(keys)} 組非零 (村里, 年)，"
+          f"密度 {len(keys) / max(n_villages * n_years, 1):.1%}")
+
+    return {
+        'village_ptr': village_ptr,
+        'entry_ptr': entry_ptr,
+        'entry_year': (keys % n_years + first_year).astype(np.int16),
+        'entry_count': counts.astype(np.int32),
+    }, village_names
+
+
+def villages_writer(arrays, village_names, tables):
+    """回傳寫入 villages.npz 的函數"""
+    header = json.dumps({
+        'townships': tables['townships'],
+        'villages': village_names,
+    }, ensure_ascii=False)
+
+    def write(path):
+        with open(path, 'wb') as f:
+            np.savez_compressed(f, header=np.array(header), **arrays)
+
+    return write
@@ -24,8 +24,13 @@ if not analysis_file.exists():
     print("=" * 50)
     sys.exit(1)
 
+# --lean：精簡服務模式，只讀取已發布的分析版本（見 website/README.md）
+if '--lean' in sys.argv[1:]:
+    os.environ['DENGUE_LEAN'] = '1'
+
 # 切換到 website 目錄並啟動 Flask
 os.chdir(Path(__file__).parent / "website")
+sys.path.insert(0, str(Path(__file__).parent / "website"))
 
 print("=" * 50)
 print("台灣登革熱流行病學監測系統")
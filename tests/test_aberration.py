@@ -0,0 +1,105 @@
+"""
+疫情異常偵測（aberration.py）的測試
+EARS C1 / C2 / C3 與逐日手算結果比對；Farrington 式基線以固定亂數種子的序列加入已知的爆發週檢驗
+"""
+
+import math
+import statistics
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from aberration import detect_aberrations, ears, farrington  # noqa: E402
+
+SERIES = [0, 1, 0, 2, 1, 0, 3, 9, 2, 1, 0, 7, 12, 4, 0, 1]
+
+
+def reference_ears(x, min_sd=0.5):
+    """逐日以 statistics 模組手算 EARS：基線為前 7 天（C2 間隔 2 天），標準差為樣本標準差"""
+    c1, c2 = [], []
+    for t, value in enumerate(x):
+        for out, lag in ((c1, 0), (c2, 2)):
+            lo, hi = t - lag - 7, t - lag
+            if lo < 0:
+                out.append(0.0)
+                continue
+            baseline = x[lo:hi]
+            sd = max(statistics.stdev(baseline), min_sd)
+            out.append((value - statistics.mean(baseline)) / sd)
+    excess = [max(value - 1, 0) for value in c2]
+    c3 = [sum(excess[max(t - 2, 0):t + 1]) for t in range(len(x))]
+    return c1, c2, c3
+
+
+def test_ears_hand_computed_value():
+    stats = ears(np.array([SERIES]))
+
+    # 第 8 天（9 例）：前 7 天平均 1、樣本變異數 8/6，C1 = 8 / sqrt(4/3) = 4·sqrt(3)
+    assert stats['C1'][0, 7] == pytest.approx(4 * math.sqrt(3), rel=1e-6)
+    # 基線不足 7 天的日子（C2 需 9 天）統計量為 0
+    assert np.all(stats['C1'][0, :7] == 0)
+    assert np.all(stats['C2'][0, :9] == 0)
+
+
+def test_ears_matches_reference():
+    daily = np.array([SERIES, SERIES[::-1], [0] * len(SERIES)])
+
+    stats = ears(daily)
+
+    for row, x in enumerate(daily.tolist()):
+        for name, expected in zip(('C1', 'C2', 'C3'), reference_ears(x)):
+            assert np.allclose(stats[name][row], expected, rtol=1e-5, atol=1e-5), (name, row)
+    # 全為 0 的鄉鎮套用標準差下限後仍為 0，不會出現無限大
+    assert np.all(stats['C1'][2] == 0) and np.all(np.isfinite(stats['C3']))
+
+
+def test_farrington_flags_known_outbreak():
+    rng = np.random.default_rng(32)
+    n_towns, n_weeks = 4, 7 * 52
+    season = 6 + 4 * np.sin(2 * np.pi * np.arange(n_weeks) / 52)
+    weekly = rng.poisson(season, size=(n_towns, n_weeks))
+    outbreak = np.arange(n_weeks - 6, n_weeks - 2)
+    weekly[1, outbreak] += 40
+
+    expected, upper, alarm = farrington(weekly)
+
+    assert alarm[1, outbreak].all()
+    # 基線不足 5 年的週不發出警示，其他鄉鎮的誤報很少
+    assert not alarm[:, :5 * 52 + 3].any()
+    others = np.delete(alarm, 1, axis=0)[:, 5 * 52 + 3:]
+    assert others.mean() < 0.05
+    # 期望值為過去 5 年、同週前後 3 週共 35 週的平均
+    week = n_weeks - 1
+    past = [weekly[0, week - 52 * k + j] for k in range(1, 6) for j in range(-3, 4)]
+    assert expected[0, week] == pytest.approx(np.mean(past), rel=1e-5)
+    assert np.all(upper[:, 5 * 52 + 3:] >= expected[:, 5 * 52 + 3:])
+
+
+def test_farrington_requires_recent_cases():
+    weekly = np.zeros((1, 6 * 52), dtype=np.int64)
+    weekly[0, -1] = 4
+
+    _, _, alarm = farrington(weekly)
+
+    # 基線全為 0，但近 4 週累計未超過 5 例，不發出警示
+    assert not alarm.any()
+    weekly[0, -2] = 3
+    assert farrington(weekly)[2][0, -1]
+
+
+def test_detect_aberrations_ignores_days_without_cases():
+    rng = np.random.default_rng(320)
+    n_days = 6 * 365
+    daily = rng.poisson(0.3, size=(3, n_days))
+    daily[2, 1000:1004] = [15, 0, 20, 18]
+    week_index = (np.arange(n_days) // 7).astype(np.int32)
+
+    alerts = detect_aberrations(daily, week_index)
+
+    assert np.all(alerts['ears_counts'] > 0)
+    assert {1000, 1002, 1003} <= set(alerts['ears_days'][alerts['ears_rows'] == 2].tolist())
+    assert np.array_equal(alerts['ears_counts'], daily[alerts['ears_rows'], alerts['ears_days']])
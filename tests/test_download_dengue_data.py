@@ -0,0 +1,212 @@
+"""
+download_from_url 對本機 HTTP 測試伺服器的下載測試
+涵蓋：完整下載（.part → os.replace）、304 條件式下載、中斷後以 Range / If-Range 續傳、
+內容變更時 If-Range 不符改為完整下載，以及沒有本地檔案卻收到 304 的情況；
+fetch_resources 超過總時限時停止進行中的下載，回傳後不再有背景執行緒寫入資料目錄
+"""
+
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+import download_dengue_data  # noqa: E402
+from download_dengue_data import DOWNLOAD_CACHE_NAME, download_from_url, fetch_resources  # noqa: E402
+
+
+def make_csv(rows, tag='A'):
+    lines = ['發病日期,居住縣市,確定病例數'] + [f'2015-08-{i % 28 + 1:02d},臺南市{tag},1' for i in range(rows)]
+    return ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+class StandIn:
+    """測試伺服器的狀態：目前的內容與 ETag、下一次要中斷的位置、收到的請求標頭"""
+
+    def __init__(self):
+        self.body = make_csv(2000)
+        self.etag = '"v1"'
+        self.drop_after = None
+        self.stall_after = None
+        self.always_304 = False
+        self.requests = []
+
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            state.requests.append(dict(self.headers))
+            if state.always_304 or self.headers.get('If-None-Match') == state.etag:
+                self.send_response(304)
+                self.send_header('ETag', state.etag)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+
+            body, status = state.body, 200
+            range_header = self.headers.get('Range')
+            if range_header and self.headers.get('If-Range') in (None, state.etag):
+                start = int(range_header.split('=', 1)[1].rstrip('-'))
+                body, status = state.body[start:], 206
+
+            self.send_response(status)
+            self.send_header('ETag', state.etag)
+            self.send_header('Content-Type', 'text/csv')
+            self.send_header('Content-Length', str(len(body)))
+            if status == 206:
+                self.send_header('Content-Range', f'bytes {start}-{len(state.body) - 1}/{len(state.body)}')
+            self.end_headers()
+
+            if state.stall_after is not None and self.path.startswith('/stall'):
+                # 送出部分內容後停住不再傳送，模擬卡住的連線
+                self.wfile.write(body[:state.stall_after])
+                self.wfile.flush()
+                time.sleep(5)
+                return
+
+            if state.drop_after is not None:
+                # 送出部分內容後直接斷線，模擬傳輸中斷
+                self.wfile.write(body[:state.drop_after])
+                self.wfile.flush()
+                state.drop_after = None
+                self.close_connection = True
+                return
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+@pytest.fixture
+def server():
+    state = StandIn()
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(state))
+    httpd.daemon_threads = True
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    state.base = f'http://127.0.0.1:{httpd.server_port}'
+    state.url = f'{state.base}/dengue.csv'
+    yield state
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(download_dengue_data, '_backoff_delay', lambda attempt: 0)
+
+
+def read_cache(data_dir):
+    return json.loads((data_dir / DOWNLOAD_CACHE_NAME).read_text(encoding='utf-8'))
+
+
+def test_full_download_replaces_part_file(server, tmp_path):
+    path = download_from_url(server.url, data_dir=tmp_path, chunk_size=1024)
+
+    assert path == tmp_path / 'dengue.csv'
+    assert path.read_bytes() == server.body
+    assert not (tmp_path / 'dengue.csv.part').exists()
+    entry = read_cache(tmp_path)[server.url]
+    assert entry['etag'] == '"v1"'
+    assert entry['rows'] == 2000
+    assert 'partial_validator' not in entry
+
+
+def test_unchanged_file_uses_304(server, tmp_path):
+    download_from_url(server.url, data_dir=tmp_path)
+    mtime = (tmp_path / 'dengue.csv').stat().st_mtime_ns
+
+    path = download_from_url(server.url, data_dir=tmp_path)
+
+    assert path == tmp_path / 'dengue.csv'
+    assert server.requests[-1]['If-None-Match'] == '"v1"'
+    assert (tmp_path / 'dengue.csv').stat().st_mtime_ns == mtime
+
+
+def test_changed_file_is_downloaded_again(server, tmp_path):
+    download_from_url(server.url, data_dir=tmp_path)
+    server.body, server.etag = make_csv(500, tag='B'), '"v2"'
+
+    path = download_from_url(server.url, data_dir=tmp_path)
+
+    assert path.read_bytes() == server.body
+    assert read_cache(tmp_path)[server.url]['rows'] == 500
+
+
+def test_interrupted_download_resumes_with_range(server, tmp_path):
+    server.drop_after = 10_000
+
+    path = download_from_url(server.url, data_dir=tmp_path, chunk_size=1024, max_retries=1)
+
+    assert path.read_bytes() == server.body
+    resumed = server.requests[-1]
+    assert resumed['Range'].startswith('bytes=')
+    assert int(resumed['Range'][6:-1]) > 0
+    assert resumed['If-Range'] == '"v1"'
+    assert read_cache(tmp_path)[server.url]['rows'] == 2000
+
+
+def test_interrupted_download_keeps_part_file(server, tmp_path):
+    server.drop_after = 10_000
+
+    assert download_from_url(server.url, data_dir=tmp_path, chunk_size=1024, max_retries=0) is None
+
+    assert not (tmp_path / 'dengue.csv').exists()
+    assert (tmp_path / 'dengue.csv.part').exists()
+    assert read_cache(tmp_path)[server.url]['partial_validator'] == '"v1"'
+
+
+def test_if_range_mismatch_restarts_download(server, tmp_path):
+    server.drop_after = 10_000
+    download_from_url(server.url, data_dir=tmp_path, chunk_size=1024, max_retries=0)
+    server.body, server.etag = make_csv(300, tag='B'), '"v2"'
+
+    path = download_from_url(server.url, data_dir=tmp_path, chunk_size=1024)
+
+    # If-Range 與新的 ETag 不符，伺服器回傳完整內容，暫存檔不可被接在後面
+    assert server.requests[-1]['If-Range'] == '"v1"'
+    assert path.read_bytes() == server.body
+    assert read_cache(tmp_path)[server.url]['rows'] == 300
+
+
+def test_304_without_local_file_fails_cleanly(server, tmp_path, capsys):
+    server.always_304 = True
+
+    assert download_from_url(server.url, data_dir=tmp_path) is None
+    assert not (tmp_path / 'dengue.csv').exists()
+    # 明確回報沒有可沿用的檔案，而不是由廣泛的 except 吞掉 TypeError
+    assert '本地沒有可沿用的檔案' in capsys.readouterr().out
+
+
+def test_fetch_resources_stops_downloads_at_deadline(server, tmp_path):
+    server.stall_after = 10_000
+    stalled = f'{server.base}/stall.csv'
+
+    started = time.monotonic()
+    results = fetch_resources([server.url, stalled], data_dir=tmp_path, total_timeout=1, timeout=1)
+    elapsed = time.monotonic() - started
+
+    assert results[server.url] == tmp_path / 'dengue.csv'
+    assert results[stalled] is None
+    # 停止後最多再等一次讀取逾時，不會拖到下一次重試或伺服器斷線
+    assert elapsed < 3.5
+    # 回傳時所有下載執行緒都已結束（閒置的工作執行緒收到結束訊號後隨即離開），
+    # 暫存檔保留供下次續傳且不再被寫入
+    workers = [thread for thread in threading.enumerate() if thread.name.startswith('ThreadPoolExecutor')]
+    for thread in workers:
+        thread.join(timeout=0.2)
+    assert not any(thread.is_alive() for thread in workers)
+    part = tmp_path / 'stall.csv.part'
+    size = part.stat().st_size
+    time.sleep(0.3)
+    assert part.stat().st_size == size
+    assert read_cache(tmp_path)[stalled]['partial_validator'] == '"v1"'
@@ -0,0 +1,80 @@
+"""
+資料更新事件串流（/api/events）的測試：同時訂閱數上限與用戶端斷線後釋放名額
+以 werkzeug 的多執行緒開發伺服器實際連線，與 flask run 的情況相同
+"""
+
+import http.client
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "website"))
+
+import app as web  # noqa: E402
+from werkzeug.serving import make_server  # noqa: E402
+
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setattr(web, 'EVENT_MAX_SUBSCRIBERS', 2)
+    monkeypatch.setattr(web, 'EVENT_KEEPALIVE', 0.1)
+    httpd = make_server('127.0.0.1', 0, web.app, threaded=True)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd.server_port
+    httpd.shutdown()
+
+
+def subscribe(port):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+    conn.request('GET', '/api/events')
+    return conn, conn.getresponse()
+
+
+def disconnect(conn, response):
+    response.close()
+    conn.close()
+
+
+def wait_for_subscribers(count, timeout=5):
+    end = time.monotonic() + timeout
+    while time.monotonic() < end:
+        if web._event_subscribers == count:
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def test_subscribers_are_capped_and_released_on_disconnect(server):
+    first, first_response = subscribe(server)
+    second, second_response = subscribe(server)
+    assert first_response.status == second_response.status == 200
+    assert first_response.read1(64).startswith(b'retry:')
+
+    third, third_response = subscribe(server)
+    assert third_response.status == 503
+    assert third_response.getheader('Retry-After') == str(web.EVENT_POLL_INTERVAL)
+    disconnect(third, third_response)
+
+    # 用戶端斷線後，下一次送出 keepalive 時察覺並釋放名額
+    disconnect(first, first_response)
+    assert wait_for_subscribers(1)
+    fourth, fourth_response = subscribe(server)
+    assert fourth_response.status == 200
+
+    disconnect(second, second_response)
+    disconnect(fourth, fourth_response)
+    assert wait_for_subscribers(0)
+
+
+def test_version_endpoint(server):
+    conn = http.client.HTTPConnection('127.0.0.1', server, timeout=5)
+    conn.request('GET', '/api/version')
+    response = conn.getresponse()
+
+    # 沒有已發布的分析資料時回應 404
+    assert response.status in (200, 404)
+    conn.close()
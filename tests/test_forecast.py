@@ -0,0 +1,119 @@
+"""
+批次 IRLS 與各鄉鎮病例數預測（models/forecast.py）的測試
+IRLS 與有解析解的 Poisson 迴歸比對，並檢查估計期間沒有病例或資料過短時回傳全為 0 的預測
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from models.forecast import HORIZON, fit_poisson, run_forecast  # noqa: E402
+from timeseries import build_daily_cube, calendar_bins  # noqa: E402
+
+
+def test_irls_matches_closed_form_poisson_fit():
+    # 截距 + 一個 0/1 變數：Poisson MLE 為 β0 = log(ȳ0)、β1 = log(ȳ1 / ȳ0)
+    rng = np.random.default_rng(49)
+    n, T = 5, 120
+    group = (np.arange(T) % 3 == 0).astype(np.float64)
+    X = np.broadcast_to(np.column_stack([np.ones(T), group]), (n, T, 2)).copy()
+    rates = np.exp(np.log(rng.uniform(0.5, 20, n))[:, None] + np.log(rng.uniform(0.3, 3, n))[:, None] * group)
+    y = rng.poisson(rates).astype(np.float64)
+
+    beta, mu, iterations = fit_poisson(X, y, ridge=0, tol=1e-10)
+
+    mean0 = y[:, group == 0].mean(axis=1)
+    mean1 = y[:, group == 1].mean(axis=1)
+    assert np.allclose(beta[:, 0], np.log(mean0), atol=1e-8)
+    assert np.allclose(beta[:, 1], np.log(mean1 / mean0), atol=1e-8)
+    assert np.allclose(mu[:, group == 0], mean0[:, None])
+    assert iterations < 30
+
+
+def test_irls_solves_score_equations():
+    # 連續變數的 Poisson MLE 滿足 Xᵀ(y − μ) = 0
+    rng = np.random.default_rng(490)
+    n, T = 8, 200
+    X = np.concatenate([np.ones((n, T, 1)), rng.normal(size=(n, T, 3))], axis=2)
+    true_beta = np.column_stack([rng.uniform(0, 2, n), rng.normal(0, 0.3, (n, 3))])
+    y = rng.poisson(np.exp(np.einsum('ntp,np->nt', X, true_beta))).astype(np.float64)
+
+    beta, mu, _ = fit_poisson(X, y, ridge=0, tol=1e-10)
+
+    score = np.einsum('ntp,nt->np', X, y - mu)
+    assert np.abs(score).max() < 1e-6
+    assert np.abs(beta - true_beta).max() < 0.2
+
+
+def test_irls_handles_empty_batch():
+    beta, mu, iterations = fit_poisson(np.zeros((0, 10, 3)), np.zeros((0, 10)))
+
+    assert beta.shape == (0, 3) and mu.shape == (0, 10) and iterations == 0
+
+
+def make_inputs(start_date, n_days, days, townships):
+    tables = {
+        'start_date': start_date,
+        'n_days': n_days,
+        'counties': ['臺南市', '高雄市'],
+        'townships': [['臺南市', '東區'], ['臺南市', '北區'], ['高雄市', '三民區']],
+        'township_county': np.array([0, 0, 1], dtype=np.int8),
+    }
+    codes = {'tables': tables, 'day': np.asarray(days, dtype=np.int32),
+             'township': np.asarray(townships, dtype=np.int16)}
+    return build_daily_cube(codes), codes, calendar_bins(start_date, n_days)
+
+
+def assert_all_zero(summary, arrays):
+    assert not arrays['fitted'].any()
+    assert np.all(arrays['mean'] == 0) and np.all(arrays['quantiles'] == 0)
+    assert summary['model']['fitted_townships'] == 0
+    assert len(summary['weeks']) == HORIZON
+    assert all(row['預測'] == 0 and row['95%上限'] == 0 for row in summary['national'])
+    assert summary['counties'] == [] and summary['top_townships'] == []
+
+
+def test_no_cases_in_estimation_window_gives_zero_forecast():
+    # 第一個病例遠早於最近 260 週的估計期間；最後一個病例在星期日，所在的週不完整而捨去
+    n_days = 7 * 420 + 1
+    cube, codes, bins = make_inputs('2000-01-02', n_days, [3, n_days - 1], [0, 1])
+
+    summary, arrays = run_forecast(cube, codes, bins, simulations=50)
+
+    assert_all_zero(summary, arrays)
+
+
+@pytest.mark.parametrize('n_days', [3, 10, 20])
+def test_too_short_window_gives_zero_forecast(n_days):
+    # 完整的週不超過 N_LAGS 週，沒有可配適的期間
+    cube, codes, bins = make_inputs('2015-01-04', n_days, [0, n_days - 1], [0, 2])
+
+    summary, arrays = run_forecast(cube, codes, bins, simulations=50)
+
+    assert_all_zero(summary, arrays)
+    assert summary['as_of_week'] < summary['weeks'][0]
+
+
+def test_forecast_follows_recent_level():
+    rng = np.random.default_rng(4900)
+    n_days = 6 * 364
+    rates = np.array([0.2, 3.0, 0.0])
+    counts = rng.poisson(rates[:, None], size=(3, n_days))
+    townships, days = np.nonzero(counts)
+    townships, days = np.repeat(townships, counts[townships, days]), np.repeat(days, counts[townships, days])
+    cube, codes, bins = make_inputs('2015-01-04', n_days, days, townships)
+
+    summary, arrays = run_forecast(cube, codes, bins, simulations=500)
+
+    assert arrays['fitted'].tolist() == [True, True, False]
+    weekly_mean = arrays['mean'].mean(axis=1)
+    assert weekly_mean[1] == pytest.approx(7 * 3.0, rel=0.2)
+    assert weekly_mean[0] == pytest.approx(7 * 0.2, rel=0.3)
+    assert np.all(arrays['mean'][2] == 0)
+    # 分位數由小到大排列，預測的週接在最後一個完整週之後
+    assert np.all(np.diff(arrays['quantiles'], axis=-1) >= 0)
+    assert summary['as_of_week'] == bins['week_labels'][-1]
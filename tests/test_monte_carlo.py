@@ -0,0 +1,52 @@
+"""
+行程池蒙地卡羅執行（monte_carlo.py）的測試：模擬次數檢查、批次合併與亂數種子的可重現性
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from monte_carlo import positive_int, run_replicates  # noqa: E402
+
+
+def _state(scale):
+    return {'scale': scale}
+
+
+def _simulate(state, key, rng, n):
+    return state['scale'] * rng.random(n) + (0 if key is None else key)
+
+
+@pytest.mark.parametrize('n', [0, -5])
+def test_rejects_fewer_than_one_replicate(n):
+    with pytest.raises(ValueError):
+        run_replicates(_state, (1.0,), _simulate, n, workers=2)
+
+
+def test_batches_add_up_and_are_reproducible():
+    first = run_replicates(_state, (1.0,), _simulate, 101, workers=2, seed=7)
+    second = run_replicates(_state, (1.0,), _simulate, 101, workers=2, seed=7)
+
+    assert first.shape == (101,)
+    assert np.array_equal(first, second)
+    assert not np.array_equal(first, run_replicates(_state, (1.0,), _simulate, 101, workers=2, seed=8))
+
+
+def test_keys_get_their_own_replicates():
+    results = run_replicates(_state, (1.0,), _simulate, 3, workers=4, keys=[10, 20])
+
+    assert set(results) == {10, 20}
+    assert results[10].shape == results[20].shape == (3,)
+    assert np.all((results[20] >= 20) & (results[20] < 21))
+
+
+def test_positive_int_argument():
+    assert positive_int('99') == 99
+    for value in ('0', '-1', 'abc'):
+        with pytest.raises(argparse.ArgumentTypeError):
+            positive_int(value)
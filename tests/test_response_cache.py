@@ -0,0 +1,164 @@
+"""
+回應快取（website/response_cache.py）的測試
+涵蓋：HIT / MISS / COALESCED / BYPASS 狀態、同一個鍵只計算一次、位元組上限的 LRU 淘汰，
+以及資料版本更新時的失效（較舊的版本不可清空快取）
+"""
+
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "website"))
+
+from response_cache import ResponseCache  # noqa: E402
+
+
+def test_miss_then_hit():
+    cache = ResponseCache()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return b'value'
+
+    assert cache.get_or_compute(1, 'a', compute) == (b'value', 'MISS')
+    assert cache.get_or_compute(1, 'a', compute) == (b'value', 'HIT')
+    assert len(calls) == 1
+
+
+def test_concurrent_requests_compute_once():
+    cache = ResponseCache()
+    calls = []
+    started = threading.Event()
+    release = threading.Event()
+
+    def compute():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return b'slow'
+
+    results = []
+
+    def request():
+        results.append(cache.get_or_compute(1, 'key', compute))
+
+    leader = threading.Thread(target=request)
+    leader.start()
+    started.wait(5)
+    followers = [threading.Thread(target=request) for _ in range(4)]
+    for thread in followers:
+        thread.start()
+    # 讓等待的請求都進入等待狀態後才完成計算
+    time.sleep(0.1)
+    release.set()
+    for thread in [leader] + followers:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert sorted(status for _, status in results) == ['COALESCED'] * 4 + ['MISS']
+    assert all(value == b'slow' for value, _ in results)
+
+
+def test_error_is_shared_and_not_cached():
+    cache = ResponseCache()
+    started = threading.Event()
+    release = threading.Event()
+
+    def failing():
+        started.set()
+        release.wait(5)
+        raise ValueError('boom')
+
+    errors = []
+
+    def request():
+        try:
+            cache.get_or_compute(1, 'key', failing)
+        except ValueError as e:
+            errors.append(e)
+
+    leader = threading.Thread(target=request)
+    leader.start()
+    started.wait(5)
+    follower = threading.Thread(target=request)
+    follower.start()
+    time.sleep(0.1)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+
+    assert len(errors) == 2
+    assert cache.get_or_compute(1, 'key', lambda: b'ok') == (b'ok', 'MISS')
+
+
+def test_newer_version_invalidates():
+    cache = ResponseCache()
+    cache.get_or_compute(1, 'a', lambda: b'v1')
+
+    assert cache.get_or_compute(2, 'a', lambda: b'v2') == (b'v2', 'MISS')
+    assert cache.stats()['version'] == 2
+    assert cache.get_or_compute(2, 'a', lambda: b'unused') == (b'v2', 'HIT')
+
+
+def test_older_version_does_not_flush_cache():
+    cache = ResponseCache()
+    cache.get_or_compute(2, 'a', lambda: b'v2')
+
+    # 熱更新期間仍持有舊快照的請求直接計算，不讀寫快取
+    assert cache.get_or_compute(1, 'a', lambda: b'v1') == (b'v1', 'BYPASS')
+    assert cache.get_or_compute(1, 'b', lambda: b'old') == (b'old', 'BYPASS')
+    assert cache.stats()['version'] == 2
+    assert cache.stats()['entries'] == 1
+    assert cache.get_or_compute(2, 'a', lambda: b'unused') == (b'v2', 'HIT')
+
+
+def test_result_computed_for_replaced_version_is_not_stored():
+    cache = ResponseCache()
+    cache.get_or_compute(1, 'warm', lambda: b'x')
+
+    def compute():
+        # 計算期間發布了新版本
+        cache.get_or_compute(2, 'other', lambda: b'y')
+        return b'stale'
+
+    assert cache.get_or_compute(1, 'a', compute) == (b'stale', 'MISS')
+    assert cache.get_or_compute(2, 'a', lambda: b'fresh') == (b'fresh', 'MISS')
+
+
+def test_eviction_keeps_total_under_byte_bound():
+    cache = ResponseCache(max_bytes=100)
+    for i in range(10):
+        cache.get_or_compute(1, i, lambda: b'x' * 30)
+        assert cache.stats()['bytes'] <= 100
+
+    stats = cache.stats()
+    assert stats['entries'] == 3 and stats['bytes'] == 90
+    # 最近使用的鍵保留，最久未使用的先淘汰
+    assert cache.get_or_compute(1, 9, lambda: b'new')[1] == 'HIT'
+    assert cache.get_or_compute(1, 0, lambda: b'new')[1] == 'MISS'
+
+
+def test_lru_order_follows_hits():
+    cache = ResponseCache(max_bytes=60)
+    cache.get_or_compute(1, 'a', lambda: b'a' * 20)
+    cache.get_or_compute(1, 'b', lambda: b'b' * 20)
+    cache.get_or_compute(1, 'c', lambda: b'c' * 20)
+    cache.get_or_compute(1, 'a', lambda: b'unused')
+
+    cache.get_or_compute(1, 'd', lambda: b'd' * 20)
+
+    assert cache.get_or_compute(1, 'a', lambda: b'unused')[1] == 'HIT'
+    assert cache.get_or_compute(1, 'b', lambda: b'b' * 20)[1] == 'MISS'
+
+
+@pytest.mark.parametrize('size', [101, 1000])
+def test_oversized_value_is_returned_but_not_cached(size):
+    cache = ResponseCache(max_bytes=100)
+    cache.get_or_compute(1, 'small', lambda: b's' * 10)
+
+    assert cache.get_or_compute(1, 'big', lambda: b'x' * size)[1] == 'MISS'
+    assert cache.stats() == {'version': 1, 'entries': 1, 'bytes': 10, 'max_bytes': 100}
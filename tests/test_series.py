@@ -0,0 +1,154 @@
+"""
+時間序列降取樣（website/series.py 的 LTTB）與依縮放層級快取的測試
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+sys.path.insert(0, str(ROOT / "website"))
+
+import series  # noqa: E402
+from response_cache import ResponseCache  # noqa: E402
+from timeseries import calendar_bins  # noqa: E402
+
+
+def reference_lttb(y, n_out):
+    """逐點的 LTTB（與 series.lttb 相同的分桶方式），用於比對向量化版本"""
+    n = len(y)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    selected = [0]
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        next_lo, next_hi = (edges[i + 1], edges[i + 2]) if i + 2 < len(edges) else (n - 1, n)
+        next_x = (next_lo + next_hi - 1) / 2
+        next_y = float(np.mean(y[next_lo:next_hi]))
+        prev = selected[-1]
+        best, best_area = lo, -1.0
+        for x in range(lo, hi):
+            area = abs((prev - next_x) * (y[x] - y[prev]) - (prev - x) * (next_y - y[prev]))
+            if area > best_area:
+                best, best_area = x, area
+        selected.append(best)
+    return selected + [n - 1]
+
+
+@pytest.fixture
+def matrix():
+    rng = np.random.default_rng(48)
+    return rng.poisson(rng.uniform(0, 20, (4, 1)) * (1 + np.sin(np.arange(500) / 30)), size=(4, 500))
+
+
+@pytest.mark.parametrize('n_out', [3, 10, 57, 499])
+def test_lttb_keeps_endpoints_and_point_count(matrix, n_out):
+    selected = series.lttb(matrix, n_out)
+
+    assert selected.shape == (len(matrix), n_out)
+    assert np.all(selected[:, 0] == 0)
+    assert np.all(selected[:, -1] == matrix.shape[1] - 1)
+    # 每桶選一點，索引嚴格遞增
+    assert np.all(np.diff(selected, axis=1) > 0)
+
+
+@pytest.mark.parametrize('n_out', [3, 25, 120])
+def test_lttb_matches_reference(matrix, n_out):
+    selected = series.lttb(matrix, n_out)
+
+    for row, y in enumerate(matrix.astype(np.float64)):
+        assert selected[row].tolist() == reference_lttb(y, n_out)
+
+
+@pytest.mark.parametrize('n_out', [500, 501, 10_000])
+def test_lttb_returns_series_unchanged_when_points_cover_it(matrix, n_out):
+    selected = series.lttb(matrix, n_out)
+
+    assert np.array_equal(selected, np.broadcast_to(np.arange(500), matrix.shape))
+    assert np.array_equal(np.take_along_axis(matrix, selected, axis=1), matrix)
+
+
+def test_lttb_keeps_peak():
+    y = np.zeros((1, 1000))
+    y[0, 613] = 50
+
+    assert 613 in series.lttb(y, 20)[0]
+
+
+@pytest.mark.parametrize('window, points, level', [(100, 100, 0), (50, 100, 0), (101, 100, 1),
+                                                   (200, 100, 1), (201, 100, 2), (3650, 200, 5)])
+def test_zoom_level(window, points, level):
+    assert series.zoom_level(window, points) == level
+
+
+class Snapshot:
+    def __init__(self, version):
+        self.version = version
+
+
+@pytest.fixture
+def web(monkeypatch):
+    import app
+    cache = ResponseCache()
+    monkeypatch.setattr(app, 'response_cache', cache)
+    return app, cache
+
+
+def downsample(web_app, arrays, matrix, first, last, points, version=1, freq='day', key=('total', (0,))):
+    return web_app._downsampled_timeseries(Snapshot(version), arrays, matrix, key, freq, first, last,
+                                           points, [], [], np.array([0]), 'total')
+
+
+@pytest.fixture
+def arrays():
+    n_days = 4 * 365
+    return {'header': {'start_date': '2015-01-01', 'n_days': n_days}, **calendar_bins('2015-01-01', n_days)}
+
+
+def test_downsampling_is_cached_per_zoom_level(web, arrays):
+    app, cache = web
+    matrix = np.random.default_rng(480).poisson(3, size=(1, arrays['header']['n_days']))
+
+    # 同一縮放層級下平移視窗共用同一份降取樣結果
+    result = downsample(app, arrays, matrix, 0, 399, 100)
+    assert result['downsample']['level'] == 2
+    assert list(cache._entries) == [('lttb', ('total', (0,)), 'day', 2)]
+    downsample(app, arrays, matrix, 300, 699, 100)
+    assert cache.stats()['entries'] == 1
+
+    # 放大到另一個層級時另外計算一份；週、月與不同的列各自快取
+    downsample(app, arrays, matrix, 0, 199, 100)
+    downsample(app, arrays, matrix, 0, 1459, 100, freq='week')
+    downsample(app, arrays, matrix, 0, 399, 100, key=('township', (0,)))
+    assert set(cache._entries) == {
+        ('lttb', ('total', (0,)), 'day', 2),
+        ('lttb', ('total', (0,)), 'day', 1),
+        ('lttb', ('total', (0,)), 'week', 2),
+        ('lttb', ('township', (0,)), 'day', 2),
+    }
+
+
+def test_downsampled_window_keeps_its_endpoints(web, arrays):
+    app, _ = web
+    matrix = np.random.default_rng(481).poisson(3, size=(1, arrays['header']['n_days']))
+
+    result = downsample(app, arrays, matrix, 123, 877, 50)
+
+    item = result['series'][0]
+    assert item['labels'][0] == '2015-05-04' and item['labels'][-1] == '2017-05-27'
+    assert result['start'] == item['labels'][0] and result['end'] == item['labels'][-1]
+    assert len(item['labels']) <= 50 + 2
+    assert item['counts'][0] == matrix[0, 123] and item['counts'][-1] == matrix[0, 877]
+
+
+def test_window_within_points_is_not_downsampled(web, arrays):
+    app, cache = web
+    matrix = np.arange(arrays['header']['n_days'])[None, :]
+
+    result = downsample(app, arrays, matrix, 10, 59, 100)
+
+    assert result['downsample']['level'] == 0
+    assert result['series'][0]['counts'] == list(range(10, 60))
+    assert cache.stats()['entries'] == 0
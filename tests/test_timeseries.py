@@ -0,0 +1,116 @@
+"""
+流行病學週計算與 鄉鎮 × 日 立方體重新分組的測試
+涵蓋：MMWR 第 53 週與跨年度的週次、calendar_bins 與 series.rebin（np.add.reduceat）
+重新分組後的總數與逐日立方體一致
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+sys.path.insert(0, str(ROOT / "website"))
+
+import series  # noqa: E402
+from timeseries import build_daily_cube, calendar_bins, epiweek  # noqa: E402
+
+
+@pytest.mark.parametrize('day, week_start, epi_year, week', [
+    # 2008、2014、2020 年有 53 週，2009 年只有 52 週
+    ('2014-12-28', '2014-12-28', 2014, 53),
+    ('2015-01-03', '2014-12-28', 2014, 53),
+    ('2015-01-04', '2015-01-04', 2015, 1),
+    ('2021-01-02', '2020-12-27', 2020, 53),
+    ('2021-01-03', '2021-01-03', 2021, 1),
+    ('2009-01-03', '2008-12-28', 2008, 53),
+    ('2010-01-02', '2009-12-27', 2009, 52),
+    # 新年度只有 2 天的週屬於前一年（2016-01-01 為星期五）
+    ('2016-01-01', '2015-12-27', 2015, 52),
+    ('2016-01-03', '2016-01-03', 2016, 1),
+    # 新年度有 5 天的週屬於新年度，即使週起始日在前一年
+    ('2018-12-30', '2018-12-30', 2019, 1),
+    ('2019-01-05', '2018-12-30', 2019, 1),
+    ('2018-12-29', '2018-12-23', 2018, 52),
+    # 1 月 1 日為星期日
+    ('2012-01-01', '2012-01-01', 2012, 1),
+    ('2015-08-15', '2015-08-09', 2015, 32),
+])
+def test_epiweek_known_weeks(day, week_start, epi_year, week):
+    starts, years, weeks = epiweek(np.array([day], dtype='datetime64[D]'))
+
+    assert str(starts[0]) == week_start
+    assert years[0] == epi_year
+    assert weeks[0] == week
+
+
+def test_epiweek_weeks_are_consecutive():
+    days = np.datetime64('1998-01-01') + np.arange(28 * 366)
+    starts, years, weeks = epiweek(days)
+
+    # 同一週的 7 天有相同的週次，每週的週次不是加 1 就是換年度從 1 開始
+    first = np.flatnonzero(np.r_[True, starts[1:] != starts[:-1]])
+    assert np.all(np.diff(first)[1:-1] == 7) and np.diff(first)[0] <= 7
+    prev_year, prev_week = years[first][:-1], weeks[first][:-1]
+    next_year, next_week = years[first][1:], weeks[first][1:]
+    same = next_year == prev_year
+    assert np.all(next_week[same] == prev_week[same] + 1)
+    assert np.all((next_year[~same] == prev_year[~same] + 1) & (next_week[~same] == 1))
+    assert set(np.unique(prev_week[~same])) <= {52, 53}
+
+
+@pytest.fixture
+def cube_and_bins():
+    rng = np.random.default_rng(31)
+    start_date, n_days, n_towns = '2013-12-20', 3 * 365, 6
+    n_cases = 5000
+    codes = {
+        'tables': {'townships': [['臺南市', f'區{i}'] for i in range(n_towns)], 'n_days': n_days},
+        'township': rng.integers(0, n_towns, n_cases).astype(np.int16),
+        'day': rng.integers(0, n_days, n_cases).astype(np.int32),
+    }
+    cube = build_daily_cube(codes)
+    bins = calendar_bins(start_date, n_days)
+    arrays = {'header': {'start_date': start_date, 'n_days': n_days}, **bins}
+    return codes, cube, arrays
+
+
+def test_daily_cube_counts_every_case(cube_and_bins):
+    codes, cube, _ = cube_and_bins
+
+    assert cube.sum() == len(codes['day'])
+    expected = np.zeros(cube.shape, dtype=np.int64)
+    np.add.at(expected, (codes['township'], codes['day']), 1)
+    assert np.array_equal(cube, expected)
+
+
+@pytest.mark.parametrize('freq', ['day', 'week', 'month', 'year'])
+@pytest.mark.parametrize('first, last', [(0, 3 * 365 - 1), (10, 400), (372, 377), (5, 5)])
+def test_rebin_adds_up_to_daily_totals(cube_and_bins, freq, first, last):
+    _, cube, arrays = cube_and_bins
+
+    labels, counts = series.rebin(cube, arrays, freq, first, last)
+
+    assert counts.shape == (cube.shape[0], len(labels))
+    assert np.array_equal(counts.sum(axis=1), cube[:, first:last + 1].sum(axis=1))
+    assert len(set(labels)) == len(labels)
+
+
+def test_weekly_bins_match_epiweek(cube_and_bins):
+    _, cube, arrays = cube_and_bins
+    n_days = arrays['header']['n_days']
+    days = np.datetime64(arrays['header']['start_date']) + np.arange(n_days)
+    _, years, weeks = epiweek(days)
+
+    labels, counts = series.rebin(cube, arrays, 'week', 0, n_days - 1)
+
+    # 每一週的總數等於逐日依 (流行病學年, 週次) 分組的總數
+    keys = [f'{y}-W{w:02d}' for y, w in zip(years, weeks)]
+    for i, label in enumerate(labels):
+        members = np.array([key == label for key in keys])
+        assert np.array_equal(counts[:, i], cube[:, members].sum(axis=1))
+    # 2014 年第 53 週在範圍內，且只出現一次
+    assert labels.count('2014-W53') == 1
+    assert '2015-W53' not in labels
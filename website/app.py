@@ -5,17 +5,56 @@
 
 import sys
 import io
+import time
+
+_IMPORT_STARTED = time.perf_counter()
 
 # 設定 Windows 終端機 UTF-8 編碼
 if sys.platform == 'win32':
     sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='replace')
     sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8', errors='replace')
 
-from flask import Flask, render_template, jsonify, send_from_directory
+from flask import Flask, Response, render_template, jsonify, request, send_from_directory, stream_with_context
+import importlib.util
 import json
-import pandas as pd
+import os
+import threading
+import types
 from pathlib import Path
 
+# 與分析腳本共用的定義（血清型共同流行指標、鄉鎮名稱統一規則）放在 src/
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from data_store import DataStore
+from response_cache import ResponseCache
+
+
+def lazy_import(name):
+    """
+    延遲載入模組：第一次存取屬性時才真正執行 import
+    /、/api/data、/api/summary 等只讀 JSON 的路徑完全不需要 pandas / numpy，冷啟動不必先付出載入成本
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+export = lazy_import('export')
+series = lazy_import('series')
+typed_array = lazy_import('typed_array')
+serotype_metrics = lazy_import('serotype_metrics')
+
+# 精簡服務模式（DENGUE_LEAN=1）：只讀取已發布的分析版本，不回頭讀取原始 CSV
+LEAN_MODE = os.environ.get('DENGUE_LEAN', '').lower() in ('1', 'true', 'yes')
+
 # 取得當前檔案所在目錄
 BASE_DIR = Path(__file__).parent
 
@@ -36,9 +75,30 @@ def after_request(response):
 DATA_DIR = Path(__file__).parent.parent / "data"
 RAW_DATA = DATA_DIR / "raw" / "Dengue_Daily.csv"
 ANALYSIS_FILE = DATA_DIR / "processed" / "dengue_analysis.json"
+CLUSTERS_FILE = DATA_DIR / "processed" / "scan_clusters.json"
+NEAR_REPEAT_FILE = DATA_DIR / "processed" / "near_repeat.json"
+CLEAN_DIR = DATA_DIR / "processed" / "clean"
 STATIC_DATA_DIR = Path(__file__).parent / "static" / "data"
 STATIC_DATA_DIR.mkdir(parents=True, exist_ok=True)
 
+# 縣市英文代碼（網址使用）對應的正式名稱
+COUNTY_ALIASES = {
+    'kaohsiung': '高雄市',
+    'tainan': '臺南市',
+    'pingtung': '屏東縣',
+    'taipei': '臺北市',
+    'newtaipei': '新北市',
+    'taichung': '臺中市',
+    'taoyuan': '桃園市',
+}
+
+# 分析資料快照：背景執行緒偵測到新發布的版本時自動切換，不需重啟伺服器
+data_store = DataStore(DATA_DIR / "processed")
+data_store.start_watcher()
+
+# 縣市資料等需要計算的回應快取（上限 64 MB，資料版本更新時失效）
+response_cache = ResponseCache()
+
 
 @app.route('/')
 def index():
@@ -68,72 +128,1056 @@ def tainan():
 def get_data():
     """取得分析資料 API"""
     try:
-        if not ANALYSIS_FILE.exists():
+        snapshot = data_store.current()
+        if snapshot is None:
             return jsonify({'error': '分析資料不存在，請先執行分析腳本'}), 404
         
-        with open(ANALYSIS_FILE, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        
         # 檢查資料結構
-        if not isinstance(data, dict):
+        if not isinstance(snapshot.data, dict):
             return jsonify({'error': '資料格式錯誤'}), 500
         
-        return jsonify(data)
-    except FileNotFoundError:
-        return jsonify({'error': '分析資料不存在，請先執行分析腳本'}), 404
-    except json.JSONDecodeError as e:
-        return jsonify({'error': f'JSON 解析錯誤: {str(e)}'}), 500
+        # 指定日期區間時以累積和陣列計算
+        if _has_range_params():
+            result = range_data(snapshot)
+            if result is None:
+                return jsonify({'error': '日期區間查詢需要重新執行分析腳本'}), 404
+            return jsonify(result)
+        
+        # 差異更新：只回傳 since 版本之後變更的表格
+        since = _since_param()
+        if since is not None:
+            body, status = response_cache.get_or_compute(
+                snapshot.version, ('delta', since), lambda: _delta_response(snapshot, since))
+            response = Response(body, mimetype='application/json')
+            response.headers['X-Cache'] = status
+            return response
+        
+        return Response(snapshot.json_bytes, mimetype='application/json')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
+def _since_param():
+    value = request.args.get('since')
+    if value is None or value == '':
+        return None
+    try:
+        return int(value.lstrip('v'))
+    except ValueError:
+        raise ValueError('since 必須為資料版本號（整數）')
+
+
+def _table_value(data, name):
+    """依表格名稱（例如 time.yearly）取出分析結果中的表格"""
+    key, _, sub = name.partition('.')
+    value = data.get(key)
+    return value.get(sub) if sub and isinstance(value, dict) else value
+
+
+def _delta_response(snapshot, since):
+    """
+    since 版本之後變更的表格：{data_version, since, changed: {表格名稱: 內容}, changed_artifacts}
+    無法判斷差異時回傳完整資料（full 為 true，內容放在 data）
+    """
+    changed = snapshot.changed_since(since)
+    result = {'data_version': snapshot.version, 'since': since}
+    if changed is None:
+        result.update({'full': True, 'data': snapshot.data})
+    else:
+        result.update({
+            'full': False,
+            'last_updated': snapshot.data.get('last_updated', ''),
+            'changed': {name: _table_value(snapshot.data, name) for name in changed if not name.endswith('.npz')},
+            'changed_artifacts': [name for name in changed if name.endswith('.npz')],
+        })
+    return json.dumps(result, ensure_ascii=False).encode('utf-8')
+
+
+# 資料更新事件串流：沒有新版本時每隔這麼多秒送出一次註解行，避免連線被代理伺服器切斷；
+# 用戶端斷線時在下一次送出時察覺並結束串流
+EVENT_KEEPALIVE = 15
+# 每個訂閱者佔用一條伺服器執行緒，超過上限時回應 503，前端改以 /api/version 定期查詢
+EVENT_MAX_SUBSCRIBERS = int(os.environ.get('DENGUE_MAX_SUBSCRIBERS', '16'))
+EVENT_POLL_INTERVAL = 60
+
+_event_subscribers = 0
+_event_lock = threading.Lock()
+
+
+def _acquire_event_slot():
+    global _event_subscribers
+    with _event_lock:
+        if _event_subscribers >= EVENT_MAX_SUBSCRIBERS:
+            return False
+        _event_subscribers += 1
+        return True
+
+
+def _release_event_slot():
+    global _event_subscribers
+    with _event_lock:
+        _event_subscribers -= 1
+
+
+@app.route('/api/events')
+def data_events():
+    """
+    伺服器推送事件（text/event-stream）：連線時與每次發布新版本時送出 version 事件
+    內容為 {"version": 版本號, "published_at": 發布時間}，前端收到後以 /api/data?since= 取得差異
+    同時連線數超過 EVENT_MAX_SUBSCRIBERS 時回應 503（Retry-After 為建議的查詢間隔）
+    """
+    if not _acquire_event_slot():
+        response = jsonify({'error': '資料更新串流的連線數已滿，請改為定期查詢 /api/version',
+                            'poll_interval': EVENT_POLL_INTERVAL})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(EVENT_POLL_INTERVAL)
+        return response
+
+    def stream():
+        version = None
+        yield 'retry: 5000\n\n'
+        while True:
+            snapshot = data_store.wait_for_change(version, EVENT_KEEPALIVE)
+            if snapshot is None or snapshot.version == version:
+                yield ': keepalive\n\n'
+                continue
+            version = snapshot.version
+            payload = json.dumps({'version': version, 'published_at': snapshot.published_at}, ensure_ascii=False)
+            yield f"id: {version}\nevent: version\ndata: {payload}\n\n"
+
+    response = Response(stream(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    # 用戶端斷線（寫入失敗）或伺服器結束回應時都會關閉回應，釋放訂閱名額
+    response.call_on_close(_release_event_slot)
+    return response
+
+
+@app.route('/api/version')
+def get_version():
+    """目前的資料版本（事件串流連線數已滿時，前端以此定期查詢）"""
+    snapshot = data_store.current()
+    if snapshot is None:
+        return jsonify({'error': '分析資料不存在'}), 404
+    return jsonify({'version': snapshot.version, 'published_at': snapshot.published_at,
+                    'poll_interval': EVENT_POLL_INTERVAL})
+
+
 @app.route('/api/summary')
 def get_summary():
     """取得摘要統計 API"""
-    try:
-        with open(ANALYSIS_FILE, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        return jsonify(data.get('summary', {}))
-    except FileNotFoundError:
+    snapshot = data_store.current()
+    if snapshot is None:
         return jsonify({'error': '分析資料不存在'}), 404
+    return jsonify(snapshot.data.get('summary', {}))
 
 
 
 
-@app.route('/api/data/<county>')
-def get_county_data(county):
-    """取得特定縣市的資料 API"""
+def canonical_county_name(name):
+    """網址中的縣市代碼或名稱統一為分析資料使用的「臺」字名稱"""
+    name = name.strip()
+    return COUNTY_ALIASES.get(name.lower(), name).replace('台', '臺')
+
+
+def _split_param(name):
+    """讀取以逗號分隔的查詢參數"""
+    value = request.args.get(name, '')
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+@app.route('/api/timeseries')
+def get_timeseries():
+    """
+    鄉鎮逐日病例數時間序列 API
+    參數: county、township（可用逗號分隔多個）、by=total|township、
+          freq=day|week|month|year、start、end（YYYY-MM-DD）、
+          points（目標點數；期間數超過時以 LTTB 降取樣，每條序列各自回傳 labels）
+    """
+    snapshot = data_store.current()
+    if snapshot is None or not snapshot.has_artifact('timeseries.npz'):
+        return jsonify({'error': '時間序列資料不存在，請先執行分析腳本'}), 404
+    
     try:
-        if not ANALYSIS_FILE.exists():
-            return jsonify({'error': '分析資料不存在，請先執行分析腳本'}), 404
+        arrays = snapshot.artifact('timeseries.npz')
+        header = arrays['header']
+        counties = [canonical_county_name(name) for name in _split_param('county')]
+        townships = [name.replace('台', '臺') for name in _split_param('township')]
+        freq = request.args.get('freq', 'day')
+        by = request.args.get('by', 'total')
+        first, last = series.day_range(header, request.args.get('start'), request.args.get('end'))
+        
+        rows = series.select_townships(header, arrays['township_county'], counties, townships)
+        if len(rows) == 0:
+            return jsonify({'error': '找不到符合條件的鄉鎮'}), 404
+        
+        matrix = arrays['daily'][rows]
+        if by == 'total':
+            matrix = matrix.sum(axis=0, dtype=np.int64, keepdims=True)
         
-        with open(ANALYSIS_FILE, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        points = request.args.get('points', type=int)
+        if points:
+            if points < 3:
+                raise ValueError('points 至少為 3')
+            return jsonify(_downsampled_timeseries(snapshot, arrays, matrix, (by, tuple(rows.tolist())),
+                                                   freq, first, last, points, counties, townships, rows, by))
+        labels, counts = series.rebin(matrix, arrays, freq, first, last)
         
-        # 縣市名稱對應（處理可能的命名差異）
-        county_mapping = {
-            'kaohsiung': '高雄市',
-            'tainan': '台南市',
-            '臺南市': '台南市',
-            '臺北市': '台北市'
+        if by == 'total':
+            items = [{'縣市': ','.join(counties) or '全國', '鄉鎮': ','.join(townships) or '全部', 'counts': counts[0].tolist()}]
+        else:
+            items = [{
+                '縣市': header['townships'][row][0],
+                '鄉鎮': header['townships'][row][1],
+                'counts': counts[i].tolist(),
+            } for i, row in enumerate(rows)]
+        
+        return jsonify({
+            'freq': freq,
+            'start': labels[0] if labels else None,
+            'end': labels[-1] if labels else None,
+            'labels': labels,
+            'series': items,
+            'data_version': snapshot.version,
+        })
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+
+def _downsampled_timeseries(snapshot, arrays, matrix, cache_key, freq, first, last, points,
+                            counties, townships, rows, by):
+    """
+    LTTB 降取樣的時間序列回應
+    依視窗長度決定縮放層級（每桶 2 ** level 個期間），每個層級只對整段序列降取樣一次並放在回應快取，
+    同一層級下平移視窗只需切片；視窗頭尾的期間一定保留，讓折線涵蓋整個視窗
+    """
+    header = arrays['header']
+    labels, full = series.rebin(matrix, arrays, freq, 0, header['n_days'] - 1)
+    if freq == 'day':
+        window_first, window_last = first, last
+    else:
+        index = arrays[f'{freq}_index']
+        window_first, window_last = int(index[first] - index[0]), int(index[last] - index[0])
+    
+    level = series.zoom_level(window_last - window_first + 1, points)
+    n_periods = full.shape[1]
+    if level == 0:
+        selected = np.broadcast_to(np.arange(n_periods), full.shape)
+    else:
+        n_out = -(-n_periods // 2 ** level) + 2
+        body, _ = response_cache.get_or_compute(
+            snapshot.version, ('lttb', cache_key, freq, level),
+            lambda: series.lttb(full, n_out).astype(np.int32).tobytes())
+        selected = np.frombuffer(body, dtype=np.int32).reshape(len(full), -1)
+    
+    items = []
+    for i, row_selected in enumerate(selected):
+        inside = row_selected[(row_selected > window_first) & (row_selected < window_last)]
+        keep = np.unique(np.r_[window_first, inside, window_last])
+        item = {'labels': [labels[j] for j in keep], 'counts': full[i, keep].tolist()}
+        if by == 'total':
+            item.update({'縣市': ','.join(counties) or '全國', '鄉鎮': ','.join(townships) or '全部'})
+        else:
+            item.update({'縣市': header['townships'][rows[i]][0], '鄉鎮': header['townships'][rows[i]][1]})
+        items.append(item)
+    
+    return {
+        'freq': freq,
+        'start': labels[window_first],
+        'end': labels[window_last],
+        'downsample': {'points': points, 'level': level, 'bucket': 2 ** level},
+        'series': items,
+        'data_version': snapshot.version,
+    }
+
+
+MATRIX_KINDS = ('township', 'yearly_monthly')
+
+
+@app.route('/api/matrix/<kind>')
+def get_matrix(kind):
+    """
+    二進位計數矩陣 API（格式見 typed_array.py），回應為 application/octet-stream
+    kind=township：鄉鎮 × 期間（分級著色地圖、逐日序列）；參數 county、township、freq、start、end
+    kind=yearly_monthly：年 × 12 個月（年度-月度熱圖）；參數 county、township、start、end
+    value=share 時改為 Float32 的比例（各列除以列總和），預設為 Int32 病例數
+    """
+    if kind not in MATRIX_KINDS:
+        return jsonify({'error': f"kind 必須為 {', '.join(MATRIX_KINDS)} 之一"}), 404
+    snapshot = data_store.current()
+    if snapshot is None or not snapshot.has_artifact('timeseries.npz'):
+        return jsonify({'error': '時間序列資料不存在，請先執行分析腳本'}), 404
+    
+    params = tuple(sorted(request.args.items(multi=True)))
+    try:
+        body, status = response_cache.get_or_compute(
+            snapshot.version, ('matrix', kind, params), lambda: _matrix_response(snapshot, kind))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except LookupError as e:
+        return jsonify({'error': str(e)}), 404
+    
+    response = Response(body, mimetype='application/octet-stream')
+    response.headers['X-Cache'] = status
+    return response
+
+
+def _matrix_response(snapshot, kind):
+    arrays = snapshot.artifact('timeseries.npz')
+    header = arrays['header']
+    counties = [canonical_county_name(name) for name in _split_param('county')]
+    townships = [name.replace('台', '臺') for name in _split_param('township')]
+    value = request.args.get('value', 'count')
+    if value not in ('count', 'share'):
+        raise ValueError('value 必須為 count 或 share')
+    first, last = series.day_range(header, request.args.get('start'), request.args.get('end'))
+    
+    rows = series.select_townships(header, arrays['township_county'], counties, townships)
+    if len(rows) == 0:
+        raise LookupError('找不到符合條件的鄉鎮')
+    
+    if kind == 'township':
+        freq = request.args.get('freq', 'day')
+        labels, counts = series.rebin(arrays['daily'][rows], arrays, freq, first, last)
+        meta = {
+            'kind': kind,
+            'freq': freq,
+            'start': labels[0] if labels else None,
+            'end': labels[-1] if labels else None,
+            'rows': [header['townships'][row] for row in rows],
+            # 逐日時欄位即為 start 起的連續日期，不另外列出以縮小標頭
+            'columns': None if freq == 'day' else labels,
         }
+    else:
+        total = arrays['daily'][rows].sum(axis=0, dtype=np.int64, keepdims=True)
+        labels, monthly = series.rebin(total, arrays, 'month', first, last)
+        years = sorted({int(label[:4]) for label in labels})
+        counts = np.zeros((len(years), 12), dtype=np.int64)
+        for label, count in zip(labels, monthly[0]):
+            counts[years.index(int(label[:4])), int(label[5:7]) - 1] = count
+        meta = {'kind': kind, 'rows': years, 'columns': list(range(1, 13))}
+    meta['data_version'] = snapshot.version
+    meta['value'] = value
+    
+    if value == 'share':
+        totals = counts.sum(axis=1, keepdims=True)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            shares = np.where(totals > 0, counts / totals, 0.0)
+        return typed_array.encode_matrix(shares, meta, 'float32')
+    return typed_array.encode_matrix(counts, meta, 'int32')
+
+
+@app.route('/api/alerts')
+def get_alerts():
+    """
+    疫情異常警示 API
+    參數: county、township（逗號分隔）、method=C1,C2,C3,farrington、
+          start、end（YYYY-MM-DD，預設為資料最後 28 天）、limit
+    """
+    snapshot = data_store.current()
+    if snapshot is None or not snapshot.has_artifact('alerts.npz'):
+        return jsonify({'error': '警示資料不存在，請先執行分析腳本'}), 404
+    
+    try:
+        ts = snapshot.artifact('timeseries.npz')
+        alerts = snapshot.artifact('alerts.npz')
+        header = ts['header']
+        counties = [canonical_county_name(name) for name in _split_param('county')]
+        townships = [name.replace('台', '臺') for name in _split_param('township')]
+        methods = _split_param('method') or ['C1', 'C2', 'C3', 'farrington']
+        limit = int(request.args.get('limit', 500))
+        
+        # 預設範圍：資料最後 28 天
+        first, last = series.day_range(header, request.args.get('start'), request.args.get('end'))
+        if not request.args.get('end') and len(alerts['ears_days']):
+            last = max(int(alerts['ears_days'].max()), first)
+        if not request.args.get('start'):
+            first = max(last - 27, 0)
+        
+        rows = series.select_townships(header, ts['township_county'], counties, townships)
+        start_date = np.datetime64(header['start_date'], 'D')
+        items = []
+        
+        ears_bits = alerts['header']['ears_bits']
+        wanted_bits = sum(bit for name, bit in ears_bits.items() if name in methods)
+        if wanted_bits:
+            mask = ((alerts['ears_days'] >= first) & (alerts['ears_days'] <= last)
+                    & np.isin(alerts['ears_rows'], rows) & (alerts['ears_flags'] & wanted_bits > 0))
+            for i in np.flatnonzero(mask):
+                county, township = header['townships'][alerts['ears_rows'][i]]
+                flag = int(alerts['ears_flags'][i])
+                c1, c2, c3 = (round(float(v), 2) for v in alerts['ears_scores'][i])
+                items.append({
+                    '居住縣市': county,
+                    '居住鄉鎮': township,
+                    '日期': str(start_date + int(alerts['ears_days'][i])),
+                    '病例數': int(alerts['ears_counts'][i]),
+                    '方法': [name for name, bit in ears_bits.items() if flag & bit & wanted_bits],
+                    'C1': c1, 'C2': c2, 'C3': c3,
+                })
+        
+        if 'farrington' in methods:
+            first_week = int(ts['week_index'][first])
+            last_week = int(ts['week_index'][last])
+            mask = ((alerts['farrington_weeks'] >= first_week) & (alerts['farrington_weeks'] <= last_week)
+                    & np.isin(alerts['farrington_rows'], rows))
+            for i in np.flatnonzero(mask):
+                county, township = header['townships'][alerts['farrington_rows'][i]]
+                items.append({
+                    '居住縣市': county,
+                    '居住鄉鎮': township,
+                    '週別': str(ts['week_labels'][alerts['farrington_weeks'][i]]),
+                    '病例數': int(alerts['farrington_counts'][i]),
+                    '方法': ['farrington'],
+                    '期望值': round(float(alerts['farrington_expected'][i]), 2),
+                    '上界': round(float(alerts['farrington_upper'][i]), 2),
+                })
+        
+        return jsonify({
+            'start': str(start_date + first),
+            'end': str(start_date + last),
+            'total': len(items),
+            'alerts': items[:limit],
+            'thresholds': alerts['header']['ears_thresholds'],
+            'data_version': snapshot.version,
+        })
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+
+@app.route('/api/nowcast')
+def get_nowcast():
+    """
+    近期病例數即時推估 API（校正通報延遲）
+    參數: county（逗號分隔，未指定時回傳全國與所有縣市）
+    """
+    snapshot = data_store.current()
+    if snapshot is None or 'nowcast' not in snapshot.data:
+        return jsonify({'error': '即時推估資料不存在，請先執行分析腳本'}), 404
+    
+    result = dict(snapshot.data['nowcast'])
+    counties = [canonical_county_name(name) for name in _split_param('county')]
+    if counties:
+        result['counties'] = [item for item in result['counties'] if item['縣市'] in counties]
+    result['data_version'] = snapshot.version
+    return jsonify(result)
+
+
+def township_forecasts(snapshot, counties=None, townships=None):
+    """
+    從 forecast.npz 取出指定縣市 / 鄉鎮的逐週預測與區間（只列有配適模型的鄉鎮，依預測合計排序）
+    沒有預測陣列時回傳 None
+    """
+    if snapshot is None or not snapshot.has_artifact('forecast.npz'):
+        return None
+    arrays = snapshot.artifact('forecast.npz')
+    header = arrays['header']
+    rows = series.select_townships(header, arrays['township_county'], counties, townships)
+    rows = rows[arrays['fitted'][rows]]
+    mean = arrays['mean'][rows]
+    quantiles = np.rint(arrays['quantiles'][rows]).astype(np.int64)
+    order = np.argsort(-mean.sum(axis=1), kind='stable')
+    result = []
+    for i in order:
+        county, township = header['townships'][rows[i]]
+        result.append({
+            '縣市': county,
+            '鄉鎮': township,
+            '預測合計': round(float(mean[i].sum()), 1),
+            'weeks': [{
+                '週別': label,
+                '預測': round(float(mean[i, h]), 1),
+                '中位數': int(quantiles[i, h, 2]),
+                '50%下限': int(quantiles[i, h, 1]),
+                '50%上限': int(quantiles[i, h, 3]),
+                '95%下限': int(quantiles[i, h, 0]),
+                '95%上限': int(quantiles[i, h, 4]),
+            } for h, label in enumerate(header['weeks'])],
+        })
+    return result
+
+
+@app.route('/api/forecast')
+def get_forecast():
+    """
+    各鄉鎮未來數週病例數預測 API（負二項季節性迴歸，含 50% / 95% 預測區間）
+    參數: county、township（逗號分隔，未指定時回傳全國與所有鄉鎮）
+    """
+    snapshot = data_store.current()
+    if snapshot is None or 'forecast' not in snapshot.data or not snapshot.has_artifact('forecast.npz'):
+        return jsonify({'error': '預測資料不存在，請先執行分析腳本'}), 404
+
+    summary = snapshot.data['forecast']
+    counties = [canonical_county_name(name) for name in _split_param('county')]
+    townships = _split_param('township')
+    county_rows = summary['counties']
+    if counties:
+        county_rows = [item for item in county_rows if item['縣市'] in counties]
+    return jsonify({
+        'as_of_week': summary['as_of_week'],
+        'horizon': summary['horizon'],
+        'weeks': summary['weeks'],
+        'model': summary['model'],
+        'national': summary['national'],
+        'counties': county_rows,
+        'townships': township_forecasts(snapshot, counties, townships),
+        'data_version': snapshot.version,
+    })
+
+
+@app.route('/api/flows')
+def get_flows():
+    """
+    感染地 → 居住地 流向 API
+    參數: county、township（逗號分隔，感染地或居住地符合即納入）、
+          start_year、end_year、include_local（是否包含同鄉鎮感染）、limit
+    回傳前 limit 大流向與各鄉鎮的流入 / 流出 / 本地感染病例數
+    """
+    snapshot = data_store.current()
+    if snapshot is None or not snapshot.has_artifact('flows.npz'):
+        return jsonify({'error': '流向資料不存在，請先執行分析腳本'}), 404
+    
+    try:
+        flows = snapshot.artifact('flows.npz')
+        origins = flows['header']['origins']
+        destinations = flows['header']['destinations']
+        counties = [canonical_county_name(name) for name in _split_param('county')]
+        townships = [name.replace('台', '臺') for name in _split_param('township')]
+        limit = int(request.args.get('limit', 50))
+        include_local = request.args.get('include_local', 'false').lower() in ('1', 'true', 'yes')
+        
+        mask = np.ones(len(flows['count']), dtype=bool)
+        if request.args.get('start_year'):
+            mask &= flows['year'] >= int(request.args['start_year'])
+        if request.args.get('end_year'):
+            mask &= flows['year'] <= int(request.args['end_year'])
+        
+        # 感染地對應的鄉鎮（境外或未知為 -1）
+        origin_township = flows['origin_township'][flows['origin']]
+        destination = flows['destination']
+        local = origin_township == destination
+        count = flows['count'].astype(np.int64)
+        
+        n_townships = len(destinations)
+        selected = np.ones(n_townships, dtype=bool)
+        if counties or townships:
+            selected = np.array([
+                (not counties or county in counties) and (not townships or township in townships)
+                for county, township in destinations
+            ], dtype=bool)
+        involved = selected[destination] | ((origin_township >= 0) & selected[np.maximum(origin_township, 0)])
+        mask &= involved
         
-        county_name = county_mapping.get(county, county)
+        # 各鄉鎮流入 / 流出 / 本地感染
+        cross = mask & ~local
+        inflow = np.bincount(destination[cross], weights=count[cross], minlength=n_townships)
+        outgoing = cross & (origin_township >= 0)
+        outflow = np.bincount(origin_township[outgoing], weights=count[outgoing], minlength=n_townships)
+        local_count = np.bincount(destination[mask & local], weights=count[mask & local], minlength=n_townships)
+        totals = [{
+            '縣市': destinations[i][0],
+            '鄉鎮': destinations[i][1],
+            '流入': int(inflow[i]),
+            '流出': int(outflow[i]),
+            '本地': int(local_count[i]),
+        } for i in np.flatnonzero(selected & ((inflow + outflow + local_count) > 0))]
         
-        # 確保使用正確的縣市名稱（處理「臺」vs「台」的差異）
-        # 先嘗試原始名稱，如果找不到再嘗試變體
-        print(f"請求的縣市: {county} -> 對應名稱: {county_name}")
+        # 合併年份後的前幾大流向
+        rows = np.flatnonzero(mask if include_local else cross)
+        pair = flows['origin'][rows].astype(np.int64) * n_townships + destination[rows]
+        keys, inverse = np.unique(pair, return_inverse=True)
+        pair_counts = np.bincount(inverse, weights=count[rows]) if len(rows) else np.zeros(0)
+        items = []
+        for i in np.argsort(-pair_counts, kind='stable')[:limit]:
+            origin, dest = divmod(int(keys[i]), n_townships)
+            items.append({
+                '感染縣市': origins[origin][0],
+                '感染地': origins[origin][1],
+                '居住縣市': destinations[dest][0],
+                '居住鄉鎮': destinations[dest][1],
+                '病例數': int(pair_counts[i]),
+            })
+        
+        return jsonify({
+            'total': int(count[rows].sum()),
+            'flows': items,
+            'townships': totals,
+            'data_version': snapshot.version,
+        })
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+
+@app.route('/api/serotype')
+def get_serotype():
+    """
+    血清型逐週序列與共同流行指標 API
+    參數: county（逗號分隔，未指定為全國）、start、end（YYYY-MM-DD，預設最近 52 週）
+    """
+    snapshot = data_store.current()
+    if snapshot is None or not snapshot.has_artifact('serotype.npz'):
+        return jsonify({'error': '血清型資料不存在，請先執行分析腳本'}), 404
+    
+    try:
+        ts = snapshot.artifact('timeseries.npz')
+        sero = snapshot.artifact('serotype.npz')
+        header = sero['header']
+        counties = [canonical_county_name(name) for name in _split_param('county')]
+        
+        weekly = sero['weekly']
+        if counties:
+            rows = [i for i, name in enumerate(header['counties']) if name in counties]
+            if not rows:
+                return jsonify({'error': '找不到符合條件的縣市'}), 404
+            weekly = weekly[:, rows]
+        counts = weekly.sum(axis=1, dtype=np.int64)
+        
+        first, last = series.day_range(ts['header'], request.args.get('start'), request.args.get('end'))
+        first_week = int(ts['week_index'][first])
+        last_week = int(ts['week_index'][last])
+        if not request.args.get('end'):
+            nonzero = np.flatnonzero(counts.sum(axis=0))
+            last_week = int(nonzero[-1]) if len(nonzero) else last_week
+        if not request.args.get('start'):
+            first_week = max(last_week - 51, 0)
+        
+        counts = counts[:, first_week:last_week + 1]
+        thresholds = header['thresholds']
+        indicators = serotype_metrics.co_circulation(counts, thresholds['min_share'], thresholds['min_cases'])
+        serotypes = header['serotypes']
+        
+        return jsonify({
+            '縣市': ','.join(counties) or '全國',
+            'labels': sero['week_labels'][first_week:last_week + 1].tolist(),
+            'series': {name: counts[i].tolist() for i, name in enumerate(serotypes)},
+            '主要血清型': [serotypes[d] if d >= 0 else None for d in indicators['dominant']],
+            '主要型比例': np.round(indicators['dominant_share'] * 100, 1).tolist(),
+            '共同流行型數': indicators['circulating'].tolist(),
+            '多樣性指數': np.round(indicators['diversity'], 3).tolist(),
+            'thresholds': thresholds,
+            'data_version': snapshot.version,
+        })
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+
+def pyramid_counts(snapshot, counties=None, townships=None, start_year=None, end_year=None):
+    """
+    從 pyramid.npz 切出指定區域與年份範圍，回傳 (代碼表, 性別 × 年齡層 的病例數)
+    沒有立方體時回傳 None
+    """
+    if snapshot is None or not snapshot.has_artifact('pyramid.npz'):
+        return None
+    arrays = snapshot.artifact('pyramid.npz')
+    header = arrays['header']
+    years = np.array(header['years'])
+    first = int(np.searchsorted(years, start_year)) if start_year is not None else 0
+    last = int(np.searchsorted(years, end_year, side='right')) - 1 if end_year is not None else len(years) - 1
+    
+    cube = arrays['cube']
+    if counties or townships:
+        rows = series.select_townships(header, arrays['township_county'], counties, townships)
+        cube = cube[rows]
+    counts = cube[:, first:last + 1].sum(axis=(0, 1), dtype=np.int64)
+    return header, counts
+
+
+def distribution(key, names, counts):
+    """病例數分布表（省略 0 例的類別，與分析結果的 person.gender / person.age 格式相同）"""
+    total = max(int(counts.sum()), 1)
+    return [{key: name, '病例數': int(counts[i]), '百分比': round(counts[i] / total * 100, 2)}
+            for i, name in enumerate(names) if counts[i] > 0]
+
+
+def pyramid_tables(header, counts):
+    """由 性別 × 年齡層 病例數取得性別、年齡層分布"""
+    return (distribution('性別', header['sexes'], counts.sum(axis=1)),
+            distribution('年齡層', header['ages'], counts.sum(axis=0)))
+
+
+def range_data(snapshot, county=None):
+    """
+    以累積和陣列計算 start / end 參數指定日期區間的縣市、鄉鎮、性別、年齡分布
+    county 為 None 時為全國；沒有累積和陣列時回傳 None
+    """
+    if snapshot is None or not snapshot.has_artifact('prefix_sums.npz'):
+        return None
+    arrays = snapshot.artifact('prefix_sums.npz')
+    header = arrays['header']
+    first, last = series.day_range(header, request.args.get('start'), request.args.get('end'))
+    start_date = np.datetime64(header['start_date'], 'D')
+    
+    counties = header['counties']
+    county_rows = np.arange(len(counties))
+    if county is not None:
+        county_rows = np.array([i for i, name in enumerate(counties) if name == county], dtype=np.int64)
+    county_counts = series.range_sum(arrays['county'][county_rows], first, last)
+    
+    town_rows = np.flatnonzero(np.isin(arrays['township_county'], county_rows))
+    town_counts = series.range_sum(arrays['township'][town_rows], first, last)
+    order = np.argsort(-town_counts, kind='stable')
+    townships = [{
+        '居住縣市': header['townships'][town_rows[i]][0],
+        '居住鄉鎮': header['townships'][town_rows[i]][1],
+        '病例數': int(town_counts[i]),
+    } for i in order if county is not None or town_counts[i] > 0]
+    
+    sex_counts = series.range_sum(arrays['county_sex'][county_rows], first, last).sum(axis=0)
+    age_counts = series.range_sum(arrays['county_age'][county_rows], first, last).sum(axis=0)
+    county_table = [{'居住縣市': counties[row], '病例數': int(county_counts[i])}
+                    for i, row in enumerate(county_rows) if county is not None or county_counts[i] > 0]
+    county_table.sort(key=lambda item: item['病例數'], reverse=True)
+    
+    return {
+        'range': {'start': str(start_date + first), 'end': str(start_date + last)},
+        'summary': {'total_cases': int(county_counts.sum()), '縣市': county or '全國', '鄉鎮數': len(townships)},
+        'location': {'county': county_table, 'township': townships},
+        'person': {
+            'gender': distribution('性別', header['sexes'], sex_counts),
+            'age': distribution('年齡層', header['ages'], age_counts),
+        },
+        'data_version': snapshot.version,
+    }
+
+
+def _has_range_params():
+    return bool(request.args.get('start') or request.args.get('end'))
+
+
+@app.route('/api/pyramid')
+def get_pyramid():
+    """
+    人口金字塔 API（性別 × 年齡層病例數）
+    參數: county、township（逗號分隔）、start_year、end_year
+    """
+    try:
+        counties = [canonical_county_name(name) for name in _split_param('county')]
+        townships = [name.replace('台', '臺') for name in _split_param('township')]
+        start_year = int(request.args['start_year']) if request.args.get('start_year') else None
+        end_year = int(request.args['end_year']) if request.args.get('end_year') else None
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    snapshot = data_store.current()
+    result = pyramid_counts(snapshot, counties, townships, start_year, end_year)
+    if result is None:
+        return jsonify({'error': '人口金字塔資料不存在，請先執行分析腳本'}), 404
+    
+    header, counts = result
+    gender, age = pyramid_tables(header, counts)
+    return jsonify({
+        '縣市': ','.join(counties) or '全國',
+        '鄉鎮': ','.join(townships) or '全部',
+        'sexes': header['sexes'],
+        'ages': header['ages'],
+        'counts': counts.tolist(),
+        'gender': gender,
+        'age': age,
+        'data_version': snapshot.version,
+    })
+
+
+COMPARE_METRICS = ('total', 'cases', 'gender', 'age', 'serotype')
+
+
+@app.route('/api/compare')
+def get_compare():
+    """
+    多縣市比較 API：所有縣市由同一組共用陣列一次計算，回傳對齊的序列
+    參數: counties（逗號分隔，必填）、metrics（total,cases,gender,age,serotype，預設前四項）、
+          freq=day|week|month|year（cases 的分組，預設 month）、start、end（YYYY-MM-DD）
+    """
+    snapshot = data_store.current()
+    if snapshot is None or not snapshot.has_artifact('prefix_sums.npz'):
+        return jsonify({'error': '比較資料不存在，請先執行分析腳本'}), 404
+    
+    try:
+        prefix = snapshot.artifact('prefix_sums.npz')
+        header = prefix['header']
+        names = [canonical_county_name(name) for name in _split_param('counties')]
+        metrics = _split_param('metrics') or ['total', 'cases', 'gender', 'age']
+        unknown = [metric for metric in metrics if metric not in COMPARE_METRICS]
+        if unknown:
+            raise ValueError(f"metrics 必須為 {', '.join(COMPARE_METRICS)} 之一")
+        county_index = {name: i for i, name in enumerate(header['counties'])}
+        missing = [name for name in names if name not in county_index]
+        if not names or missing:
+            return jsonify({'error': f"找不到縣市: {', '.join(missing) or '未指定 counties'}",
+                            'counties': header['counties']}), 404
+        rows = np.array([county_index[name] for name in names], dtype=np.int64)
+        first, last = series.day_range(header, request.args.get('start'), request.args.get('end'))
+        start_date = np.datetime64(header['start_date'], 'D')
         
-        # 過濾該縣市的資料
-        filtered_data = filter_data_by_county(data, county_name)
+        result = {
+            'counties': names,
+            'range': {'start': str(start_date + first), 'end': str(start_date + last)},
+            'metrics': {},
+            'data_version': snapshot.version,
+        }
+        if 'total' in metrics:
+            result['metrics']['total'] = series.range_sum(prefix['county'][rows], first, last).tolist()
+        if 'cases' in metrics:
+            # 縣市逐日病例數 = 累積和的差分，再以共用的週 / 月分組重新分組
+            daily = np.diff(prefix['county'][rows, first:last + 2], axis=1)
+            padded = np.zeros((len(rows), header['n_days']), dtype=np.int64)
+            padded[:, first:last + 1] = daily
+            labels, counts = series.rebin(padded, snapshot.artifact('timeseries.npz'),
+                                          request.args.get('freq', 'month'), first, last)
+            result['labels'] = labels
+            result['metrics']['cases'] = counts.tolist()
+        if 'gender' in metrics:
+            result['metrics']['gender'] = {
+                'labels': header['sexes'],
+                'values': series.range_sum(prefix['county_sex'][rows], first, last).tolist(),
+            }
+        if 'age' in metrics:
+            result['metrics']['age'] = {
+                'labels': header['ages'],
+                'values': series.range_sum(prefix['county_age'][rows], first, last).tolist(),
+            }
+        if 'serotype' in metrics and snapshot.has_artifact('serotype.npz'):
+            # 血清型以流行病學週儲存，區間頭尾以所在的整週計算
+            sero = snapshot.artifact('serotype.npz')
+            week_index = snapshot.artifact('timeseries.npz')['week_index']
+            sero_rows = [sero['header']['counties'].index(name) for name in names]
+            weeks = slice(int(week_index[first]), int(week_index[last]) + 1)
+            result['metrics']['serotype'] = {
+                'labels': sero['header']['serotypes'],
+                'values': sero['weekly'][:, sero_rows, weeks].sum(axis=2, dtype=np.int64).T.tolist(),
+            }
+        return jsonify(result)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+
+@app.route('/api/export')
+def export_data():
+    """
+    串流匯出 API
+    參數: kind=cases|counts、format=csv|ndjson|parquet、county、township（逗號分隔）、
+          start、end（YYYY-MM-DD）、columns（cases 的欄位，逗號分隔）、
+          freq=day|week|month|year 與 by=township|county（counts 的分組）
+    """
+    kind = request.args.get('kind', 'cases')
+    fmt = request.args.get('format', 'csv')
+    if fmt not in export.FORMATS:
+        return jsonify({'error': f"format 必須為 {', '.join(export.FORMATS)} 之一"}), 400
+    if fmt == 'parquet' and not export.parquet_available():
+        return jsonify({'error': 'Parquet 匯出需要安裝 pyarrow（pip install pyarrow）'}), 501
+    
+    counties = [canonical_county_name(name) for name in _split_param('county')]
+    townships = [name.replace('台', '臺') for name in _split_param('township')]
+    start = request.args.get('start')
+    end = request.args.get('end')
+    try:
+        for value in (start, end):
+            if value:
+                np.datetime64(value, 'D')
         
-        return jsonify(filtered_data)
+        if kind == 'cases':
+            if not CLEAN_DIR.exists():
+                return jsonify({'error': '清理後資料不存在，請先執行 python run_pipeline.py'}), 404
+            chunks = export.iter_cases(CLEAN_DIR, counties, townships, start, end, _split_param('columns'))
+        elif kind == 'counts':
+            snapshot = data_store.current()
+            if snapshot is None or not snapshot.has_artifact('timeseries.npz'):
+                return jsonify({'error': '時間序列資料不存在，請先執行分析腳本'}), 404
+            arrays = snapshot.artifact('timeseries.npz')
+            first, last = series.day_range(arrays['header'], start, end)
+            freq = request.args.get('freq', 'month')
+            if freq not in series.FREQUENCIES:
+                raise ValueError(f"freq 必須為 {', '.join(series.FREQUENCIES)} 之一")
+            rows = series.select_townships(arrays['header'], arrays['township_county'], counties, townships)
+            chunks = export.iter_counts(arrays, rows, freq, first, last, series.rebin,
+                                        by=request.args.get('by', 'township'))
+        else:
+            raise ValueError('kind 必須為 cases 或 counts')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    mimetype, extension = export.FORMATS[fmt]
+    response = Response(stream_with_context(export.STREAMERS[fmt](chunks)), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename=dengue_{kind}.{extension}'
+    return response
+
+
+@app.route('/api/clusters')
+def get_clusters():
+    """
+    時空掃描群聚 API（由 python src/scan_statistic.py 產生）
+    參數: county（只回傳包含該縣市鄉鎮的群聚）、max_p（p 值上限）
+    """
+    if not CLUSTERS_FILE.exists():
+        return jsonify({'error': '群聚資料不存在，請先執行 python src/scan_statistic.py'}), 404
+    
+    with open(CLUSTERS_FILE, 'r', encoding='utf-8') as f:
+        result = json.load(f)
+    
+    counties = [canonical_county_name(name) for name in _split_param('county')]
+    try:
+        max_p = float(request.args.get('max_p', 1.0))
+    except ValueError:
+        return jsonify({'error': 'max_p 必須為 0 到 1 之間的數值'}), 400
+    # NaN 與任何數比較皆為 False，需一併排除
+    if not 0 <= max_p <= 1:
+        return jsonify({'error': 'max_p 必須為 0 到 1 之間的數值'}), 400
+    clusters = [
+        cluster for cluster in result.get('clusters', [])
+        if cluster['p值'] <= max_p
+        and (not counties or any(member.split('|')[0] in counties for member in cluster['鄉鎮']))
+    ]
+    result['clusters'] = clusters
+    return jsonify(result)
+
+
+@app.route('/api/near_repeat')
+def get_near_repeat():
+    """
+    近重複時空交互作用（Knox 檢定）API（由 python src/near_repeat.py 產生）
+    參數: season（流行季，逗號分隔，未指定時回傳全部）
+    """
+    if not NEAR_REPEAT_FILE.exists():
+        return jsonify({'error': '近重複檢定結果不存在，請先執行 python src/near_repeat.py'}), 404
+    
+    with open(NEAR_REPEAT_FILE, 'r', encoding='utf-8') as f:
+        result = json.load(f)
+    
+    seasons = _split_param('season')
+    if seasons:
+        result['seasons'] = [item for item in result.get('seasons', []) if item['流行季'] in seasons]
+    return jsonify(result)
+
+
+@app.route('/api/data/<county>')
+def get_county_data(county):
+    """
+    取得特定縣市的資料 API
+    相同縣市與查詢參數的回應快取在記憶體中（資料版本更新時失效），
+    同時多個相同請求只會計算一次
+    """
+    snapshot = data_store.current()
+    if snapshot is None:
+        return jsonify({'error': '分析資料不存在，請先執行分析腳本'}), 404
+    
+    county_key = canonical_county_name(county)
+    try:
+        # 前端已有 since 版本的資料且之後沒有任何表格變更時，不必重新下載
+        since = _since_param()
+        if since is not None and snapshot.changed_since(since) == []:
+            return jsonify({'data_version': snapshot.version, 'since': since, 'unchanged': True})
+        params = tuple(sorted((key, value) for key, value in request.args.items(multi=True) if key != 'since'))
+        body, status = response_cache.get_or_compute(
+            snapshot.version, ('county', county_key, params),
+            lambda: _county_response(snapshot, county_key)
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except FileNotFoundError as e:
+        return jsonify({'error': str(e)}), 404
     except Exception as e:
         return jsonify({'error': str(e)}), 500
+    
+    response = Response(body, mimetype='application/json')
+    response.headers['X-Cache'] = status
+    return response
 
 
-def generate_complete_township_data(county_name, existing_township_data):
-    """生成完整的行政區列表（包含所有行政區，即使病例數為 0）"""
+def _county_response(snapshot, county_key):
+    """計算縣市資料的回應位元組（由回應快取呼叫）"""
+    # 指定日期區間時以累積和陣列計算，不需重新篩選病例表
+    if _has_range_params():
+        result = range_data(snapshot, county_key)
+        if result is None:
+            raise FileNotFoundError('日期區間查詢需要重新執行分析腳本')
+        return json.dumps(result, ensure_ascii=False).encode('utf-8')
+    
+    # 縣市名稱對應（處理可能的命名差異）
+    county_mapping = {
+        '臺南市': '台南市',
+        '臺北市': '台北市'
+    }
+    county_name = county_mapping.get(county_key, county_key)
+    
+    # 確保使用正確的縣市名稱（處理「臺」vs「台」的差異）
+    # 先嘗試原始名稱，如果找不到再嘗試變體
+    print(f"請求的縣市: {county_key} -> 對應名稱: {county_name}")
+    
+    # 過濾該縣市的資料
+    filtered_data = filter_data_by_county(snapshot.data, county_name, snapshot)
+    filtered_data['data_version'] = snapshot.version
+    return json.dumps(filtered_data, ensure_ascii=False).encode('utf-8')
+
+
+@app.route('/api/data/<county>/villages')
+def get_village_data(county):
+    """
+    村里層級病例數 API（查詢單一鄉鎮，直接切片稀疏索引）
+    參數: township（必填）、start_year、end_year
+    """
+    snapshot = data_store.current()
+    if snapshot is None or not snapshot.has_artifact('villages.npz'):
+        return jsonify({'error': '村里資料不存在，請先執行分析腳本'}), 404
+    
+    arrays = snapshot.artifact('villages.npz')
+    header = arrays['header']
+    county_name = canonical_county_name(county)
+    township = request.args.get('township', '').strip().replace('台', '臺')
+    available = [name for c, name in header['townships'] if c == county_name]
+    if township not in available:
+        return jsonify({'error': '請以 township 參數指定鄉鎮', 'townships': available}), 400
+    
+    try:
+        row = header['townships'].index([county_name, township])
+        first, last = arrays['village_ptr'][row], arrays['village_ptr'][row + 1]
+        entry_ptr = arrays['entry_ptr']
+        entries = slice(entry_ptr[first], entry_ptr[last])
+        years = arrays['entry_year'][entries]
+        counts = arrays['entry_count'][entries]
+        owner = np.repeat(np.arange(first, last), np.diff(entry_ptr[first:last + 1]))
+        
+        keep = np.ones(len(years), dtype=bool)
+        if request.args.get('start_year'):
+            keep &= years >= int(request.args['start_year'])
+        if request.args.get('end_year'):
+            keep &= years <= int(request.args['end_year'])
+        
+        totals = np.bincount(owner[keep] - first, weights=counts[keep], minlength=last - first)
+        villages = []
+        for i in np.argsort(-totals, kind='stable'):
+            mask = keep & (owner == first + i)
+            villages.append({
+                '村里': header['villages'][first + i],
+                '病例數': int(totals[i]),
+                '年度': {str(year): int(count) for year, count in zip(years[mask], counts[mask])},
+            })
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify({
+        '縣市': county_name,
+        '鄉鎮': township,
+        'villages': villages,
+        'data_version': snapshot.version,
+    })
+
+
+def township_totals(snapshot, county_name):
+    """由累積和陣列最後一欄取得縣市各鄉鎮的總病例數；沒有該陣列時回傳 None"""
+    if snapshot is None or not snapshot.has_artifact('prefix_sums.npz'):
+        return None
+    arrays = snapshot.artifact('prefix_sums.npz')
+    totals = arrays['township'][:, -1]
+    return {township: int(totals[i]) for i, (county, township) in enumerate(arrays['header']['townships'])
+            if county == county_name and township not in ('未知', '其他')}
+
+
+def generate_complete_township_data(county_name, existing_township_data, snapshot=None):
+    """
+    生成完整的行政區列表（包含所有行政區，即使病例數為 0）
+    病例數優先取自已發布的累積和陣列，沒有時才（非精簡模式下）重新讀取原始資料
+    """
     try:
         # 從 GeoJSON 中讀取該縣市的所有行政區
         geojson_file = STATIC_DATA_DIR / "taiwan_township.geojson"
@@ -169,8 +1213,11 @@ def generate_complete_township_data(county_name, existing_township_data):
             if township:
                 existing_cases[township] = item.get('病例數', 0)
         
-        # 如果原始資料存在，從中讀取更完整的病例數
-        if RAW_DATA.exists():
+        # 從累積和陣列或原始資料取得更完整的病例數
+        totals = township_totals(snapshot, county_name.replace('台', '臺'))
+        if totals is not None:
+            existing_cases.update(totals)
+        elif RAW_DATA.exists() and not LEAN_MODE:
             df = pd.read_csv(RAW_DATA, encoding='utf-8-sig', low_memory=False)
             
             # 找出匹配的縣市名稱
@@ -210,8 +1257,8 @@ def generate_complete_township_data(county_name, existing_township_data):
         return existing_township_data
 
 
-def filter_data_by_county(data, county_name):
-    """過濾特定縣市的資料"""
+def filter_data_by_county(data, county_name, snapshot=None):
+    """過濾特定縣市的資料（有 pyramid.npz 時性別與年齡分布直接由立方體切片）"""
     filtered = {
         'summary': {},
         'time': {},
@@ -259,11 +1306,30 @@ def filter_data_by_county(data, county_name):
         
         # 生成完整的行政區列表（包含所有行政區，即使病例數為 0）
         # 這對於地圖顯示很重要，因為地圖需要顯示所有行政區
-        complete_township_data = generate_complete_township_data(matching_county_name, township_data)
+        complete_township_data = generate_complete_township_data(matching_county_name, township_data, snapshot)
         filtered['location']['township'] = complete_township_data
         filtered['location']['township_top30'] = township_data  # 保留 top30 用於其他用途
         print(f"過濾鄉鎮資料: 找到 {len(township_data)} 筆 top30 記錄，完整列表 {len(complete_township_data)} 筆")
         
+        # 血清型逐年分布（只保留該縣市）
+        if 'serotype' in data:
+            filtered['serotype'] = {
+                'serotypes': data['serotype']['serotypes'],
+                'yearly': data['serotype']['by_county'].get(matching_county_name.replace('台', '臺'), []),
+            }
+
+        # 各鄉鎮未來數週病例數預測（只保留該縣市）
+        forecast_townships = township_forecasts(snapshot, [matching_county_name.replace('台', '臺')])
+        if 'forecast' in data and forecast_townships is not None:
+            forecast = data['forecast']
+            filtered['forecast'] = {
+                'as_of_week': forecast['as_of_week'],
+                'weeks': forecast['weeks'],
+                'county': next((item['weeks'] for item in forecast['counties']
+                                if item['縣市'] == matching_county_name.replace('台', '臺')), []),
+                'townships': forecast_townships,
+            }
+
         # 縣市年度趨勢（只保留該縣市）
         county_yearly = [item for item in data['location'].get('county_yearly', [])
                         if item.get('居住縣市') == matching_county_name]
@@ -274,9 +1340,12 @@ def filter_data_by_county(data, county_name):
     if 'time' in data:
         filtered['time'] = data['time']
     
-    # 從原始資料計算該縣市的性別和年齡分布
+    # 性別和年齡分布：優先使用預先計算的立方體，沒有時才從原始資料計算
+    pyramid = pyramid_counts(snapshot, [county_name.replace('台', '臺')])
     try:
-        if RAW_DATA.exists():
+        if pyramid is not None:
+            filtered['person']['gender'], filtered['person']['age'] = pyramid_tables(*pyramid)
+        elif RAW_DATA.exists() and not LEAN_MODE:
             df = pd.read_csv(RAW_DATA, encoding='utf-8-sig', low_memory=False)
             
             # 清理資料
@@ -421,8 +1490,8 @@ def filter_data_by_county(data, county_name):
                 filtered['person']['gender'] = []
                 filtered['person']['age'] = []
         else:
-            # 如果原始資料不存在，使用空資料（不應該使用整體資料）
-            print(f"警告: 原始資料檔案不存在，無法計算縣市特定的人群分析資料")
+            # 如果原始資料不存在或為精簡模式，使用空資料（不應該使用整體資料）
+            print(f"警告: 沒有 pyramid.npz 且無法讀取原始資料，無法計算縣市特定的人群分析資料")
             filtered['person']['gender'] = []
             filtered['person']['age'] = []
     except Exception as e:
@@ -476,5 +1545,17 @@ def favicon():
     return '', 204  # No Content
 
 
+def report_import_time():
+    """啟動時回報模組載入時間，以及 pandas / numpy 是否仍未載入"""
+    elapsed = (time.perf_counter() - _IMPORT_STARTED) * 1000
+    # 延遲載入的模組在第一次使用前仍是 LazyLoader 的代理類別
+    loaded = [name for name in ('pandas', 'numpy') if type(sys.modules.get(name)) is types.ModuleType]
+    print(f"網站模組載入 {elapsed:.0f} ms（{'精簡模式，' if LEAN_MODE else ''}"
+          f"{'已載入 ' + '、'.join(loaded) if loaded else 'pandas / numpy 延遲至第一次使用時載入'}）")
+
+
+report_import_time()
+
+
 if __name__ == '__main__':
     app.run(debug=True, host='127.0.0.1', port=8080)
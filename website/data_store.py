@@ -0,0 +1,145 @@
+"""
+分析資料的記憶體快照與熱更新
+讀取端只取用目前的快照參考，不需要加鎖；背景執行緒偵測到新版本時，
+先在旁邊完整載入新快照，再以一次參考替換切換（雙緩衝），伺服器不需重啟
+"""
+
+import json
+import threading
+import time
+from pathlib import Path
+
+
+class DataSnapshot:
+    """單一資料版本的內容（建立後不再修改，可安全地被多個請求共用）"""
+
+    def __init__(self, version, data, directory, published_at='', tables=None):
+        self.version = version
+        self.data = data
+        self.directory = directory
+        self.published_at = published_at
+        # 每張表的 {hash, changed_in}（舊版 manifest 沒有時為空，無法提供差異更新）
+        self.tables = tables or {}
+        # 預先序列化，/api/data 直接回傳位元組，不必每次重新 jsonify
+        self.json_bytes = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self._artifacts = {}
+        self._artifact_lock = threading.Lock()
+
+    def artifact_path(self, name):
+        return Path(self.directory) / name
+
+    def changed_since(self, version):
+        """版本 version 之後有變更的表格名稱；無法判斷（沒有表格資訊或版本不連續）時回傳 None"""
+        if not self.tables or version > self.version:
+            return None
+        return [name for name, table in self.tables.items() if table['changed_in'] > version]
+
+    def has_artifact(self, name):
+        return self.artifact_path(name).exists()
+
+    def artifact(self, name):
+        """
+        延遲載入同一版本的附加陣列檔（.npz），每個快照只載入一次
+        npz 中的 header 為 JSON 字串形式的代碼表，載入時直接解析為 dict
+        """
+        cached = self._artifacts.get(name)
+        if cached is not None:
+            return cached
+        with self._artifact_lock:
+            if name not in self._artifacts:
+                import numpy as np
+                with np.load(self.artifact_path(name), allow_pickle=False) as npz:
+                    arrays = {key: npz[key] for key in npz.files}
+                if 'header' in arrays:
+                    arrays['header'] = json.loads(str(arrays['header']))
+                self._artifacts[name] = arrays
+            return self._artifacts[name]
+
+
+class DataStore:
+    """
+    以 manifest.json 為準的資料版本管理
+    沒有 manifest（舊的分析輸出）時退回直接讀取 dengue_analysis.json
+    """
+
+    def __init__(self, processed_dir, poll_interval=2.0):
+        self.processed_dir = Path(processed_dir)
+        self.manifest_file = self.processed_dir / "manifest.json"
+        self.legacy_file = self.processed_dir / "dengue_analysis.json"
+        self.poll_interval = poll_interval
+        self._snapshot = None
+        self._signature = None
+        self._refresh_lock = threading.Lock()
+        self._changed = threading.Condition()
+        self._watcher = None
+
+    def current(self):
+        """取得目前的快照（可能為 None）；讀取端不加鎖"""
+        if self._snapshot is None:
+            self.refresh()
+        return self._snapshot
+
+    def _source_signature(self):
+        source = self.manifest_file if self.manifest_file.exists() else self.legacy_file
+        try:
+            stat = source.stat()
+        except FileNotFoundError:
+            return None
+        return (str(source), stat.st_mtime_ns, stat.st_size)
+
+    def _load(self):
+        if self.manifest_file.exists():
+            with open(self.manifest_file, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            directory = self.processed_dir / manifest['path']
+            with open(directory / "dengue_analysis.json", 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            return DataSnapshot(manifest['version'], data, directory, manifest.get('published_at', ''),
+                                manifest.get('tables'))
+
+        with open(self.legacy_file, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return DataSnapshot(data.get('data_version', 0), data, self.processed_dir, data.get('last_updated', ''))
+
+    def refresh(self):
+        """檢查是否有新版本，有的話載入並切換；回傳是否切換"""
+        with self._refresh_lock:
+            signature = self._source_signature()
+            if signature is None or signature == self._signature:
+                return False
+            try:
+                snapshot = self._load()
+            except (OSError, ValueError, KeyError) as e:
+                # 保留舊快照繼續服務，下次輪詢再試
+                print(f"載入新資料版本失敗，繼續使用目前版本: {e}")
+                return False
+            previous = self._snapshot
+            self._snapshot = snapshot
+            self._signature = signature
+            if previous is None or previous.version != snapshot.version:
+                print(f"已載入資料版本 v{snapshot.version}")
+                with self._changed:
+                    self._changed.notify_all()
+            return True
+
+    def wait_for_change(self, version, timeout):
+        """等待資料版本不同於 version（最多 timeout 秒），回傳當時的快照"""
+        if self._snapshot is None:
+            self.refresh()
+        with self._changed:
+            self._changed.wait_for(
+                lambda: self._snapshot is not None and self._snapshot.version != version, timeout)
+        return self._snapshot
+
+    def start_watcher(self):
+        """啟動背景執行緒定期檢查新版本"""
+        if self._watcher is not None:
+            return
+
+        def watch():
+            while True:
+                time.sleep(self.poll_interval)
+                self.refresh()
+
+        self._watcher = threading.Thread(target=watch, name="data-store-watcher", daemon=True)
+        self._watcher.start()
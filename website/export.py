@@ -0,0 +1,178 @@
+"""
+病例資料與統計表的串流匯出（CSV、NDJSON、Parquet）
+篩選條件盡量往下推：年份只開啟相關的 year=YYYY.csv 分割，欄位只讀取需要的欄位，
+每個分割以固定列數分批讀取、篩選、輸出，伺服器記憶體不隨資料筆數成長
+"""
+
+import io
+
+import numpy as np
+import pandas as pd
+
+from case_codes import canonical_township_names
+
+FORMATS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'ndjson': ('application/x-ndjson; charset=utf-8', 'ndjson'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+CHUNK_ROWS = 20_000
+
+
+def _partitions(clean_dir, start=None, end=None):
+    """依日期範圍挑出需要讀取的年度分割"""
+    first_year = int(start[:4]) if start else None
+    last_year = int(end[:4]) if end else None
+    paths = []
+    for path in sorted(clean_dir.glob('year=*.csv')):
+        year = int(path.stem.split('=', 1)[1])
+        if (first_year is None or year >= first_year) and (last_year is None or year <= last_year):
+            paths.append(path)
+    return paths
+
+
+def iter_cases(clean_dir, counties=None, townships=None, start=None, end=None, columns=None,
+               chunk_rows=CHUNK_ROWS):
+    """
+    回傳逐批產生符合條件病例的產生器（DataFrame，全部欄位為字串）
+    counties 為「臺」字的縣市名稱，townships 為鄉鎮名稱，start / end 為 YYYY-MM-DD
+    欄位名稱在開始串流前就先檢查，錯誤時直接拋出 ValueError
+    """
+    paths = _partitions(clean_dir, start, end)
+    if not paths:
+        return iter(())
+    available = list(pd.read_csv(paths[0], nrows=0, encoding='utf-8').columns)
+    if columns:
+        unknown = [column for column in columns if column not in available]
+        if unknown:
+            raise ValueError(f"找不到欄位: {', '.join(unknown)}")
+    output_columns = columns or available
+    needed = set(output_columns) | {'發病日期'}
+    if counties or townships:
+        needed |= {'居住縣市', '居住鄉鎮'}
+    usecols = [column for column in available if column in needed]
+    return _read_chunks(paths, usecols, output_columns, counties, townships, start, end, chunk_rows)
+
+
+def _read_chunks(paths, usecols, output_columns, counties, townships, start, end, chunk_rows):
+    for path in paths:
+        reader = pd.read_csv(path, encoding='utf-8', dtype=str, keep_default_na=False, na_values=[''],
+                             usecols=usecols, chunksize=chunk_rows)
+        for chunk in reader:
+            mask = np.ones(len(chunk), dtype=bool)
+            if start:
+                mask &= (chunk['發病日期'] >= start).to_numpy()
+            if end:
+                mask &= (chunk['發病日期'] <= end).to_numpy()
+            if counties:
+                mask &= chunk['居住縣市'].isin(counties).to_numpy()
+            if townships:
+                # 直轄市的舊「市/鎮/鄉」名稱視同「區」（與分析階段相同的統一規則）
+                _, names = canonical_township_names(chunk['居住縣市'], chunk['居住鄉鎮'])
+                mask &= np.isin(names, townships) | chunk['居住鄉鎮'].isin(townships).to_numpy()
+            if mask.any():
+                yield chunk.loc[mask, output_columns]
+
+
+def iter_counts(arrays, rows, freq, first, last, rebin, by='township', chunk_rows=CHUNK_ROWS):
+    """
+    由時間序列立方體產生 鄉鎮（或縣市）× 期間 的長表病例數
+    rebin 為 series.rebin；每批最多 chunk_rows 列
+    """
+    header = arrays['header']
+    matrix = arrays['daily'][rows]
+    names = [header['townships'][row] for row in rows]
+    if by == 'county':
+        county_codes = arrays['township_county'][rows]
+        unique, inverse = np.unique(county_codes, return_inverse=True)
+        grouped = np.zeros((len(unique), matrix.shape[1]), dtype=np.int64)
+        np.add.at(grouped, inverse, matrix)
+        matrix = grouped
+        names = [[header['counties'][code]] for code in unique]
+
+    labels, counts = rebin(matrix, arrays, freq, first, last)
+    per_chunk = max(chunk_rows // max(len(labels), 1), 1)
+    for offset in range(0, len(names), per_chunk):
+        block = counts[offset:offset + per_chunk]
+        block_names = names[offset:offset + per_chunk]
+        frame = pd.DataFrame({
+            '縣市': np.repeat([name[0] for name in block_names], len(labels)),
+            '期間': np.tile(labels, len(block_names)),
+            '病例數': block.reshape(-1),
+        })
+        if by != 'county':
+            frame.insert(1, '鄉鎮', np.repeat([name[1] for name in block_names], len(labels)))
+        yield frame
+
+
+def stream_csv(chunks):
+    header = True
+    for chunk in chunks:
+        yield chunk.to_csv(index=False, header=header).encode('utf-8')
+        header = False
+
+
+def stream_ndjson(chunks):
+    for chunk in chunks:
+        text = chunk.to_json(orient='records', lines=True, force_ascii=False)
+        yield (text if text.endswith('\n') else text + '\n').encode('utf-8')
+
+
+class _StreamSink(io.RawIOBase):
+    """接收 ParquetWriter 寫出的位元組，每寫完一個 row group 就交給回應送出"""
+
+    def __init__(self):
+        super().__init__()
+        self._parts = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        data = bytes(data)
+        self._parts.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b''.join(self._parts)
+        self._parts.clear()
+        return data
+
+
+def parquet_available():
+    try:
+        import pyarrow.parquet  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def stream_parquet(chunks):
+    """每個批次寫成一個 row group（需要 pyarrow）"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    sink = _StreamSink()
+    writer = None
+    schema = None
+    for chunk in chunks:
+        if writer is None:
+            # 字串欄位固定為 string，避免第一批全為空值時推斷成 null 型別
+            schema = pa.schema([
+                (name, pa.string() if dtype == object else pa.from_numpy_dtype(dtype))
+                for name, dtype in chunk.dtypes.items()
+            ])
+            writer = pq.ParquetWriter(sink, schema)
+        writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+        yield sink.drain()
+    if writer is not None:
+        writer.close()
+        yield sink.drain()
+
+
+STREAMERS = {'csv': stream_csv, 'ndjson': stream_ndjson, 'parquet': stream_parquet}
@@ -0,0 +1,100 @@
+"""
+計算結果的回應快取
+- 以位元組數為上限的 LRU，超過上限時淘汰最久未使用的回應
+- 快取與資料版本綁定，較新的版本出現時整批失效；仍持有舊快照的請求直接計算，不讀寫快取
+- 同一個鍵同時有多個請求未命中時只計算一次（single-flight），其他請求等待結果
+"""
+
+import threading
+from collections import OrderedDict
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+class _Flight:
+    """正在計算中的一個鍵"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class ResponseCache:
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._version = None
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def _reset(self, version):
+        self._entries.clear()
+        self._size = 0
+        self._version = version
+
+    def _store(self, key, value):
+        if len(value) > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._size -= len(old)
+        self._entries[key] = value
+        self._size += len(value)
+        while self._size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= len(evicted)
+
+    def get_or_compute(self, version, key, compute):
+        """
+        取得 key 在 version 的回應位元組，未命中時呼叫 compute()
+        回傳 (位元組, 狀態)，狀態為 'HIT'、'MISS'、'COALESCED'（等待其他請求的計算結果）
+        或 'BYPASS'（version 比快取的版本舊，例如熱更新期間仍持有舊快照的請求）
+        compute 發生例外時不寫入快取，等待中的請求會收到同一個例外
+        """
+        with self._lock:
+            # 舊版本的請求不可清空或寫入新版本的快取
+            stale = self._version is not None and version < self._version
+            if not stale:
+                if version != self._version:
+                    self._reset(version)
+                value = self._entries.get(key)
+                if value is not None:
+                    self._entries.move_to_end(key)
+                    return value, 'HIT'
+                flight = self._inflight.get((version, key))
+                leader = flight is None
+                if leader:
+                    flight = self._inflight[(version, key)] = _Flight()
+
+        if stale:
+            return compute(), 'BYPASS'
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value, 'COALESCED'
+
+        try:
+            flight.value = compute()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop((version, key), None)
+                # 計算期間資料版本已更新時不寫入舊版本的結果
+                if flight.error is None and version == self._version:
+                    self._store(key, flight.value)
+            flight.event.set()
+        return flight.value, 'MISS'
+
+    def stats(self):
+        with self._lock:
+            return {
+                'version': self._version,
+                'entries': len(self._entries),
+                'bytes': self._size,
+                'max_bytes': self.max_bytes,
+            }
@@ -0,0 +1,107 @@
+"""
+時間序列立方體（timeseries.npz）的查詢
+只做切片與 np.add.reduceat 分組，日期分組（流行病學週、月）已在分析階段預先計算；
+長序列可用 LTTB（Largest-Triangle-Three-Buckets）一次對多條序列降取樣
+"""
+
+import numpy as np
+
+FREQUENCIES = ('day', 'week', 'month', 'year')
+
+
+def date_to_index(header, value, default):
+    """把 YYYY-MM-DD 轉為立方體的日序號（超出範圍時截斷）"""
+    if not value:
+        return default
+    start = np.datetime64(header['start_date'], 'D')
+    index = int((np.datetime64(value, 'D') - start).astype(int))
+    return min(max(index, 0), header['n_days'] - 1)
+
+
+def day_range(header, start=None, end=None):
+    """解析查詢的起訖日期，回傳含頭含尾的日序號範圍"""
+    first = date_to_index(header, start, 0)
+    last = date_to_index(header, end, header['n_days'] - 1)
+    if first > last:
+        raise ValueError('start 不可晚於 end')
+    return first, last
+
+
+def select_townships(header, township_county, counties=None, townships=None):
+    """
+    依縣市 / 鄉鎮名稱選出立方體的列
+    counties、townships 為已統一為「臺」字的名稱列表，皆為空時回傳全部鄉鎮
+    """
+    county_index = {name: i for i, name in enumerate(header['counties'])}
+    rows = np.arange(len(header['townships']))
+    if counties:
+        wanted = [county_index[name] for name in counties if name in county_index]
+        rows = rows[np.isin(township_county, wanted)]
+    if townships:
+        names = set(townships)
+        rows = np.array([row for row in rows if header['townships'][row][1] in names], dtype=np.int64)
+    return rows
+
+
+def rebin(matrix, arrays, freq, first, last):
+    """
+    將 列 × 日 的矩陣切出 [first, last] 並重新分組為週 / 月 / 年
+    回傳 (分組標籤列表, 列 × 分組 的 int64 矩陣)
+    """
+    if freq not in FREQUENCIES:
+        raise ValueError(f"freq 必須為 {', '.join(FREQUENCIES)} 之一")
+    window = np.asarray(matrix[:, first:last + 1], dtype=np.int64)
+    if freq == 'day':
+        start = np.datetime64(arrays['header']['start_date'], 'D')
+        labels = (start + np.arange(first, last + 1)).astype(str)
+        return labels.tolist(), window
+
+    index = arrays[f'{freq}_index'][first:last + 1]
+    boundaries = np.flatnonzero(np.r_[True, index[1:] != index[:-1]])
+    labels = arrays[f'{freq}_labels'][index[boundaries]]
+    return labels.tolist(), np.add.reduceat(window, boundaries, axis=1)
+
+
+def range_sum(prefix, first, last):
+    """以累積和陣列計算 [first, last] 日的病例數（最後一軸為日，長度 n_days + 1）"""
+    return prefix[..., last + 1].astype(np.int64) - prefix[..., first]
+
+
+def lttb(matrix, n_out):
+    """
+    對矩陣的每一列（一條序列，x 為欄序號）做 LTTB 降取樣，回傳 列 × n_out 的欄序號
+    各列共用相同的分桶，逐桶計算但每一步同時處理所有列
+    """
+    matrix = np.asarray(matrix, dtype=np.float64)
+    n_rows, n = matrix.shape
+    if n_out >= n or n_out < 3:
+        return np.broadcast_to(np.arange(n), (n_rows, n)).copy()
+
+    # 第一點與最後一點固定保留，中間的點平均分為 n_out - 2 桶
+    edges = (np.linspace(1, n - 1, n_out - 1)).astype(np.int64)
+    selected = np.empty((n_rows, n_out), dtype=np.int64)
+    selected[:, 0] = 0
+    selected[:, -1] = n - 1
+    rows = np.arange(n_rows)
+    previous = np.zeros(n_rows, dtype=np.int64)
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # 下一桶的平均點（最後一桶的下一點為序列終點）
+        next_lo, next_hi = (edges[i + 1], edges[i + 2]) if i + 2 < len(edges) else (n - 1, n)
+        next_x = (next_lo + next_hi - 1) / 2
+        next_y = matrix[:, next_lo:next_hi].mean(axis=1)
+        prev_x = previous.astype(np.float64)
+        prev_y = matrix[rows, previous]
+        x = np.arange(lo, hi, dtype=np.float64)
+        area = np.abs((prev_x[:, None] - next_x) * (matrix[:, lo:hi] - prev_y[:, None])
+                      - (prev_x[:, None] - x[None, :]) * (next_y - prev_y)[:, None])
+        previous = lo + np.argmax(area, axis=1)
+        selected[:, i + 1] = previous
+    return selected
+
+
+def zoom_level(window, points):
+    """視窗長度為 window、目標為 points 點時的縮放層級：每桶 2 ** level 個期間（0 為不降取樣）"""
+    if window <= points:
+        return 0
+    return int(np.ceil(np.log2(window / points)))
@@ -74,6 +74,7 @@ async function loadData(countyCode, countyName) {
         renderCharts();
         
         console.log('縣市資料渲染完成');
+        subscribeDataUpdates(countyCode);
     } catch (error) {
         console.error('載入縣市資料錯誤:', error);
         const errorDiv = document.createElement('div');
@@ -92,6 +93,82 @@ async function loadData(countyCode, countyName) {
     }
 }
 
+// 資料更新：伺服器發布新版本時（/api/events 推送版本號）帶上目前版本重新查詢，
+// 之後沒有任何表格變更時伺服器只回傳 unchanged，不必重新下載縣市資料
+let dataEvents = null;
+let updatingData = false;
+
+function subscribeDataUpdates(countyCode) {
+    if (dataEvents || !window.EventSource) return;
+    dataEvents = new EventSource('/api/events');
+    dataEvents.addEventListener('version', function(event) {
+        const { version } = JSON.parse(event.data);
+        if (analysisData && analysisData.data_version !== undefined && version > analysisData.data_version) {
+            refreshCountyData(countyCode);
+        }
+    });
+    // 伺服器的串流連線數已滿（503）時連線直接關閉，改為定期查詢 /api/version
+    dataEvents.onerror = function() {
+        if (dataEvents.readyState === EventSource.CLOSED) {
+            pollDataVersion(function() { refreshCountyData(countyCode); });
+        }
+    };
+}
+
+let versionPoll = null;
+
+function pollDataVersion(onNewVersion) {
+    if (versionPoll) return;
+    versionPoll = setInterval(async function() {
+        try {
+            const response = await fetch('/api/version');
+            // 靜態網站沒有 /api/version，不再查詢
+            if (response.status === 404) {
+                clearInterval(versionPoll);
+                return;
+            }
+            if (!response.ok) return;
+            const { version } = await response.json();
+            if (analysisData && analysisData.data_version !== undefined && version > analysisData.data_version) {
+                onNewVersion();
+            }
+        } catch (error) {
+            console.error('查詢資料版本錯誤:', error);
+        }
+    }, 60000);
+}
+
+async function refreshCountyData(countyCode) {
+    if (updatingData) return;
+    updatingData = true;
+    try {
+        const since = analysisData.data_version;
+        const response = await fetch(`/api/data/${countyCode}?since=${since}`);
+        if (!response.ok) {
+            throw new Error(`無法載入更新資料: ${response.status}`);
+        }
+        const result = await response.json();
+        if (result.unchanged) {
+            analysisData.data_version = result.data_version;
+            console.log(`資料版本 v${result.data_version} 沒有變更`);
+            return;
+        }
+        analysisData = result;
+        console.log(`縣市資料已更新: v${since} -> v${result.data_version}`);
+        
+        document.querySelectorAll('canvas').forEach(canvas => {
+            const chart = Chart.getChart(canvas);
+            if (chart) chart.destroy();
+        });
+        renderSummary();
+        renderCharts();
+    } catch (error) {
+        console.error('更新縣市資料錯誤:', error);
+    } finally {
+        updatingData = false;
+    }
+}
+
 // 格式化數字
 function formatNumber(num) {
     if (num === null || num === undefined) return '-';
@@ -135,6 +212,7 @@ function renderCharts() {
     renderDistrictTable();
     renderDistrictChart();
     renderDistrictYearlyChart();
+    renderForecastTable();
     renderGenderChart();
     renderAgeChart();
 }
@@ -929,6 +1007,57 @@ function renderDistrictTable() {
     }).join('');
 }
 
+// 渲染各行政區未來數週病例數預測表（預測平均與 95% 預測區間）
+function renderForecastTable() {
+    const section = document.getElementById('forecastSection');
+    const thead = document.getElementById('forecastTableHead');
+    const tbody = document.getElementById('forecastTableBody');
+    if (!thead || !tbody) return;
+
+    const forecast = analysisData.forecast;
+    if (!forecast || !forecast.townships || forecast.townships.length === 0) {
+        if (section) section.style.display = 'none';
+        return;
+    }
+    if (section) section.style.display = '';
+
+    const note = document.getElementById('forecastNote');
+    if (note) {
+        note.textContent = `以截至 ${forecast.as_of_week} 的每週病例數預測，括號內為 95% 預測區間；未列出的行政區近年無病例，預測為 0。`;
+    }
+
+    const formatWeek = (week) => `${formatNumber(week.預測)}<span class="interval-text">(${week['95%下限']}–${week['95%上限']})</span>`;
+    thead.innerHTML = `
+        <tr>
+            <th>排名</th>
+            <th>行政區</th>
+            ${forecast.weeks.map(label => `<th>${label}</th>`).join('')}
+            <th>合計</th>
+        </tr>
+    `;
+
+    const rows = forecast.townships.map((item, index) => `
+        <tr>
+            <td>${index + 1}</td>
+            <td>${item.鄉鎮}</td>
+            ${item.weeks.map(week => `<td class="number-cell">${formatWeek(week)}</td>`).join('')}
+            <td class="number-cell">${formatNumber(item.預測合計)}</td>
+        </tr>
+    `);
+    if (forecast.county && forecast.county.length > 0) {
+        const total = forecast.county.reduce((sum, week) => sum + week.預測, 0);
+        rows.push(`
+            <tr>
+                <td></td>
+                <td>全縣市</td>
+                ${forecast.county.map(week => `<td class="number-cell">${formatWeek(week)}</td>`).join('')}
+                <td class="number-cell">${formatNumber(Math.round(total * 10) / 10)}</td>
+            </tr>
+        `);
+    }
+    tbody.innerHTML = rows.join('');
+}
+
 // 行政區分布圖
 function renderDistrictChart() {
     const ctx = document.getElementById('districtChart');
@@ -71,6 +71,7 @@ async function loadData() {
         renderCharts();
         
         console.log('資料渲染完成');
+        subscribeDataUpdates();
     } catch (error) {
         console.error('載入資料錯誤:', error);
         const errorMsg = error.message || '未知錯誤';
@@ -101,6 +102,101 @@ async function loadData() {
     }
 }
 
+// 資料更新：伺服器發布新版本時（/api/events 推送版本號）只下載變更的表格
+let dataEvents = null;
+let updatingData = false;
+
+function subscribeDataUpdates() {
+    if (dataEvents || !window.EventSource) return;
+    dataEvents = new EventSource('/api/events');
+    dataEvents.addEventListener('version', function(event) {
+        const { version } = JSON.parse(event.data);
+        if (analysisData && analysisData.data_version !== undefined && version > analysisData.data_version) {
+            applyDataDelta();
+        }
+    });
+    // 伺服器的串流連線數已滿（503）時連線直接關閉，改為定期查詢 /api/version
+    dataEvents.onerror = function() {
+        if (dataEvents.readyState === EventSource.CLOSED) {
+            pollDataVersion(function() { applyDataDelta(); });
+        }
+    };
+}
+
+let versionPoll = null;
+
+function pollDataVersion(onNewVersion) {
+    if (versionPoll) return;
+    versionPoll = setInterval(async function() {
+        try {
+            const response = await fetch('/api/version');
+            // 靜態網站沒有 /api/version，不再查詢
+            if (response.status === 404) {
+                clearInterval(versionPoll);
+                return;
+            }
+            if (!response.ok) return;
+            const { version } = await response.json();
+            if (analysisData && analysisData.data_version !== undefined && version > analysisData.data_version) {
+                onNewVersion();
+            }
+        } catch (error) {
+            console.error('查詢資料版本錯誤:', error);
+        }
+    }, 60000);
+}
+
+async function applyDataDelta() {
+    if (updatingData) return;
+    updatingData = true;
+    try {
+        const since = analysisData.data_version;
+        const response = await fetch(`/api/data?since=${since}`);
+        if (!response.ok) {
+            throw new Error(`無法載入更新資料: ${response.status}`);
+        }
+        const delta = await response.json();
+        if (delta.full) {
+            analysisData = delta.data;
+        } else {
+            // 表格名稱為 time.yearly 這類「第一層.第二層」或單一第一層名稱
+            Object.entries(delta.changed).forEach(([name, value]) => {
+                const [key, sub] = name.split('.');
+                if (sub) {
+                    analysisData[key] = analysisData[key] || {};
+                    analysisData[key][sub] = value;
+                } else {
+                    analysisData[key] = value;
+                }
+            });
+            analysisData.last_updated = delta.last_updated;
+            analysisData.data_version = delta.data_version;
+        }
+        console.log(`資料已更新: v${since} -> v${delta.data_version}，` +
+                    `${delta.full ? '完整重新載入' : Object.keys(delta.changed).length + ' 張表有變更'}`);
+        
+        destroyCharts();
+        renderSummary();
+        renderCharts();
+    } catch (error) {
+        console.error('更新資料錯誤:', error);
+    } finally {
+        updatingData = false;
+    }
+    // 更新期間又發布了新版本時再取一次
+    if (dataEvents && dataEvents.lastEventId && Number(dataEvents.lastEventId) > analysisData.data_version) {
+        applyDataDelta();
+    }
+}
+
+// 重新渲染前移除既有圖表（Chart.js 不允許同一個 canvas 建立兩個圖表）
+function destroyCharts() {
+    document.querySelectorAll('canvas').forEach(canvas => {
+        const chart = Chart.getChart(canvas);
+        if (chart) chart.destroy();
+    });
+}
+
 // 渲染摘要統計
 function renderSummary() {
     try {
@@ -562,12 +658,15 @@ function renderCountyTable() {
     
     tbody.innerHTML = sortedData.map((item, index) => {
         const percentage = ((item.病例數 / totalCases) * 100).toFixed(2);
+        // 每十萬人發生率（有人口資料時才會提供）
+        const rate = item.每十萬人發生率 != null ? item.每十萬人發生率.toFixed(2) : '—';
         return `
             <tr>
                 <td>${index + 1}</td>
                 <td>${item.居住縣市}</td>
                 <td class="number-cell">${formatNumber(item.病例數)}</td>
                 <td class="number-cell">${percentage}%</td>
+                <td class="number-cell">${rate}</td>
             </tr>
         `;
     }).join('');
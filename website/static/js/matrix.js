@@ -0,0 +1,34 @@
+// 二進位計數矩陣（/api/matrix/<kind>）的讀取工具
+// 格式：4 位元組 little-endian 標頭長度 + JSON 標頭 + Int32/Float32 數值（起點對齊 8 位元組，格式見 typed_array.py）
+
+const MATRIX_ARRAY_TYPES = {
+    int32: Int32Array,
+    float32: Float32Array
+};
+
+// 解析回應位元組，回傳 { header, data, row(i) }；data 直接包裝回應的 ArrayBuffer，不複製
+function decodeMatrix(buffer) {
+    const view = new DataView(buffer);
+    const headerLength = view.getUint32(0, true);
+    const header = JSON.parse(new TextDecoder('utf-8').decode(new Uint8Array(buffer, 4, headerLength)));
+    const [rows, cols] = header.shape;
+    const ArrayType = MATRIX_ARRAY_TYPES[header.dtype];
+    if (!ArrayType) {
+        throw new Error(`不支援的矩陣型別: ${header.dtype}`);
+    }
+    const data = new ArrayType(buffer, 4 + headerLength, rows * cols);
+    return {
+        header,
+        data,
+        row: i => data.subarray(i * cols, (i + 1) * cols)
+    };
+}
+
+// 例：const { header, row } = await fetchMatrix('/api/matrix/township?county=高雄市&freq=week');
+async function fetchMatrix(url) {
+    const response = await fetch(url);
+    if (!response.ok) {
+        throw new Error(`無法載入矩陣資料: ${response.status}`);
+    }
+    return decodeMatrix(await response.arrayBuffer());
+}
@@ -0,0 +1,34 @@
+"""
+稠密計數矩陣的二進位傳輸格式（前端直接包成 TypedArray，不需解析 JSON 陣列）
+  [0:4]      uint32 little-endian，JSON 標頭長度 n（含補齊用的空白）
+  [4:4+n]    UTF-8 JSON 標頭：dtype、shape 與列 / 欄標籤
+  [4+n:]     列優先（C order）的 little-endian Int32 或 Float32 數值
+資料起點對齊 8 位元組，前端可直接 new Int32Array(buffer, 4 + n, rows * cols)
+"""
+
+import json
+import struct
+
+import numpy as np
+
+DTYPES = {'int32': '<i4', 'float32': '<f4'}
+ALIGNMENT = 8
+
+
+def encode_matrix(matrix, header, dtype='int32'):
+    """把二維矩陣與標頭 dict 編碼為上述格式的位元組"""
+    if dtype not in DTYPES:
+        raise ValueError(f"dtype 必須為 {', '.join(DTYPES)} 之一")
+    data = np.ascontiguousarray(matrix, dtype=DTYPES[dtype])
+    text = json.dumps(dict(header, dtype=dtype, shape=list(data.shape)), ensure_ascii=False).encode('utf-8')
+    padding = -(4 + len(text)) % ALIGNMENT
+    text += b' ' * padding
+    return b''.join([struct.pack('<I', len(text)), text, data.tobytes()])
+
+
+def decode_matrix(payload):
+    """encode_matrix 的反向（供 Python 用戶端使用），回傳 (標頭 dict, 矩陣)"""
+    (length,) = struct.unpack_from('<I', payload, 0)
+    header = json.loads(payload[4:4 + length].decode('utf-8'))
+    matrix = np.frombuffer(payload, dtype=DTYPES[header['dtype']], offset=4 + length)
+    return header, matrix.reshape(header['shape'])